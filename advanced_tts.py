@@ -10,21 +10,77 @@ import requests
 import json
 import base64
 import tempfile
-from typing import Optional, Dict, Any
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Tuple, Iterator
 import logging
 from pathlib import Path
 
+from tts_cache import TTSCache
+from tts_health import ProviderHealth
+from tts_pipeline import split_text_for_tts
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# زنجیره پیش‌فرض ارائه‌دهندگان برای پاسخ‌های چت (مدل Gemini آوال‌ای با لهجه ایرانی، سپس Azure و Google)
+REPLY_TTS_CHAIN = [
+    {'provider': 'avalai', 'voice': 'nova', 'model': 'gemini-2.5-pro-preview-tts'},
+    {'provider': 'avalai', 'voice': 'shimmer', 'model': 'gemini-2.5-pro-preview-tts'},
+    {'provider': 'azure', 'voice': 'fa-IR-SaraNeural'},
+    {'provider': 'azure', 'voice': 'fa-IR-YektaNeural'},
+    {'provider': 'google', 'voice': 'fa-IR-Wavenet-B'},
+]
+
+
+def voice_first_chain(voice: str = None, chain: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """زنجیره پاسخ با صدای انتخابی مدیر (صدای AvalAI) در ابتدای آن؛ بقیه ترتیب حفظ می‌شود"""
+    chain = chain or REPLY_TTS_CHAIN
+    if not voice:
+        return chain
+    preferred = [c for c in chain if c['provider'] == 'avalai' and c.get('voice') == voice]
+    if not preferred:
+        model = next((c.get('model') for c in chain if c['provider'] == 'avalai'), None)
+        preferred = [{'provider': 'avalai', 'voice': voice, **({'model': model} if model else {})}]
+    return preferred + [c for c in chain if c not in preferred]
+
+# صدای پیش‌فرض هر ارائه‌دهنده
+DEFAULT_VOICES = {
+    'avalai': 'alloy',
+    'azure': 'fa-IR-DariushNeural',
+    'elevenlabs': '21m00Tcm4TlvDq8ikWAM',
+    'google': 'fa-IR-Standard-A',
+    'openai': 'alloy',
+    'coqui': 'persian_female',
+}
+
 class AdvancedTTS:
     """کلاس پیشرفته تبدیل متن به صدا با استفاده از مدل‌های LLM"""
     
     def __init__(self):
         self.api_keys = self._load_api_keys()
-        self.cache_dir = Path("./tts_cache")
+        # آدرس‌های پایه قابل تغییر از طریق env (مثلاً برای سرورهای stub در اجرای replay)
+        self.base_urls = {
+            'avalai': os.getenv('AVALAI_BASE_URL', 'https://api.avalai.ir/v1'),
+            'openai': os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+        }
+        self.cache_dir = Path(os.getenv('TTS_CACHE_DIR', './tts_cache'))
         self.cache_dir.mkdir(exist_ok=True)
+        self.cache = TTSCache(self.cache_dir, int(os.getenv('TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024)))
+        # مهلت هر فراخوانی ارائه‌دهنده و قطع‌کننده مدار برای حذف سریع ارائه‌دهندگان از کار افتاده
+        self.timeout = float(os.getenv('TTS_TIMEOUT', 20))
+        self.health = ProviderHealth()
+        # اجرای همزمان دو گزینه برتر زنجیره (هزینه بیشتر، تأخیر کمتر)
+        self.race_top = os.getenv('TTS_RACE_TOP2', '0') == '1'
+        self._race_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='tts-race')
+        # تقسیم متن‌های بلند و سقف همزمانی درخواست‌ها به هر ارائه‌دهنده
+        self.chunk_chars = int(os.getenv('TTS_CHUNK_CHARS', 400))
+        self.provider_concurrency = int(os.getenv('TTS_PROVIDER_CONCURRENCY', 3))
+        self._provider_slots = {}
+        self._slots_lock = threading.Lock()
+        self._chunk_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='tts-chunk')
         
     def _load_api_keys(self) -> Dict[str, str]:
         """بارگذاری کلیدهای API از متغیرهای محیطی"""
@@ -47,7 +103,7 @@ class AdvancedTTS:
             return None
             
         try:
-            url = "https://api.openai.com/v1/audio/speech"
+            url = f"{self.base_urls['openai']}/audio/speech"
             headers = {
                 "Authorization": f"Bearer {self.api_keys['openai']}",
                 "Content-Type": "application/json"
@@ -61,7 +117,7 @@ class AdvancedTTS:
                 "speed": 1.0
             }
             
-            response = requests.post(url, headers=headers, json=data)
+            response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
             response.raise_for_status()
             
             logger.info(f"OpenAI TTS successful for voice: {voice}")
@@ -99,7 +155,7 @@ class AdvancedTTS:
                 }
             }
             
-            response = requests.post(url, headers=headers, json=data)
+            response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
             response.raise_for_status()
             
             logger.info(f"ElevenLabs TTS successful for voice: {voice_id}")
@@ -138,7 +194,7 @@ class AdvancedTTS:
             </speak>
             """
             
-            response = requests.post(url, headers=headers, data=ssml.encode('utf-8'))
+            response = requests.post(url, headers=headers, data=ssml.encode('utf-8'), timeout=self.timeout)
             response.raise_for_status()
             
             logger.info(f"Azure TTS successful for voice: {voice}")
@@ -175,7 +231,7 @@ class AdvancedTTS:
                 }
             }
             
-            response = requests.post(url, json=data)
+            response = requests.post(url, json=data, timeout=self.timeout)
             response.raise_for_status()
             
             # Decode base64 audio content
@@ -207,7 +263,7 @@ class AdvancedTTS:
                 "model_id": "tts_models/multilingual/multi-dataset/xtts_v2"
             }
             
-            response = requests.post(url, headers=headers, json=data)
+            response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
             response.raise_for_status()
             
             logger.info(f"Coqui TTS successful for voice: {voice}")
@@ -227,7 +283,7 @@ class AdvancedTTS:
             return None
             
         try:
-            url = "https://api.avalai.ir/v1/audio/speech"
+            url = f"{self.base_urls['avalai']}/audio/speech"
             headers = {
                 "Authorization": f"Bearer {self.api_keys['avalai']}",
                 "Content-Type": "application/json"
@@ -242,7 +298,7 @@ class AdvancedTTS:
             # اضافه کردن دستورالعمل برای مدل‌های Gemini TTS
             if model.startswith("gemini"):
                 data["instructions"] = instructions or "با لهجه فارسی ایرانی و تلفظ صحیح کلمات پزشکی صحبت کنید."
-            response = requests.post(url, headers=headers, json=data)
+            response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
             response.raise_for_status()
             logger.info(f"AvalAI TTS successful for voice: {voice}, model: {model}")
             return response.content
@@ -275,37 +331,173 @@ class AdvancedTTS:
         if self.api_keys['coqui']:
             providers.append(('coqui', 6))  # متن‌باز
         
-        # انتخاب بهترین ارائه‌دهنده
+        # انتخاب بهترین ارائه‌دهنده: اولویت ثابت فقط ترتیب اولیه است و امتیاز سلامت تعیین‌کننده است
         if providers:
             providers.sort(key=lambda x: x[1], reverse=True)
-            return providers[0][0]
+            best = self.health.best([name for name, _ in providers])
+            if best:
+                return best
         
         return 'browser'  # استفاده از Web Speech API مرورگر
     
+    def _call_provider(self, text: str, provider: str, voice: str, model: Optional[str],
+                       instructions: Optional[str]) -> Optional[bytes]:
+        """فراخوانی ارائه‌دهنده بدون کش و ثبت نتیجه در امتیاز سلامت آن"""
+        if not self.api_keys.get(provider):
+            return self._dispatch(text, provider, voice, model, instructions)
+        with self._provider_slot(provider):
+            start = time.monotonic()
+            audio_data = self._dispatch(text, provider, voice, model, instructions)
+            self.health.record(provider, bool(audio_data), time.monotonic() - start)
+        return audio_data
+
+    def _provider_slot(self, provider: str) -> threading.BoundedSemaphore:
+        """سمافور محدودکننده تعداد درخواست‌های همزمان به یک ارائه‌دهنده"""
+        with self._slots_lock:
+            if provider not in self._provider_slots:
+                self._provider_slots[provider] = threading.BoundedSemaphore(self.provider_concurrency)
+            return self._provider_slots[provider]
+
+    def _dispatch(self, text: str, provider: str, voice: str, model: Optional[str],
+                  instructions: Optional[str]) -> Optional[bytes]:
+        if provider == 'avalai':
+            return self.text_to_speech_avalai(text, voice, model or "tts-1", instructions)
+        elif provider == 'azure':
+            return self.text_to_speech_azure(text, voice)
+        elif provider == 'elevenlabs':
+            return self.text_to_speech_elevenlabs(text, voice)
+        elif provider == 'google':
+            return self.text_to_speech_google(text, voice)
+        elif provider == 'openai':
+            return self.text_to_speech_openai(text, voice)
+        elif provider == 'coqui':
+            return self.text_to_speech_coqui(text, voice)
+        logger.warning("No TTS provider available, using browser fallback")
+        return None
+
+    def audio_key(self, text: str, provider: str, voice: str = None, model: str = None,
+                  speed: float = 1.0, instructions: str = None) -> str:
+        """کلید کش برای یک درخواست تبدیل متن به صدا"""
+        if provider == 'avalai':
+            model = model or "tts-1"
+        return TTSCache.make_key(text, provider, model, voice or DEFAULT_VOICES.get(provider), speed, instructions)
+
+    def synthesize(self, text: str, provider: str, voice: str = None, model: str = None,
+                   speed: float = 1.0, instructions: str = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        تبدیل متن به صدا با بررسی کش پیش از هر فراخوانی ارائه‌دهنده.
+        خروجی: (داده صوتی، کلید کش)
+        """
+        voice = voice or DEFAULT_VOICES.get(provider)
+        key = self.audio_key(text, provider, voice, model, speed, instructions)
+        audio_data = self.cache.get(key)
+        if audio_data is not None:
+            return audio_data, key
+        audio_data = self._call_provider(text, provider, voice, model, instructions)
+        if not audio_data:
+            return None, None
+        try:
+            self.cache.put(key, audio_data)
+        except Exception as e:
+            logger.error(f"TTS cache write error: {e}")
+        return audio_data, key
+
+    def synthesize_chain(self, text: str, chain: List[Dict[str, Any]] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        اجرای زنجیره fallback؛ ابتدا کش همه گزینه‌ها بررسی می‌شود تا پاسخ‌های تکراری
+        هیچ فراخوانی ارائه‌دهنده‌ای نداشته باشند.
+        """
+        chain = chain or REPLY_TTS_CHAIN
+        for candidate in chain:
+            key = self.audio_key(text, **candidate)
+            if self.cache.path(key) is not None:
+                audio_data = self.cache.get(key)
+                if audio_data is not None:
+                    return audio_data, key
+        # ترتیب پویا بر اساس سلامت؛ ارائه‌دهندگان بدون کلید یا با مدار باز کنار گذاشته می‌شوند
+        ordered = self.health.order([c for c in chain if self.api_keys.get(c['provider'])])
+        if self.race_top and len(ordered) > 1:
+            audio_data, key = self._race(text, ordered[:2])
+            if audio_data:
+                return audio_data, key
+            ordered = ordered[2:]
+        for candidate in ordered:
+            audio_data, key = self.synthesize(text, **candidate)
+            if audio_data:
+                return audio_data, key
+        return None, None
+
+    def synthesize_stream(self, text: str, chain: List[Dict[str, Any]] = None) -> Iterator[bytes]:
+        """
+        تقسیم متن بلند در مرز جملات/عبارت‌ها، تبدیل همزمان بخش‌ها و تحویل صدای هر بخش
+        به ترتیب و به محض آماده شدن. همه ارائه‌دهندگان زنجیره MP3 تولید می‌کنند، پس
+        فریم‌های بخش‌ها را می‌توان پشت سر هم فرستاد.
+        """
+        futures = [self._chunk_executor.submit(self.synthesize_chain, chunk, chain)
+                   for chunk in split_text_for_tts(text, self.chunk_chars)]
+        try:
+            for index, future in enumerate(futures):
+                audio_data, _ = future.result()
+                if audio_data:
+                    yield audio_data
+                else:
+                    logger.warning(f"TTS chunk {index} failed, skipping")
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def synthesize_long(self, text: str, chain: List[Dict[str, Any]] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """تبدیل متن با هر طولی؛ متن‌های بلندتر از chunk_chars به صورت بخش‌بندی‌شده و موازی"""
+        if len(text) <= self.chunk_chars:
+            return self.synthesize_chain(text, chain)
+        key = TTSCache.make_key(text, 'chunked', None, json.dumps(chain or REPLY_TTS_CHAIN, sort_keys=True))
+        audio_data = self.cache.get(key)
+        if audio_data is not None:
+            return audio_data, key
+        audio_data = b''.join(self.synthesize_stream(text, chain))
+        if not audio_data:
+            return None, None
+        try:
+            self.cache.put(key, audio_data)
+        except Exception as e:
+            logger.error(f"TTS cache write error: {e}")
+        return audio_data, key
+
+    def _race(self, text: str, candidates: List[Dict[str, Any]]) -> Tuple[Optional[bytes], Optional[str]]:
+        """اجرای همزمان چند گزینه و بازگرداندن اولین پاسخ موفق (پاسخ دیرتر فقط در کش ذخیره می‌شود)"""
+        futures = [self._race_executor.submit(self.synthesize, text, **c) for c in candidates]
+        for future in as_completed(futures):
+            try:
+                audio_data, key = future.result()
+            except Exception as e:
+                logger.error(f"TTS race error: {e}")
+                continue
+            if audio_data:
+                for other in futures:
+                    other.cancel()
+                return audio_data, key
+        return None, None
+
     def synthesize_speech(self, text: str, provider: str = None, voice: str = None) -> Optional[bytes]:
         """
         تبدیل متن به صدا با بهترین ارائه‌دهنده
         """
+        return self.synthesize_speech_keyed(text, provider, voice)[0]
+
+    def synthesize_speech_keyed(self, text: str, provider: str = None,
+                                voice: str = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """مانند synthesize_speech، همراه با کلید کش (برای ETag و آدرس فایل کش)"""
         if provider == 'auto' or not provider:
             provider = self.get_best_tts_provider(text)
         
         logger.info(f"Using TTS provider: {provider}")
         
-        if provider == 'avalai':
-            return self.text_to_speech_avalai(text, voice or "alloy", "tts-1")
-        elif provider == 'azure':
-            return self.text_to_speech_azure(text, voice or "fa-IR-DariushNeural")
-        elif provider == 'elevenlabs':
-            return self.text_to_speech_elevenlabs(text, voice or "21m00Tcm4TlvDq8ikWAM")
-        elif provider == 'google':
-            return self.text_to_speech_google(text, voice or "fa-IR-Standard-A")
-        elif provider == 'openai':
-            return self.text_to_speech_openai(text, voice or "alloy")
-        elif provider == 'coqui':
-            return self.text_to_speech_coqui(text, voice or "persian_female")
-        else:
+        if provider not in DEFAULT_VOICES:
             logger.warning("No TTS provider available, using browser fallback")
-            return None
+            return None, None
+        if len(text) > self.chunk_chars:
+            return self.synthesize_long(text, [{'provider': provider, 'voice': voice or None}])
+        return self.synthesize(text, provider, voice)
     
     def save_audio_file(self, audio_data: bytes, filename: str) -> str:
         """ذخیره فایل صوتی"""
@@ -1,20 +1,20 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file, send_from_directory, Blueprint
+import re
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file, send_from_directory, Blueprint, Response, stream_with_context
 # from langchain.vectorstores import Chroma # No longer needed for direct querying
 from langchain.embeddings import SentenceTransformerEmbeddings
 # Removed RetrievalQA
 from dotenv import load_dotenv
-import pandas as pd # Import pandas
 import markdown # Import the markdown library
 import base64
-import tempfile
 from pathlib import Path
 from datetime import datetime
 import io
-import speech_recognition as sr  # For STT (pip install SpeechRecognition)
-from werkzeug.utils import secure_filename
-import json
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+import time
+import uuid
+import hashlib
 
 # Import the specific LLM class and prompt template
 from langchain_openai import OpenAI
@@ -25,11 +25,31 @@ from langchain_core.documents import Document # Import Document class
 import chromadb
 
 # Import advanced TTS module
-from advanced_tts import AdvancedTTS
-from doctorbot_models import db, DoctorBotSettings, MedicalDocument
+from advanced_tts import AdvancedTTS, voice_first_chain
+from settings_store import JSONStore
+from event_log import EventLog, format_line
+from doctorbot_models import db, DoctorBotSettings, MedicalDocument, init_storage
 from doctorbot_routes import doctorbot_bp
 from doctors_data import doctors_info
+from doctor_directory import (doctor_directory, chat_doctor_index, filter_chat_doctors,
+                              CITIES, SPECIALTIES, EXPERIENCE_RANGES)
+from doctor_index import doctor_index
 from llm_utils import get_llm
+from conversation_memory import conversation_memory
+from chat_store import create_chat_store, SQLiteChatStore
+from backup import BackupManager, BackupError
+from models import ChatbotSettings
+from rate_limit import rate_limited, rate_limiter
+from stage_timing import stage, rounded_timings
+import stage_timing
+from tts_pipeline import SentencePipeline
+from tts_cache import AUDIO_MIMETYPES, sniff_extension
+from audio_response import send_audio, send_cached_audio
+from audio_codec import AudioTranscoder
+from tts_warmup import TTSWarmup, VOICE_ACK_PHRASE, doctor_greeting
+from stt_backends import stt_service, STTQueueFull
+from voice_turn import VoiceTurn, sse_event, stt_busy_response
+from tts_jobs import tts_jobs
 
 # --- Configuration ---
 # Load environment variables from .env file
@@ -52,28 +72,38 @@ doctor_folders = [d for d in os.listdir(MED_DOC_DIR) if os.path.isdir(os.path.jo
 DOCTORS = [(d, d.replace('_', ' ').title()) for d in doctor_folders] # (value, display_name)
 
 # Lists for filter options (English key, Persian display)
-CITIES = [('all', 'همه'), ('tehran', 'تهران'), ('shiraz', 'شیراز'), ('hamedan', 'همدان'), ('mashhad', 'مشهد'), ('isfahan', 'اصفهان'), ('tabriz', 'تبریز'), ('kermanshah', 'کرمانشاه')]
-SPECIALTIES = [('all', 'همه'), ('general', 'پزشک عمومی'), ('cardiologist', 'قلب و عروق'), ('neurologist', 'مغز و اعصاب'), ('pediatrician', 'اطفال'), ('oncologist', 'آنکولوژی')]
-EXPERIENCE_RANGES = [('all', 'همه'), ('1-5', '1 تا 5 سال'), ('5-10', '5 تا 10 سال'), ('10+', 'بیشتر از 10 سال')]
+DOCTORS_PER_PAGE = int(os.getenv('DOCTORS_PER_PAGE', 20))
 
 SETTINGS_PATH = os.path.join(BASE_DIR, 'chatbot_settings.json')
 RESOURCES_PATH = os.path.join(BASE_DIR, 'chatbot_resources.json')
 USERS_PATH = os.path.join(BASE_DIR, 'chatbot_users.json')
 LOGS_PATH = os.path.join(BASE_DIR, 'chatbot_logs.txt')
 
-def load_json(path, default):
-    if os.path.exists(path):
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return default
+# Loaded once and kept in memory; writes are atomic and notify subscribers (rate limiter, TTS voice, warm-up)
+settings_store = JSONStore(SETTINGS_PATH, {})
+resources_store = JSONStore(RESOURCES_PATH, [])
+users_store = JSONStore(USERS_PATH, [])
 
-def save_json(path, data):
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+DEFAULT_ADMIN_SETTINGS = {
+    'bot_name': 'چت‌بات پزشکی',
+    'bot_description': '',
+    'default_language': 'fa',
+    'bot_active': True,
+    'llm_model': 'avalai',
+    'embedding_model': 'paraphrase-multilingual-MiniLM-L12-v2',
+    'top_k': 3,
+    'temperature': 0.7
+}
 
-def append_log(msg):
-    with open(LOGS_PATH, 'a', encoding='utf-8') as f:
-        f.write(f'{datetime.now().isoformat()} | {msg}\n')
+# JSON-lines admin event log, written by a background thread and rotated by size/age
+event_log = EventLog(LOGS_PATH)
+
+def append_log(msg, event='admin', **fields):
+    event_log.log(msg, event, **fields)
+
+def recent_log_lines(count=30):
+    """Last admin log lines for the settings page, without reading the log file."""
+    return [format_line(record) for record in event_log.tail(count)]
 
 # --- Flask App Setup ---
 app = Flask(__name__)
@@ -83,7 +113,17 @@ app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///doctorbot.sqlite3'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db.init_app(app)
+try:
+    init_storage(app)  # WAL pragmas are set per connection; indexes and chunk table via migrations
+except Exception as e:
+    print(f"Error migrating doctorbot database: {e}")
 app.register_blueprint(doctorbot_bp)
+stage_timing.init_app(app)
+
+# --- Rate limiting (ChatbotSettings.rate_limit requests per minute per client) ---
+DEFAULT_RATE_LIMIT = ChatbotSettings.__table__.c.rate_limit.default.arg
+settings_store.subscribe(lambda settings: rate_limiter.set_rate(settings.get('rate_limit') or DEFAULT_RATE_LIMIT))
+settings_store.subscribe(lambda settings: rate_limiter.set_api_key(settings.get('api_key')))
 
 # --- LLM Dynamic Setup ---
 # تابع get_llm حذف شد و از llm_utils import می‌شود
@@ -134,6 +174,17 @@ except Exception as e:
         
         embedding_model = SimpleEmbedding()
 
+def semantic_embeddings_available():
+    """False when only the random SimpleEmbedding fallback is loaded"""
+    return embedding_model is not None and getattr(embedding_model, 'model_name', None) != "simple_text_matcher"
+
+# Build (or mmap) the doctor profile vector index in the background
+if semantic_embeddings_available():
+    try:
+        doctor_index.ensure(embedding_model)
+    except Exception as e:
+        print(f"Error preparing doctor index: {e}")
+
 # Initialize the LLM with avalai.ir settings
 llm = None # Initialize LLM as None by default
 if not AVALAI_API_KEY:
@@ -163,6 +214,24 @@ try:
 except Exception as e:
     print(f"Error initializing ChromaDB client: {e}")
 
+def swap_chroma_dir(restored_dir):
+    """
+    Move a restored ChromaDB directory into CHROMA_DB_DIR and reopen the client without a restart.
+    The previous database is kept as chroma_db.replaced-<time>; older replaced copies are removed.
+    """
+    global chroma_client
+    if chroma_client is not None and hasattr(chroma_client, 'clear_system_cache'):
+        chroma_client.clear_system_cache()  # drop the cached system holding the old files open
+    if os.path.exists(CHROMA_DB_DIR):
+        replaced = f"{CHROMA_DB_DIR}.replaced-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        os.replace(CHROMA_DB_DIR, replaced)
+        for name in os.listdir(BASE_DIR):
+            path = os.path.join(BASE_DIR, name)
+            if name.startswith('chroma_db.replaced-') and path != replaced:
+                shutil.rmtree(path, ignore_errors=True)
+    os.replace(restored_dir, CHROMA_DB_DIR)
+    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+
 # Initialize Advanced TTS
 advanced_tts = None
 try:
@@ -172,19 +241,230 @@ except Exception as e:
     print(f"Error initializing Advanced TTS: {e}")
     advanced_tts = None
 
+# Compact re-encoding (Opus / low-bitrate MP3) of served audio, cached next to the TTS output
+audio_transcoder = AudioTranscoder(cache=advanced_tts.cache if advanced_tts else None)
+
 # Define a simple prompt template for the LLM
 # This template includes context from retrieved documents
 prompt_template = PromptTemplate(
-    input_variables=["context", "question"],
+    input_variables=["context", "summary", "history", "question"],
     template=(
         "You are a helpful medical assistant. Use the following pieces of context to answer the question.\\n\\n"
         "If you don\'t know the answer, just say that you don\'t know, don\'t try to make up an answer.\\n\\n"
         "Context: {context}\\n\\n"
+        "Conversation summary: {summary}\\n\\n"
+        "Recent conversation:\\n{history}\\n\\n"
         "Question: {question}\\n\\n"
         "Answer:"
     )
 )
 
+# --- Server-side chat history ---
+# Messages live in the chat store (CHAT_STORE, SQLite by default); the session cookie only carries 'sid'.
+chat_store = create_chat_store()
+
+TTS_AUDIO_KEY = re.compile(r'/tts_audio/([0-9a-f]{64})')
+
+def release_audio(audio_urls):
+    """Drop the history references of cleared or purged messages so their audio returns to the LRU budget."""
+    if not advanced_tts:
+        return
+    for url in audio_urls:
+        match = TTS_AUDIO_KEY.search(url)
+        if match:
+            advanced_tts.cache.unpin(match.group(1))
+
+chat_store.subscribe_removed(release_audio)
+chat_store.purge_expired()  # CHAT_RETENTION_DAYS; repeated before every backup
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', 50))
+
+# --- Backups ---
+# Incremental, content-addressed backups of the admin JSON files, the event log, ChromaDB and the chat history
+BACKUP_DIR = os.path.join(BASE_DIR, 'chatbot_backup')
+CONFIG_STORES = {'settings': settings_store, 'resources': resources_store, 'users': users_store}
+backup_sources = {name: store.path for name, store in CONFIG_STORES.items()}
+backup_sources.update(logs=LOGS_PATH, chroma_db=CHROMA_DB_DIR)
+if isinstance(chat_store, SQLiteChatStore):
+    backup_sources['chat_history'] = chat_store.path
+with app.app_context():
+    if db.engine.url.get_backend_name() == 'sqlite' and db.engine.url.database:
+        backup_sources['doctorbot'] = db.engine.url.database  # WAL mode: captured with the SQLite backup API
+backup_manager = BackupManager(BACKUP_DIR, backup_sources, maintenance=[chat_store.purge_expired])
+
+def session_id():
+    """Stable per-session id used to address server-side state."""
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return session['sid']
+
+def conversation_window(sid):
+    """Unsummarized text turns of a conversation and its rolling-summary state."""
+    state = chat_store.memory(sid)
+    return chat_store.text_turns(sid, state['upto']), state
+
+def build_rag_prompt(question, sid, selected_doctor):
+    """Retrieve context for a (memory-rewritten) query and format the prompt with bounded conversation memory.
+
+    Call before the question itself is appended to the conversation.
+    """
+    prior_turns, memory_state = conversation_window(sid)
+    # Retrieval uses a standalone query so follow-ups ("and the dosage?") find the right documents
+    retrieval_query = conversation_memory.rewrite_query(question, prior_turns)
+    with stage('retrieval'):
+        collection = chroma_client.get_collection(name="langchain")
+        results = collection.query(
+            query_texts=[retrieval_query],
+            n_results=3, # Number of results to retrieve
+            where={'doctor': selected_doctor}, # Apply metadata filter
+        )
+
+    # Process results and format retrieved documents for the LLM context
+    retrieved_docs = []
+    if results and results.get('documents') and results['documents'][0]:
+        for i in range(len(results['documents'][0])):
+            page_content = results['documents'][0][i]
+            metadata = results['metadatas'][0][i] if results.get('metadatas') and results['metadatas'][0] else {}
+            retrieved_docs.append(Document(page_content=page_content, metadata=metadata))
+
+    context_text = "\n\n---\n\n".join([doc.page_content for doc in retrieved_docs])
+    summary, history = conversation_memory.prompt_inputs(prior_turns, memory_state, memory_state['upto'])
+    return prompt_template.format(context=context_text, summary=summary, history=history, question=question)
+
+def update_conversation_memory(sid):
+    """Fold turns that left the verbatim window into the rolling summary kept in the chat store."""
+    with stage('memory'):
+        turns, state = conversation_window(sid)
+        new_state = conversation_memory.update(turns, state, llm, state['upto'])
+        if new_state != state:
+            chat_store.set_memory(sid, new_state, state['upto'])
+
+def save_message(sid, message):
+    """Append a chat message, pinning cached audio it links to so the history link never outlives its file."""
+    match = TTS_AUDIO_KEY.search(message.get('audio_url') or '')
+    if match and advanced_tts:
+        advanced_tts.cache.pin(match.group(1))
+    return chat_store.append(sid, message)
+
+def append_turn(sid, *messages):
+    """Append messages to the conversation and fold the memory if a text turn left the window."""
+    for message in messages:
+        save_message(sid, message)
+    if any(message.get('text') for message in messages):
+        update_conversation_memory(sid)
+
+# Reply voice chain with the admin-selected voice first; rebuilt on settings change, never read from disk per request
+reply_tts_chain = voice_first_chain()
+
+def apply_tts_settings(settings):
+    global reply_tts_chain
+    reply_tts_chain = voice_first_chain(settings.get('tts_voice'))
+
+settings_store.subscribe(apply_tts_settings)
+
+def synthesize_reply_audio(text):
+    """Run the reply TTS chain (AvalAI Gemini nova/shimmer, Azure, Google) through the TTS cache,
+    ordered by provider health so dead providers are skipped by their circuit breakers.
+
+    Long replies are split at sentence boundaries and the chunks are synthesized in parallel.
+    Returns (audio_data, cache_key); the key addresses the cached file served by /tts_audio/<key>.
+    """
+    with stage('tts'):
+        audio_data, audio_key = advanced_tts.synthesize_long(text, reply_tts_chain)
+    if audio_data:
+        with stage('transcode'):
+            audio_data, audio_key = audio_transcoder.compact(audio_data, audio_key)
+    return audio_data, audio_key
+
+def stream_audio_response(text, chain=None):
+    """Stream MP3 audio chunk by chunk as soon as each in-order chunk is synthesized."""
+    return Response(stream_with_context(advanced_tts.synthesize_stream(text, chain or reply_tts_chain)),
+                    mimetype='audio/mpeg', headers={'Cache-Control': 'no-cache'})
+
+# --- TTS warm-up ---
+# Canned phrases (voice-message acknowledgement, doctor greetings) are
+# pre-rendered into the TTS cache so the first audio of a session needs no provider call.
+tts_warmup = TTSWarmup(synthesize_reply_audio, advanced_tts.cache if advanced_tts else None)
+
+def schedule_tts_warmup(settings):
+    """Re-render canned phrases in the background (at startup and after settings change)."""
+    if advanced_tts:
+        tts_warmup.schedule(settings, doctors_info)
+
+def canned_audio_url(text):
+    """URL of the pre-rendered audio for a canned phrase, or None if it is not cached yet."""
+    key = tts_warmup.audio_key(text)
+    return url_for('tts_audio', key=key) if key else None
+
+settings_store.subscribe(schedule_tts_warmup)
+
+# --- Answer pipeline ---
+def generate_answer(question, sid):
+    """RAG answer for a question (echo fallback when the LLM or the vector store is unavailable)."""
+    try:
+        if llm and chroma_client:
+            selected_doctor = session.get('selected_doctor', 'doctor_abbasi')
+            prompt = build_rag_prompt(question, sid, selected_doctor)
+            with stage('llm'):
+                return llm.invoke(prompt)
+        return f"پاسخ هوشمند به: {question}"
+    except Exception as e:
+        return f"خطا در پردازش: {str(e)}"
+
+def stream_answer(prompt, timings, start):
+    """Yield SSE events for a streamed LLM answer with sentence-pipelined TTS; returns the full answer text.
+
+    Closing the generator (client disconnect) stops the LLM stream and cancels sentences not yet synthesized.
+    """
+    parts = []
+    pipeline = SentencePipeline((lambda sentence: synthesize_reply_audio(sentence)[0]) if advanced_tts else (lambda sentence: None))
+    try:
+        # Each sentence is synthesized as soon as the LLM finishes it; audio arrives in order
+        for event in pipeline.run(llm.stream(prompt)):
+            if event[0] == 'text':
+                timings.setdefault('first_token', (time.perf_counter() - start) * 1000)
+                parts.append(event[1])
+                yield sse_event('text', {'delta': event[1]})
+                continue
+            _, index, sentence, audio_data = event
+            if audio_data:
+                timings.setdefault('first_audio', (time.perf_counter() - start) * 1000)
+            yield sse_event('audio', {
+                'index': index,
+                'text': sentence,
+                'audio': base64.b64encode(audio_data).decode('ascii') if audio_data else None,
+                'mimetype': AUDIO_MIMETYPES[sniff_extension(audio_data)] if audio_data else None
+            })
+    except Exception as e:
+        print(f"Streaming chat error: {e}")
+        parts.append(f"خطا در پردازش: {str(e)}")
+    return ''.join(parts)
+
+def submit_reply_tts(text):
+    """Synthesize a reply in the background; its voice message joins the conversation once ready."""
+    sid = session_id()
+    # Routes are built from the request's adapter because the job finishes outside the request context
+    url_adapter = app.create_url_adapter(request)
+
+    def on_done(job):
+        save_message(sid, {
+            'type': 'voice',
+            'speaker': 'bot',
+            'audio_url': url_adapter.build('tts_audio', {'key': job.audio_key}),
+            'timestamp': datetime.now().strftime('%H:%M')
+        })
+
+    return tts_jobs.submit(text, synthesize_reply_audio, on_done)
+
+def tts_job_payload(job):
+    payload = job.to_dict()
+    if job.audio_key:
+        payload['audio_url'] = url_for('tts_audio', key=job.audio_key)
+    return payload
+
+def history_page(before=None):
+    """(messages, has_more) for the latest page of the conversation, or the page before message id `before`."""
+    return chat_store.page(session_id(), before, CHAT_PAGE_SIZE)
+
 # --- Routes ---
 
 @app.route('/')
@@ -198,7 +478,14 @@ def chat_interface():
     return render_template('index.html',
                          cities=CITIES,
                          specialties=SPECIALTIES,
-                         experience_ranges=EXPERIENCE_RANGES)
+                         experience_ranges=EXPERIENCE_RANGES,
+                         facets=chat_doctor_index.facets())
+
+def page_number(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
 
 @app.route('/find_doctors', methods=['POST'])
 def find_doctors():
@@ -214,20 +501,29 @@ def find_doctors():
         'experience': experience
     }
 
-    # Filter doctors based on criteria
-    matching_doctors = {}
-    for folder_name, info in doctors_info.items():
-        # Check if the doctor matches the criteria, considering 'all' as no filter
-        # Compare using the English keys received from the form directly with doctors_info keys
-        city_match = (city == 'all' or info['city'] == city)
-        specialty_match = (specialty == 'all' or info['specialty'] == specialty)
-        experience_match = (experience == 'all' or info['experience'] == experience)
-
-        if city_match and specialty_match and experience_match:
-            matching_doctors[folder_name] = info
+    # Filter doctors based on criteria ('all' means no filter); form keys and Persian labels both match
+    page = page_number(request.form.get('page'))
+    matching_doctors, total = filter_chat_doctors(city, specialty, experience, page, DOCTORS_PER_PAGE)
 
     # Render template to display matching doctors
-    return render_template('select_doctor.html', matching_doctors=matching_doctors, criteria=session['filter_criteria'])
+    return render_template('select_doctor.html', matching_doctors=matching_doctors, criteria=session['filter_criteria'],
+                           page=page, total=total, pages=max(1, -(-total // DOCTORS_PER_PAGE)),
+                           facets=chat_doctor_index.facets())
+
+@app.route('/api/doctors')
+def api_doctors():
+    """Paginated doctor search with facet counts for the filter UI"""
+    page = page_number(request.args.get('page'))
+    per_page = min(page_number(request.args.get('per_page', DOCTORS_PER_PAGE)), 100)
+    doctors, total = filter_chat_doctors(request.args.get('city', 'all'), request.args.get('specialty', 'all'),
+                                         request.args.get('experience', 'all'), page, per_page)
+    return jsonify({
+        'doctors': [{'key': key, **info} for key, info in doctors.items()],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'facets': chat_doctor_index.facets(),
+    })
 
 
 @app.route('/select_doctor', methods=['POST'])
@@ -245,13 +541,14 @@ def select_doctor():
     # Store selected doctor in session
     session['selected_doctor'] = selected_doctor_folder
     # Re-initialize chat history for a new chat session with this doctor
-    session['chat_history'] = []
+    chat_store.clear(session_id())
 
     # Redirect to the chat page
     return redirect(url_for('chat'))
 
 
 @app.route('/chat', methods=['GET', 'POST'])
+@rate_limited('chat')
 def chat():
     """Render the chat page and handle chat messages."""
     # Ensure selected_doctor is in session to proceed to chat
@@ -267,7 +564,7 @@ def chat():
     # You might want to add language selection back in the chat if needed
     # selected_language = session.get('selected_language', 'fa') # Assuming a default language
 
-    chat_history = session.get('chat_history', [])
+    sid = session_id()
 
     user_input = None
     bot_response = ""
@@ -277,65 +574,33 @@ def chat():
     if llm is None or chroma_client is None:
         bot_response = "Error: Application not configured properly. Language Model or Document Database client is not available."
         if request.method == 'POST' and request.form.get('user_input'):
-             chat_history.append({'speaker': 'user', 'text': request.form.get('user_input')})
-             chat_history.append({'speaker': 'bot', 'text': bot_response})
-             session['chat_history'] = chat_history
+             save_message(sid, {'speaker': 'user', 'text': request.form.get('user_input')})
+             save_message(sid, {'speaker': 'bot', 'text': bot_response})
+        chat_history, has_more = history_page()
         return render_template('chat_main.html',
                                doctor_name=doctors_info.get(selected_doctor, {}).get('name', selected_doctor), # Get display name
                                # language=next((item[1] for item in LANGUAGES if item[0] == selected_language), selected_language), # Get display name if language added back
                                chat_history=chat_history,
+                               history_has_more=has_more,
                                criteria=criteria # Pass criteria to chat template for display
                                )
 
     if request.method == 'POST':
         user_input = request.form.get('user_input')
         if user_input:
-            # Add user message to history immediately
-            chat_history.append({'speaker': 'user', 'text': user_input})
-
             # --- RAG Query Logic (Direct Chroma Client) ---
             try:
-                # Get the collection (assuming default name "langchain")
-                collection = chroma_client.get_collection(name="langchain")
-
-                # Define the base where filter (always filter by doctor)
-                where_filter = {'doctor': selected_doctor}
-
                 # Although criteria are stored, we currently only filter by doctor metadata in ChromaDB.
-                # If city, specialty, experience were added as metadata during processing,
-                # you could add them to the where_filter here:
-                # if 'city' in criteria and criteria['city'] != 'all':
-                #     where_filter['city'] = criteria['city']
-                # etc.
-
-                # Manually perform query with doctor-specific filtering using Chroma client's query method
-                # Added timeout for query
-                results = collection.query(
-                    query_texts=[user_input],
-                    n_results=3, # Number of results to retrieve
-                    where=where_filter, # Apply metadata filter
-                    # include=['documents', 'metadatas', 'distances'] # Specify what to include
-                )
-
-                # Process results and format retrieved documents for the LLM context
-                retrieved_docs = []
-                if results and results.get('documents') and results['documents'][0]:
-                    for i in range(len(results['documents'][0])):
-                        page_content = results['documents'][0][i]
-                        metadata = results['metadatas'][0][i] if results.get('metadatas') and results['metadatas'][0] else {}
-                        retrieved_docs.append(Document(page_content=page_content, metadata=metadata))
-
-                context_text = "\n\n---\n\n".join([doc.page_content for doc in retrieved_docs])
-
-                # Create the final prompt
-                prompt = prompt_template.format(context=context_text, question=user_input)
+                # Create the final prompt (retrieval + bounded conversation memory)
+                prompt = build_rag_prompt(user_input, sid, selected_doctor)
 
                 # --- LLM Interaction ---
                 # Use the invoke method for the LLM chain
                 if llm:
                      try:
                          # The invoke method directly returns the response content as a string
-                         bot_response_content = llm.invoke(prompt)
+                         with stage('llm'):
+                             bot_response_content = llm.invoke(prompt)
                          bot_response = bot_response_content # Use the string content directly
                      except Exception as e:
                          bot_response = f"Error during LLM invocation: {e}"
@@ -348,11 +613,8 @@ def chat():
                 bot_response = f"Error during document retrieval or processing: {e}"
                 print(bot_response)
 
-            # Add bot response to history
-            chat_history.append({'speaker': 'bot', 'text': bot_response})
-
-            # Update chat history in session
-            session['chat_history'] = chat_history
+            # Add the exchange to the server-side history
+            append_turn(sid, {'speaker': 'user', 'text': user_input}, {'speaker': 'bot', 'text': bot_response})
 
             # Return JSON response for AJAX if using AJAX for chat (optional)
             # return jsonify({'response': bot_response})
@@ -361,6 +623,8 @@ def chat():
     # Pass the full doctor info object to the template
     doctor_info = doctors_info.get(selected_doctor, {})
     doctor_info['avatar_url'] = url_for('static', filename='doctors_images/' + doctor_info.get('image', 'doctor_default.jpg'))
+    # Only the latest page is rendered; older messages are fetched from /chat_history?before=<id>
+    chat_history, has_more = history_page()
     return render_template('chat_main.html',
                            doctor=doctor_info,  # Pass doctor for new template
                            messages=chat_history,  # Pass messages for new template
@@ -368,9 +632,21 @@ def chat():
                            doctor_image=doctor_info.get('image', 'default_doctor.jpg'), # Get doctor image
                            doctor_details=doctor_info, # Pass the full info object
                            chat_history=chat_history,
+                           history_has_more=has_more,
+                           history_url=url_for('chat_history_api'),
                            criteria=criteria # Still pass criteria in case it's needed elsewhere, but not displayed by default
                            )
 
+@app.route('/chat_history')
+def chat_history_api():
+    """Older conversation messages for infinite scroll: ?before=<message id> returns the page before it."""
+    messages, has_more = history_page(request.args.get('before', type=int))
+    return jsonify({
+        'messages': messages,
+        'has_more': has_more,
+        'next_before': messages[0]['id'] if messages and has_more else None
+    })
+
 @app.route('/patient_prompt')
 def patient_prompt():
     return render_template('patient_form.html')
@@ -383,6 +659,14 @@ def generate_prompt():
     initial_problem = request.form.get('initial_problem')
     illness_status = request.form.get('illness_status')
 
+    # Structured patient fields drive the doctor candidate pre-filter in /get_doctor_suggestions
+    session['patient_profile'] = {
+        'language': language,
+        'city': city,
+        'problem': initial_problem,
+        'urgency': illness_status
+    }
+
     prompt = f"""**اطلاعات دریافت شده از بیمار:**
     - **زبان محاوره ای:** {language}
     - **محل سکونت:** {city}, {country}
@@ -394,14 +678,31 @@ def generate_prompt():
     prompt_html = markdown.markdown(prompt)
     return render_template('prompt_result.html', prompt=prompt_html)
 
+DOCTOR_CANDIDATES = int(os.getenv('DOCTOR_CANDIDATES', 15))
+DOCTOR_MATCHES = int(os.getenv('DOCTOR_MATCHES', 5))
+
+def matching_doctors_text(patient_prompt, profile):
+    """Top doctors for the LLM prompt: vector search over profiles, keyword pre-filter until the index is ready"""
+    if semantic_embeddings_available():
+        try:
+            matches = doctor_index.search(profile.get('problem') or patient_prompt, embedding_model,
+                                          profile, DOCTOR_MATCHES)
+            if matches is not None and len(matches):
+                return matches.to_string(index=False)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            print(f"Doctor index search error, using keyword candidates: {e}")
+    return doctor_directory.candidates_text(profile, DOCTOR_CANDIDATES)
+
 @app.route('/get_doctor_suggestions', methods=['POST'])
 def get_doctor_suggestions():
     patient_prompt = request.form.get('patient_prompt')
 
-    # Read doctors data from Excel
+    # Only the doctors matched against the patient fields are sent to the LLM
+    profile = session.get('patient_profile') or {'problem': patient_prompt}
     try:
-        doctors_df = pd.read_excel('doctors_data.xlsx')
-        doctors_info_text = doctors_df.to_string(index=False)
+        doctors_info_text = matching_doctors_text(patient_prompt, profile)
     except FileNotFoundError:
         return "خطا: فایل doctors_data.xlsx یافت نشد."
     except Exception as e:
@@ -470,9 +771,9 @@ Suggestion 1: <br/>- <span style="font-weight: bold; color: red;">Dr. Ali Mohamm
 
 
 @app.route('/api/tts', methods=['POST'])
+@rate_limited('tts')
 def text_to_speech():
     """API endpoint for advanced text-to-speech"""
-    temp_file = None
     try:
         data = request.get_json()
         text = data.get('text', '')
@@ -487,8 +788,13 @@ def text_to_speech():
         
         print(f"TTS request: text='{text[:50]}...', provider='{provider}', voice='{voice}'")
         
+        if data.get('stream'):
+            chain = None if provider == 'auto' else [{'provider': provider, 'voice': voice or None}]
+            return stream_audio_response(text, chain)
+        
         # Synthesize speech
-        audio_data = advanced_tts.synthesize_speech(text, provider, voice)
+        with stage('tts'):
+            audio_data, audio_key = advanced_tts.synthesize_speech_keyed(text, provider, voice)
         
         if not audio_data:
             print("TTS failed: No audio data returned")
@@ -496,38 +802,56 @@ def text_to_speech():
         
         print(f"TTS successful: {len(audio_data)} bytes")
         
-        # Save to temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-        temp_file.write(audio_data)
-        temp_file.close()
-        
-        # Return the file and clean up after sending
-        response = send_file(temp_file.name, mimetype='audio/mpeg')
-        
-        # Clean up the temporary file after the response is sent
-        @response.call_on_close
-        def cleanup():
-            try:
-                import os
-                if temp_file and os.path.exists(temp_file.name):
-                    os.unlink(temp_file.name)
-            except Exception as e:
-                print(f"Error cleaning up temp file: {e}")
+        with stage('transcode'):
+            audio_data, audio_key = audio_transcoder.compact(audio_data, audio_key)
         
+        # Served from memory; the client can re-fetch the same bytes via /tts_audio/<key>
+        response = send_audio(audio_data, audio_key)
+        if audio_key:
+            response.headers['Content-Location'] = url_for('tts_audio', key=audio_key)
         return response
         
     except Exception as e:
         print(f"TTS error: {e}")
-        # Clean up temp file on error
-        if temp_file:
-            try:
-                import os
-                if os.path.exists(temp_file.name):
-                    os.unlink(temp_file.name)
-            except:
-                pass
         return jsonify({'error': str(e)}), 500
 
+@app.route('/tts_audio/<key>')
+def tts_audio(key):
+    """Serve a synthesized reply or voice upload straight from the content-addressed audio cache."""
+    response = send_cached_audio(advanced_tts.cache if advanced_tts else None, key)
+    if response is None:
+        return jsonify({'error': 'Audio not found'}), 404
+    return response
+
+@app.route('/api/tts/cache_stats')
+def tts_cache_stats():
+    """TTS cache size and hit-rate statistics"""
+    if not advanced_tts:
+        return jsonify({'error': 'TTS service not available'}), 503
+    return jsonify({**advanced_tts.cache.stats(), 'transcode': audio_transcoder.stats()})
+
+@app.route('/api/tts/warmup')
+def tts_warmup_status():
+    """Progress of the canned-phrase pre-synthesis job"""
+    return jsonify(tts_warmup.status())
+
+@app.route('/api/doctor_index/stats')
+def doctor_index_stats():
+    """Doctor profile vector index state and directory statistics"""
+    return jsonify({'index': doctor_index.stats(), 'directory': doctor_directory.stats()})
+
+@app.route('/api/stt/stats')
+def stt_stats():
+    """STT engines, model residency and queue statistics"""
+    return jsonify(stt_service.stats())
+
+@app.route('/api/tts/health')
+def tts_health():
+    """Circuit-breaker state and health score of each TTS provider"""
+    if not advanced_tts:
+        return jsonify({'error': 'TTS service not available'}), 503
+    return jsonify(advanced_tts.health.snapshot())
+
 @app.route('/api/tts/voices')
 def get_available_voices():
     """Get available TTS voices"""
@@ -586,14 +910,20 @@ def chat_advanced_page():
     
     selected_doctor = session['selected_doctor']
     doctor_info = doctors_info.get(selected_doctor, {})
-    chat_history = session.get('chat_history', [])
+    chat_history, has_more = history_page()
     
+    greeting = doctor_greeting(doctor_info)
     return render_template('chat_advanced.html',
                          doctor_name=doctor_info.get('name', selected_doctor),
                          doctor_image=doctor_info.get('image', 'default_doctor.jpg'),
-                         chat_history=chat_history)
+                         chat_history=chat_history,
+                         history_has_more=has_more,
+                         history_url=url_for('chat_history_api'),
+                         greeting=greeting,
+                         greeting_audio_url=canned_audio_url(greeting))
 
 @app.route('/chat_advanced', methods=['POST'])
+@rate_limited('chat')
 def chat_advanced():
     """دریافت پیام متنی و بازگشت پاسخ هوشمند"""
     data = request.get_json()
@@ -608,40 +938,10 @@ def chat_advanced():
         'text': text,
         'timestamp': datetime.now().strftime('%H:%M')
     }
-    chat_history = session.get('chat_history', [])
-    chat_history.append(user_msg)
+    sid = session_id()
     
     # پردازش با مدل LLM واقعی
-    bot_response = ""
-    try:
-        if llm and chroma_client:
-            # RAG Query Logic
-            collection = chroma_client.get_collection(name="langchain")
-            selected_doctor = session.get('selected_doctor', 'doctor_abbasi')
-            where_filter = {'doctor': selected_doctor}
-            
-            results = collection.query(
-                query_texts=[text],
-                n_results=3,
-                where=where_filter,
-            )
-            
-            # Process results
-            retrieved_docs = []
-            if results and results.get('documents') and results['documents'][0]:
-                for i in range(len(results['documents'][0])):
-                    page_content = results['documents'][0][i]
-                    metadata = results['metadatas'][0][i] if results.get('metadatas') and results['metadatas'][0] else {}
-                    retrieved_docs.append(Document(page_content=page_content, metadata=metadata))
-            
-            context_text = "\n\n---\n\n".join([doc.page_content for doc in retrieved_docs])
-            prompt = prompt_template.format(context=context_text, question=text)
-            bot_response_content = llm.invoke(prompt)
-            bot_response = bot_response_content
-        else:
-            bot_response = f"پاسخ هوشمند به: {text}"
-    except Exception as e:
-        bot_response = f"خطا در پردازش: {str(e)}"
+    bot_response = generate_answer(text, sid)
     
     # ساخت پیام ربات
     bot_msg = {
@@ -650,119 +950,193 @@ def chat_advanced():
         'text': bot_response,
         'timestamp': datetime.now().strftime('%H:%M')
     }
-    chat_history.append(bot_msg)
-    session['chat_history'] = chat_history
+    append_turn(sid, user_msg, bot_msg)
+
+    # --- تولید پاسخ صوتی (TTS) در پس‌زمینه ---
+    # پاسخ متنی بلافاصله برمی‌گردد؛ آدرس صدا از طریق poll یا SSE کار TTS دریافت می‌شود
+    if advanced_tts and bot_response:
+        job = submit_reply_tts(bot_response)
+        return jsonify({
+            **bot_msg,
+            'tts_job': job.id,
+            'tts_status_url': url_for('tts_job_status', job_id=job.id),
+            'tts_events_url': url_for('tts_job_events', job_id=job.id)
+        })
+    return jsonify(bot_msg)
 
-    # --- تولید پاسخ صوتی (TTS) ---
+@app.route('/tts_jobs/<job_id>')
+def tts_job_status(job_id):
+    """Poll a background TTS job; ?wait=N long-polls for up to N seconds (max 30)."""
     try:
-        if advanced_tts:
-            # Use AvalAI Gemini model with explicit Iranian accent instructions
-            audio_data = None
-            provider = 'avalai'
-            model = 'gemini-2.5-pro-preview-tts'
-            voice = 'nova'
-            instructions = 'با لهجه فارسی ایرانی (تهرانی) و لحن طبیعی و استاندارد صحبت کن.'
-            # Try Gemini model first
-            audio_data = advanced_tts.text_to_speech_avalai(bot_response, voice, model=model) if hasattr(advanced_tts, 'text_to_speech_avalai') else None
-            if not audio_data and hasattr(advanced_tts, 'text_to_speech_avalai'):
-                # Try shimmer as alternative female voice
-                voice = 'shimmer'
-                audio_data = advanced_tts.text_to_speech_avalai(bot_response, voice, model=model)
-            # Fallbacks
-            if not audio_data:
-                provider = 'azure'
-                voice = 'fa-IR-SaraNeural'
-                audio_data = advanced_tts.synthesize_speech(bot_response, provider, voice)
-            if not audio_data:
-                provider = 'azure'
-                voice = 'fa-IR-YektaNeural'
-                audio_data = advanced_tts.synthesize_speech(bot_response, provider, voice)
-            if not audio_data:
-                provider = 'google'
-                voice = 'fa-IR-Wavenet-B'
-                audio_data = advanced_tts.synthesize_speech(bot_response, provider, voice)
-            if audio_data:
-                audio_filename = f"tts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
-                audio_path = os.path.join('HT_RAG_Chatbot/static/tts_cache', audio_filename)
-                with open(audio_path, 'wb') as f:
-                    f.write(audio_data)
-                audio_url = f"/static/tts_cache/{audio_filename}"
-                bot_voice_msg = {
-                    'type': 'voice',
-                    'speaker': 'bot',
-                    'audio_url': audio_url,
-                    'timestamp': datetime.now().strftime('%H:%M')
-                }
-                chat_history.append(bot_voice_msg)
-                session['chat_history'] = chat_history
-                return jsonify(bot_voice_msg)
+        wait = min(max(float(request.args.get('wait', 0)), 0), 30)
+    except ValueError:
+        wait = 0
+    job = tts_jobs.wait(job_id, wait) if wait else tts_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'TTS job not found'}), 404
+    return jsonify(tts_job_payload(job))
+
+@app.route('/tts_jobs/<job_id>/events')
+def tts_job_events(job_id):
+    """SSE stream for a background TTS job: the current status, then a final done/failed event."""
+    job = tts_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'TTS job not found'}), 404
+
+    def generate():
+        yield sse_event('status', tts_job_payload(job))
+        deadline = time.monotonic() + 120
+        while not job.finished.wait(15):
+            if time.monotonic() > deadline:
+                yield sse_event('failed', {**tts_job_payload(job), 'error': 'timeout'})
+                return
+            yield ': keep-alive\n\n'
+        yield sse_event(job.status, tts_job_payload(job))
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/chat_advanced_stream', methods=['POST'])
+@rate_limited('chat')
+def chat_advanced_stream():
+    """پاسخ جریانی (SSE): متن LLM به تدریج و صدای هر جمله به محض آماده شدن ارسال می‌شود"""
+    data = request.get_json()
+    text = data.get('text', '').strip()
+    if not text:
+        return jsonify({'error': 'متن پیام خالی است.'}), 400
+    if not (llm and chroma_client):
+        return jsonify({'error': 'مدل زبانی یا پایگاه داده اسناد در دسترس نیست.'}), 503
+
+    user_msg = {
+        'type': 'text',
+        'speaker': 'user',
+        'text': text,
+        'timestamp': datetime.now().strftime('%H:%M')
+    }
+    sid = session_id()
+    selected_doctor = session.get('selected_doctor', 'doctor_abbasi')
+    prompt = build_rag_prompt(text, sid, selected_doctor)
+    save_message(sid, user_msg)
+
+    def generate():
+        start = time.perf_counter()
+        timings = {}
+        answer = yield from stream_answer(prompt, timings, start)
+        timings['total'] = (time.perf_counter() - start) * 1000
+        bot_msg = {
+            'type': 'text',
+            'speaker': 'bot',
+            'text': answer,
+            'timestamp': datetime.now().strftime('%H:%M')
+        }
+        yield sse_event('done', {**bot_msg, 'timings': rounded_timings(timings)})
+        append_turn(sid, bot_msg)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Voice uploads are stored and re-encoded in parallel with speech recognition
+voice_upload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='voice-upload')
+
+def store_voice_upload(audio_bytes):
+    """Store a voice upload in the content-addressed audio cache; returns the key of its compact version."""
+    audio_key = hashlib.sha256(audio_bytes).hexdigest()
+    advanced_tts.cache.put(audio_key, audio_bytes)
+    return audio_transcoder.compact(audio_bytes, audio_key)[1]
+
+def submit_voice_upload(audio_bytes):
+    """Start storing the upload; returns a callable giving its URL once stored."""
+    if advanced_tts:
+        future = voice_upload_executor.submit(store_voice_upload, audio_bytes)
+        return lambda: url_for('tts_audio', key=future.result())
+    temp_filename = f"voice_{uuid.uuid4().hex}.webm"
+    with open(os.path.join('HT_RAG_Chatbot/static', temp_filename), 'wb') as f:
+        f.write(audio_bytes)
+    return lambda: f'/static/{temp_filename}'
+
+def voice_prompt(transcript, sid):
+    """RAG prompt for a streamed voice answer, or None to fall back to generate_answer."""
+    if not (llm and chroma_client):
+        return None
+    return build_rag_prompt(transcript, sid, session.get('selected_doctor', 'doctor_abbasi'))
+
+def reply_audio_url(text):
+    """URL of the synthesized reply audio, or None when TTS is unavailable or fails."""
+    if not advanced_tts:
+        return None
+    try:
+        audio_data, audio_key = synthesize_reply_audio(text)
     except Exception as e:
         print(f"TTS error: {e}")
-    # اگر TTS نشد، پیام متنی را برگردان
-    return jsonify(bot_msg)
+        return None
+    return url_for('tts_audio', key=audio_key) if audio_data else None
+
+voice_turn = VoiceTurn(
+    transcribe=stt_service.transcribe,
+    answer=generate_answer,
+    prompt=voice_prompt,
+    stream=stream_answer,
+    reply_audio_url=reply_audio_url,
+    save=save_message,
+    append_turn=append_turn,
+    ack_text=VOICE_ACK_PHRASE,
+    ack_audio_url=lambda: canned_audio_url(VOICE_ACK_PHRASE),
+)
 
 @app.route('/voice_message', methods=['POST'])
+@rate_limited('chat')
 def voice_message():
-    """دریافت پیام صوتی و بازگشت پاسخ"""
+    """
+    نوبت صوتی کامل: STT ← بازیابی ← LLM ← TTS، همراه با زمان هر مرحله در پاسخ.
+    با stream=1 (یا Accept: text/event-stream) پاسخ به صورت SSE ارسال می‌شود؛ متن و صدای هر جمله
+    به محض آماده شدن می‌رسند و با قطع اتصال کلاینت پردازش باقی‌مانده لغو می‌شود.
+    """
     if 'audio' not in request.files:
         return jsonify({'error': 'فایل صوتی ارسال نشده است.'}), 400
-    
-    audio_file = request.files['audio']
-    
-    # ذخیره فایل صوتی موقت
-    temp_filename = f"voice_{datetime.now().strftime('%Y%m%d_%H%M%S')}.webm"
-    temp_path = os.path.join('HT_RAG_Chatbot/static', temp_filename)
-    audio_file.save(temp_path)
-    
-    # پیام کاربر
-    user_msg = {
-        'type': 'voice',
-        'speaker': 'user',
-        'audio_url': f'/static/{temp_filename}',
-        'timestamp': datetime.now().strftime('%H:%M')
-    }
-    chat_history = session.get('chat_history', [])
-    chat_history.append(user_msg)
-    
-    # در حالت واقعی اینجا باید STT اجرا شود
-    # فعلاً پاسخ نمونه
-    bot_text = 'پیام صوتی شما دریافت شد. در حال پردازش...'
-    
-    bot_msg = {
-        'type': 'text',
-        'speaker': 'bot',
-        'text': bot_text,
-        'timestamp': datetime.now().strftime('%H:%M')
-    }
-    chat_history.append(bot_msg)
-    session['chat_history'] = chat_history
-    
-    return jsonify(bot_msg)
+    audio_bytes = request.files['audio'].read()
+    if not audio_bytes:
+        return jsonify({'error': 'فایل صوتی خالی است.'}), 400
+
+    start = time.perf_counter()
+    upload_url = submit_voice_upload(audio_bytes)
+    if request.form.get('stream') == '1' or request.accept_mimetypes.best == 'text/event-stream':
+        return voice_turn.stream_response(audio_bytes, upload_url, session_id(), start)
+    return voice_turn.respond(audio_bytes, upload_url, session_id(), start)
 
 # --- STT (Speech-to-Text) Endpoint ---
+def configured_stt_model():
+    """STT engine selected in DoctorBotSettings.stt_model (empty means the STT_BACKEND default)."""
+    settings = DoctorBotSettings.query.first()
+    return (settings.stt_model or '').strip() if settings else ''
+
+# The admin-selected STT engine is read once here and kept by stt_service (the settings route updates it);
+# local models (faster-whisper / Vosk) load in the background before the first voice turn
+with app.app_context():
+    try:
+        stt_service.select(configured_stt_model())
+        stt_service.preload()
+    except Exception as e:
+        print(f"Error reading STT settings, preloading default engine: {e}")
+        stt_service.preload()
+
 @app.route('/stt', methods=['POST'])
+@rate_limited('stt')
 def stt_api():
     """دریافت فایل صوتی و تبدیل به متن فارسی (Speech-to-Text)"""
     if 'audio' not in request.files:
         return jsonify({'error': 'فایل صوتی ارسال نشده است.'}), 400
-    audio_file = request.files['audio']
-    filename = secure_filename(audio_file.filename or 'audio_input.wav')
-    temp_path = os.path.join('HT_RAG_Chatbot/static', filename)
-    audio_file.save(temp_path)
+    audio_bytes = request.files['audio'].read()
     try:
-        recognizer = sr.Recognizer()
-        with sr.AudioFile(temp_path) as source:
-            audio_data = recognizer.record(source)
-        text = recognizer.recognize_google(audio_data, language='fa-IR')
-        os.remove(temp_path)
-        return jsonify({'text': text})
-    except Exception as e:
-        print(f'STT error: {e}')
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        return jsonify({'error': f'خطا در تبدیل گفتار به متن: {str(e)}'}), 500
+        with stage('stt'):
+            text = stt_service.transcribe(audio_bytes)
+    except STTQueueFull:
+        return stt_busy_response()
+    if text is None:
+        return jsonify({'error': 'خطا در تبدیل گفتار به متن.'}), 500
+    return jsonify({'text': text})
 
 @app.route('/tts', methods=['POST'])
+@rate_limited('tts')
 def tts_api():
     data = request.get_json()
     text = data.get('text', '')
@@ -771,37 +1145,11 @@ def tts_api():
         return jsonify({'error': 'متن خالی است.'}), 400
     try:
         if advanced_tts:
-            audio_data = None
-            provider = 'avalai'
-            model = 'gemini-2.5-pro-preview-tts'
-            voice = 'nova'
-            instructions = 'با لهجه فارسی ایرانی (تهرانی) و لحن طبیعی و استاندارد صحبت کن.'
-            # Try Gemini model first
-            audio_data = advanced_tts.text_to_speech_avalai(text, voice, model=model) if hasattr(advanced_tts, 'text_to_speech_avalai') else None
-            if not audio_data and hasattr(advanced_tts, 'text_to_speech_avalai'):
-                # Try shimmer as alternative female voice
-                voice = 'shimmer'
-                audio_data = advanced_tts.text_to_speech_avalai(text, voice, model=model)
-            # Fallbacks
-            if not audio_data:
-                provider = 'azure'
-                voice = 'fa-IR-SaraNeural'
-                audio_data = advanced_tts.synthesize_speech(text, provider, voice)
-            if not audio_data:
-                provider = 'azure'
-                voice = 'fa-IR-YektaNeural'
-                audio_data = advanced_tts.synthesize_speech(text, provider, voice)
-            if not audio_data:
-                provider = 'google'
-                voice = 'fa-IR-Wavenet-B'
-                audio_data = advanced_tts.synthesize_speech(text, provider, voice)
+            if data.get('stream'):
+                return stream_audio_response(text)
+            audio_data, audio_key = synthesize_reply_audio(text)
             if audio_data:
-                return send_file(
-                    io.BytesIO(audio_data),
-                    mimetype='audio/wav',
-                    as_attachment=False,
-                    download_name='tts.wav'
-                )
+                return send_audio(audio_data, audio_key)
         silent_audio = io.BytesIO()
         silent_audio.write(b'RIFF....WAVEfmt ')
         silent_audio.seek(0)
@@ -816,32 +1164,20 @@ def tts_api():
 
 @app.route('/admin/chatbot_settings', methods=['GET'])
 def chatbot_settings():
-    settings = load_json(SETTINGS_PATH, {
-        'bot_name': 'چت‌بات پزشکی',
-        'bot_description': '',
-        'default_language': 'fa',
-        'bot_active': True,
-        'llm_model': 'avalai',
-        'embedding_model': 'paraphrase-multilingual-MiniLM-L12-v2',
-        'top_k': 3,
-        'temperature': 0.7
-    })
-    resources = load_json(RESOURCES_PATH, [])
-    users = load_json(USERS_PATH, [])
-    logs = []
-    if os.path.exists(LOGS_PATH):
-        with open(LOGS_PATH, 'r', encoding='utf-8') as f:
-            logs = f.readlines()[-30:]
+    settings = settings_store.get(DEFAULT_ADMIN_SETTINGS)
+    resources = resources_store.get()
+    users = users_store.get()
+    logs = recent_log_lines()
     return render_template('admin/chatbot_settings.html', settings=settings, resources=resources, users=users, logs=logs)
 
 @app.route('/admin/save_settings', methods=['POST'])
 def save_settings():
-    settings = load_json(SETTINGS_PATH, {})
-    settings['bot_name'] = request.form.get('bot_name', '')
-    settings['bot_description'] = request.form.get('bot_description', '')
-    settings['default_language'] = request.form.get('default_language', 'fa')
-    settings['bot_active'] = request.form.get('bot_active', '1') == '1'
-    save_json(SETTINGS_PATH, settings)
+    settings_store.merge(
+        bot_name=request.form.get('bot_name', ''),
+        bot_description=request.form.get('bot_description', ''),
+        default_language=request.form.get('default_language', 'fa'),
+        bot_active=request.form.get('bot_active', '1') == '1',
+    )
     append_log('تنظیمات کلی چت‌بات ذخیره شد.')
     return redirect(url_for('chatbot_settings'))
 
@@ -851,9 +1187,8 @@ def upload_resource():
     if file and file.filename.endswith('.docx'):
         save_path = os.path.join(MED_DOC_DIR, 'doctor_abbasi', file.filename)
         file.save(save_path)
-        resources = load_json(RESOURCES_PATH, [])
-        resources.append({'name': file.filename, 'size': round(os.path.getsize(save_path)/1024, 1)})
-        save_json(RESOURCES_PATH, resources)
+        resources_store.update(lambda resources: resources.append(
+            {'name': file.filename, 'size': round(os.path.getsize(save_path)/1024, 1)}))
         append_log(f'فایل {file.filename} آپلود شد.')
     return redirect(url_for('chatbot_settings'))
 
@@ -870,12 +1205,12 @@ def rebuild_embeddings():
 
 @app.route('/admin/save_model_settings', methods=['POST'])
 def save_model_settings():
-    settings = load_json(SETTINGS_PATH, {})
-    settings['llm_model'] = request.form.get('llm_model', 'avalai')
-    settings['embedding_model'] = request.form.get('embedding_model', 'paraphrase-multilingual-MiniLM-L12-v2')
-    settings['top_k'] = int(request.form.get('top_k', 3))
-    settings['temperature'] = float(request.form.get('temperature', 0.7))
-    save_json(SETTINGS_PATH, settings)
+    settings_store.merge(
+        llm_model=request.form.get('llm_model', 'avalai'),
+        embedding_model=request.form.get('embedding_model', 'paraphrase-multilingual-MiniLM-L12-v2'),
+        top_k=int(request.form.get('top_k', 3)),
+        temperature=float(request.form.get('temperature', 0.7)),
+    )
     append_log('تنظیمات مدل و embedding ذخیره شد.')
     return redirect(url_for('chatbot_settings'))
 
@@ -884,9 +1219,7 @@ def add_user():
     username = request.form.get('username', '').strip()
     role = request.form.get('role', 'user')
     if username:
-        users = load_json(USERS_PATH, [])
-        users.append({'username': username, 'role': role})
-        save_json(USERS_PATH, users)
+        users_store.update(lambda users: users.append({'username': username, 'role': role}))
         append_log(f'کاربر {username} با نقش {role} اضافه شد.')
     return redirect(url_for('chatbot_settings'))
 
@@ -896,18 +1229,14 @@ def delete_resource():
     file_path = os.path.join(MED_DOC_DIR, 'doctor_abbasi', filename)
     if os.path.exists(file_path):
         os.remove(file_path)
-    resources = load_json(RESOURCES_PATH, [])
-    resources = [f for f in resources if f['name'] != filename]
-    save_json(RESOURCES_PATH, resources)
+    resources_store.update(lambda resources: [f for f in resources if f['name'] != filename])
     append_log(f'فایل {filename} حذف شد.')
     return redirect(url_for('chatbot_settings'))
 
 @app.route('/admin/delete_user', methods=['POST'])
 def delete_user():
     username = request.form.get('username')
-    users = load_json(USERS_PATH, [])
-    users = [u for u in users if u['username'] != username]
-    save_json(USERS_PATH, users)
+    users_store.update(lambda users: [u for u in users if u['username'] != username])
     append_log(f'کاربر {username} حذف شد.')
     return redirect(url_for('chatbot_settings'))
 
@@ -915,11 +1244,11 @@ def delete_user():
 def change_role():
     username = request.form.get('username')
     role = request.form.get('role')
-    users = load_json(USERS_PATH, [])
-    for u in users:
-        if u['username'] == username:
-            u['role'] = role
-    save_json(USERS_PATH, users)
+    def set_role(users):
+        for u in users:
+            if u['username'] == username:
+                u['role'] = role
+    users_store.update(set_role)
     append_log(f'نقش کاربر {username} به {role} تغییر یافت.')
     return redirect(url_for('chatbot_settings'))
 
@@ -927,40 +1256,87 @@ def change_role():
 def change_password():
     username = request.form.get('username')
     new_password = request.form.get('new_password')
-    users = load_json(USERS_PATH, [])
-    for u in users:
-        if u['username'] == username:
-            u['password'] = new_password
-    save_json(USERS_PATH, users)
+    def set_password(users):
+        for u in users:
+            if u['username'] == username:
+                u['password'] = new_password
+    users_store.update(set_password)
     append_log(f'رمز کاربر {username} تغییر یافت.')
     return redirect(url_for('chatbot_settings'))
 
 @app.route('/admin/save_security_settings', methods=['POST'])
 def save_security_settings():
-    settings = load_json(SETTINGS_PATH, {})
-    settings['api_key'] = request.form.get('api_key', '')
-    settings['allowed_ips'] = request.form.get('allowed_ips', '')
-    save_json(SETTINGS_PATH, settings)
+    settings_store.merge(
+        api_key=request.form.get('api_key', ''),
+        allowed_ips=request.form.get('allowed_ips', ''),
+        rate_limit=int(request.form.get('rate_limit') or DEFAULT_RATE_LIMIT),
+    )
     append_log('تنظیمات امنیتی ذخیره شد.')
     return redirect(url_for('chatbot_settings'))
 
+def wants_json():
+    return request.accept_mimetypes.best == 'application/json'
+
 @app.route('/admin/backup', methods=['POST'])
 def backup():
-    backup_dir = os.path.join(BASE_DIR, 'chatbot_backup')
-    if not os.path.exists(backup_dir):
-        os.makedirs(backup_dir)
-    for f in [SETTINGS_PATH, RESOURCES_PATH, USERS_PATH, LOGS_PATH]:
-        if os.path.exists(f):
-            shutil.copy(f, backup_dir)
-    if os.path.exists(os.path.join(BASE_DIR, 'chroma_db')):
-        shutil.make_archive(os.path.join(backup_dir, 'chroma_db_backup'), 'zip', os.path.join(BASE_DIR, 'chroma_db'))
-    append_log('پشتیبان‌گیری انجام شد.')
+    # Runs in the background; only files changed since the previous backup are copied
+    event_log.flush()
+    job = backup_manager.start()
+    append_log(f'پشتیبان‌گیری {job.id} آغاز شد.', event='backup', job=job.id)
+    if wants_json():
+        return jsonify({**job.to_dict(), 'status_url': url_for('backup_status', job_id=job.id)}), 202
     return redirect(url_for('chatbot_settings'))
 
+@app.route('/admin/backup/status/<job_id>', methods=['GET'])
+def backup_status(job_id):
+    job = backup_manager.job(job_id)
+    if job is None:
+        return jsonify({'error': 'Backup job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/admin/backups', methods=['GET'])
+def list_backups():
+    return jsonify({'backups': backup_manager.manifests()})
+
+def restore_backup(backup_id):
+    """Verified restore of every backed-up source: admin JSON files, event log, ChromaDB and SQLite stores."""
+    sources = backup_manager.manifest(backup_id)['sources']
+    for name, store in CONFIG_STORES.items():
+        if name in sources:
+            backup_manager.restore(backup_id, name, store.path)
+            store.reload()
+    if 'logs' in sources:
+        event_log.flush()
+        backup_manager.restore(backup_id, 'logs', LOGS_PATH)
+        event_log.reload()
+    # Live SQLite databases are written in place through the backup API; open connections stay valid
+    for name in ('chat_history', 'doctorbot'):
+        if name in sources and name in backup_sources:
+            backup_manager.restore_sqlite(backup_id, name, backup_sources[name])
+    if 'chroma_db' in sources:
+        # Restored into a fresh directory next to the live database, then swapped into place
+        target = os.path.join(BASE_DIR, f'.chroma_db.restore-{uuid.uuid4().hex[:8]}')
+        try:
+            backup_manager.restore(backup_id, 'chroma_db', target)
+            swap_chroma_dir(target)
+        finally:
+            if os.path.exists(target):
+                shutil.rmtree(target, ignore_errors=True)
+
 @app.route('/admin/restore', methods=['POST'])
 def restore():
+    backup_id = request.form.get('backup_id')
     backup_file = request.files.get('backup_file')
-    if backup_file:
+    if backup_id:
+        try:
+            restore_backup(backup_id)
+        except (BackupError, OSError) as e:
+            print(f"Error restoring backup {backup_id}: {e}")
+            append_log(f'بازیابی {backup_id} ناموفق بود: {e}', event='backup', job=backup_id)
+            if wants_json():
+                return jsonify({'error': str(e)}), 400
+            return redirect(url_for('chatbot_settings'))
+    elif backup_file:
         backup_path = os.path.join(BASE_DIR, 'chatbot_backup', backup_file.filename)
         backup_file.save(backup_path)
         # اگر فایل zip بود، دیتابیس را بازگردانی کن
@@ -970,7 +1346,12 @@ def restore():
             # فایل json یا txt را جایگزین کن
             target = os.path.join(BASE_DIR, backup_file.filename)
             shutil.copy(backup_path, target)
-    append_log('بازیابی انجام شد.')
+            for store in (settings_store, resources_store, users_store):
+                if os.path.abspath(store.path) == os.path.abspath(target):
+                    store.reload()
+    append_log('بازیابی انجام شد.', event='backup')
+    if wants_json():
+        return jsonify({'restored': backup_id})
     return redirect(url_for('chatbot_settings'))
 
 @app.route('/admin/test_chatbot', methods=['POST'])
@@ -984,29 +1365,37 @@ def test_chatbot():
             response = 'مدل LLM فعال نیست.'
     except Exception as e:
         response = f'خطا: {e}'
-    settings = load_json(SETTINGS_PATH, {})
-    resources = load_json(RESOURCES_PATH, [])
-    users = load_json(USERS_PATH, [])
-    logs = []
-    if os.path.exists(LOGS_PATH):
-        with open(LOGS_PATH, 'r', encoding='utf-8') as f:
-            logs = f.readlines()[-30:]
+    settings = settings_store.get()
+    resources = resources_store.get()
+    users = users_store.get()
+    logs = recent_log_lines()
     return render_template('admin/chatbot_settings.html', settings=settings, resources=resources, users=users, logs=logs, test_response=response)
 
 @app.route('/admin/save_tts_settings', methods=['POST'])
 def save_tts_settings():
-    settings = load_json(SETTINGS_PATH, {})
-    settings['tts_voice'] = request.form.get('tts_voice', 'nova')
-    settings['tts_speed'] = float(request.form.get('tts_speed', 1.0))
-    settings['tts_accent'] = request.form.get('tts_accent', 'تهرانی')
-    save_json(SETTINGS_PATH, settings)
+    settings_store.merge(
+        tts_voice=request.form.get('tts_voice', 'nova'),
+        tts_speed=float(request.form.get('tts_speed', 1.0)),
+        tts_accent=request.form.get('tts_accent', 'تهرانی'),
+    )
     append_log('تنظیمات TTS/STT ذخیره شد.')
     return redirect(url_for('chatbot_settings'))
 
 @app.route('/admin/download_logs', methods=['GET'])
 def download_logs():
+    event_log.flush()
     return send_from_directory(BASE_DIR, 'chatbot_logs.txt', as_attachment=True)
 
+@app.route('/admin/logs', methods=['GET'])
+def query_logs():
+    """Recent admin events, newest first, filtered by ?event=, ?q= (message text) and ?since= (ISO time)"""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({
+        'events': event_log.query(request.args.get('event') or None, request.args.get('q') or None,
+                                  request.args.get('since') or None, limit),
+        'stats': event_log.stats(),
+    })
+
 @app.route('/admin/preview_resource', methods=['POST'])
 def preview_resource():
     filename = request.form.get('filename')
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تبدیل محلی صدا به قالب فشرده (Opus یا MP3 کم‌بیت‌ریت) با ffmpeg و کش نتیجه
+Local ffmpeg transcoding of TTS output and voice uploads to a compact codec
+"""
+
+import os
+import shutil
+import hashlib
+import subprocess
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional, Dict, Any, Tuple
+
+from tts_cache import TTSCache
+
+logger = logging.getLogger(__name__)
+
+# حداکثر تعداد کلیدهای رد‌شده‌ای که به خاطر سپرده می‌شوند
+MAX_SKIPPED_KEYS = 4096
+
+# آرگومان‌های ffmpeg برای هر قالب خروجی؛ 'original' یعنی بدون تبدیل
+CODECS = {
+    'opus': ['-c:a', 'libopus', '-application', 'voip', '-f', 'ogg'],
+    'mp3': ['-c:a', 'libmp3lame', '-f', 'mp3'],
+}
+
+DEFAULT_BITRATES = {
+    'opus': '24k',
+    'mp3': '48k',
+}
+
+
+class AudioTranscoder:
+    """
+    تبدیل صدا به AUDIO_CODEC/AUDIO_BITRATE از طریق pipe ورودی/خروجی ffmpeg (بدون فایل موقت).
+    تبدیل‌ها در یک pool جداگانه اجرا می‌شوند؛ درخواست حداکثر wait ثانیه منتظر می‌ماند و در غیر
+    این صورت صدای اصلی را می‌گیرد، در حالی که نتیجه برای دفعات بعد در کش ذخیره می‌شود.
+    """
+
+    def __init__(self, codec: str = None, bitrate: str = None, cache: TTSCache = None,
+                 wait: float = None, workers: int = 2, ffmpeg: str = None):
+        self.codec = (codec or os.getenv('AUDIO_CODEC', 'opus')).lower()
+        self.bitrate = bitrate or os.getenv('AUDIO_BITRATE') or DEFAULT_BITRATES.get(self.codec)
+        self.cache = cache
+        self.wait = wait if wait is not None else float(os.getenv('AUDIO_TRANSCODE_WAIT', 1.0))
+        self.timeout = float(os.getenv('AUDIO_TRANSCODE_TIMEOUT', 30))
+        self.ffmpeg = ffmpeg or os.getenv('FFMPEG_PATH') or shutil.which('ffmpeg')
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcode')
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        # کلیدهایی که تبدیلشان حجم را کم نکرد یا شکست خورد دوباره امتحان نمی‌شوند
+        self._skip = OrderedDict()
+        self.transcoded = 0
+        self.bytes_saved = 0
+        self.failures = 0
+        if self.codec in CODECS and not self.ffmpeg:
+            logger.warning("ffmpeg not found, audio will be served as produced")
+
+    @property
+    def enabled(self) -> bool:
+        return self.codec in CODECS and bool(self.ffmpeg)
+
+    def compact_key(self, key: str) -> str:
+        """کلید کش نسخه فشرده یک صدای آدرس‌دهی‌شده"""
+        return TTSCache.make_key(key, 'transcode', self.codec, self.bitrate)
+
+    def transcode(self, data: bytes) -> Optional[bytes]:
+        """تبدیل همگام داده صوتی؛ در صورت خطا None"""
+        command = [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+                   '-vn', '-ac', '1', '-b:a', self.bitrate, *CODECS[self.codec], 'pipe:1']
+        try:
+            result = subprocess.run(command, input=data, capture_output=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.error(f"ffmpeg transcode error: {e}")
+            return None
+        if result.returncode != 0 or not result.stdout:
+            logger.error(f"ffmpeg transcode failed: {result.stderr.decode('utf-8', 'replace')[:200]}")
+            return None
+        return result.stdout
+
+    def _job(self, data: bytes, key: str) -> Optional[bytes]:
+        try:
+            compact = self.transcode(data)
+            with self._lock:
+                if compact is None:
+                    self.failures += 1
+                if compact is None or len(compact) >= len(data):
+                    self._skip[key] = True
+                    if len(self._skip) > MAX_SKIPPED_KEYS:
+                        self._skip.popitem(last=False)
+                    return None
+                self.transcoded += 1
+                self.bytes_saved += len(data) - len(compact)
+            if self.cache is not None:
+                try:
+                    self.cache.put(self.compact_key(key), compact)
+                except Exception as e:
+                    logger.error(f"Transcode cache write error: {e}")
+            return compact
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def compact(self, data: bytes, key: str = None, wait: float = None) -> Tuple[bytes, Optional[str]]:
+        """
+        نسخه فشرده صدا همراه با کلید کش آن.
+        اگر تبدیل در مهلت wait تمام نشود، (data, key) اصلی بازگردانده می‌شود و تبدیل در پس‌زمینه ادامه می‌یابد.
+        """
+        if not self.enabled or not data:
+            return data, key
+        key = key or hashlib.sha256(data).hexdigest()
+        if self.cache is not None:
+            compact = self.cache.get(self.compact_key(key))
+            if compact is not None:
+                return compact, self.compact_key(key)
+        with self._lock:
+            if key in self._skip:
+                self._skip.move_to_end(key)
+                return data, key
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._job, data, key)
+                self._in_flight[key] = future
+        try:
+            compact = future.result(timeout=self.wait if wait is None else wait)
+        except FutureTimeout:
+            return data, key
+        except Exception as e:
+            logger.error(f"Transcode error: {e}")
+            return data, key
+        if compact is None:
+            return data, key
+        return compact, self.compact_key(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'codec': self.codec,
+                'bitrate': self.bitrate,
+                'transcoded': self.transcoded,
+                'bytes_saved': self.bytes_saved,
+                'failures': self.failures,
+                'in_flight': len(self._in_flight),
+            }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+پیش‌پردازش صدای ورودی پیش از STT: رمزگشایی در حافظه، تبدیل به ۱۶ کیلوهرتز مونو،
+حذف سکوت با VAD مبتنی بر انرژی و تقسیم ضبط‌های بلند در محل سکوت‌ها
+In-memory decoding, energy-based VAD trimming and silence splitting before STT
+"""
+
+import io
+import os
+import wave
+import shutil
+import subprocess
+import logging
+from typing import List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+class AudioDecodeError(Exception):
+    """صدای ورودی قابل رمزگشایی نیست"""
+
+
+def decode_pcm16k(audio: bytes) -> bytes:
+    """تبدیل هر قالب صوتی به PCM شانزده‌بیتی مونو ۱۶ کیلوهرتز (WAV مستقیم، سایر قالب‌ها با ffmpeg از طریق pipe)"""
+    if audio[:4] == b'RIFF':
+        try:
+            with wave.open(io.BytesIO(audio)) as wav:
+                if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (SAMPLE_RATE, 1, 2):
+                    return wav.readframes(wav.getnframes())
+        except wave.Error:
+            pass
+    ffmpeg = os.getenv('FFMPEG_PATH') or shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise AudioDecodeError('ffmpeg is required to decode non-WAV audio')
+    result = subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+                             '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1'],
+                            input=audio, capture_output=True, timeout=30)
+    if result.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg decode failed: {result.stderr.decode('utf-8', 'replace')[:200]}")
+    return result.stdout
+
+
+def to_wav(pcm: bytes) -> bytes:
+    """بسته‌بندی PCM در قالب WAV (برای موتورهایی که فایل می‌خواهند)"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def frame_energies(samples: np.ndarray) -> np.ndarray:
+    """انرژی RMS هر فریم ۳۰ میلی‌ثانیه‌ای"""
+    count = len(samples) // FRAME_SAMPLES
+    if count == 0:
+        return np.zeros(0)
+    frames = samples[:count * FRAME_SAMPLES].astype(np.float32).reshape(count, FRAME_SAMPLES)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+# کف انرژی فقط برای سکوت دیجیتال (حدود ۶۴- dBFS)؛ گفتار آرام همیشه بالاتر از این است
+DIGITAL_SILENCE_LEVEL = 20.0
+
+
+def speech_mask(energies: np.ndarray, min_level: float = DIGITAL_SILENCE_LEVEL, ratio: float = 3.0) -> np.ndarray:
+    """
+    فریم‌های گفتار: انرژی بیشتر از ratio برابر کف نویز (صدک دهم). آستانه نسبی است و حداکثر
+    یک‌چهارم سطح گفتار (صدک نودم) است تا گفتار آرام و ضبط‌هایی که تقریباً تماماً گفتارند گم نشوند؛
+    min_level فقط سکوت دیجیتال را کنار می‌گذارد؛
+    فریم‌های منفرد با یک فریم همسایه به هم متصل می‌شوند تا هجاهای کوتاه حذف نشوند.
+    """
+    if len(energies) == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor, speech_level = np.percentile(energies, [10, 90])
+    threshold = max(min_level, min(float(noise_floor) * ratio, float(speech_level) * 0.25))
+    mask = energies > threshold
+    # گسترش یک فریمی (dilation) برای پوشش ابتدا و انتهای کلمات
+    mask[1:] |= mask[:-1].copy()
+    mask[:-1] |= mask[1:].copy()
+    return mask
+
+
+def trim_silence(pcm: bytes, padding_ms: int = 200) -> bytes:
+    """
+    حذف سکوت ابتدا و انتهای ضبط؛ فقط برای سکوت دیجیتال خروجی خالی است و اگر هیچ فریمی گفتار
+    تشخیص داده نشود ولی ضبط سکوت کامل نباشد، PCM بدون برش برمی‌گردد تا تصمیم با موتور STT باشد
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    energies = frame_energies(samples)
+    voiced = np.flatnonzero(speech_mask(energies))
+    if len(voiced) == 0:
+        return pcm if len(energies) and energies.max() > DIGITAL_SILENCE_LEVEL else b''
+    pad = padding_ms // FRAME_MS
+    start = max(0, voiced[0] - pad) * FRAME_SAMPLES
+    end = min(len(samples), (voiced[-1] + 1 + pad) * FRAME_SAMPLES)
+    return samples[start:end].tobytes()
+
+
+def split_on_silence(pcm: bytes, max_seconds: float = 15.0, min_silence_ms: int = 300) -> List[bytes]:
+    """
+    تقسیم ضبط بلند به بخش‌هایی حداکثر max_seconds؛ هر برش در وسط طولانی‌ترین سکوتِ
+    نزدیک به انتهای بخش انجام می‌شود تا کلمه‌ای نصف نشود.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    max_frames = int(max_seconds * 1000 // FRAME_MS)
+    mask = speech_mask(frame_energies(samples))
+    if len(mask) <= max_frames:
+        return [pcm] if pcm else []
+    min_run = max(1, min_silence_ms // FRAME_MS)
+    # [(شروع، طول)] بازه‌های سکوت به اندازه کافی طولانی
+    silences = []
+    run_start = None
+    for index, voiced in enumerate(np.append(mask, True)):
+        if not voiced and run_start is None:
+            run_start = index
+        elif voiced and run_start is not None:
+            if index - run_start >= min_run:
+                silences.append((run_start, index - run_start))
+            run_start = None
+    segments, start = [], 0
+    while len(mask) - start > max_frames:
+        window = [(length, begin) for begin, length in silences
+                  if start + max_frames // 2 <= begin + length // 2 <= start + max_frames]
+        if window:
+            length, begin = max(window)
+            cut = begin + length // 2
+        else:
+            cut = start + max_frames
+        segments.append(samples[start * FRAME_SAMPLES:cut * FRAME_SAMPLES].tobytes())
+        start = cut
+    segments.append(samples[start * FRAME_SAMPLES:].tobytes())
+    return [segment for segment in segments if segment]
+
+
+def prepare_for_stt(audio: bytes, max_seconds: float = 15.0) -> Tuple[List[bytes], float, float]:
+    """
+    رمزگشایی، حذف سکوت و تقسیم؛ خروجی: (بخش‌های WAV، مدت اصلی، مدت پس از حذف سکوت) به ثانیه.
+    لیست خالی یعنی ضبط گفتاری ندارد.
+    """
+    pcm = decode_pcm16k(audio)
+    trimmed = trim_silence(pcm)
+    segments = [to_wav(segment) for segment in split_on_silence(trimmed, max_seconds)]
+    return segments, len(pcm) / 2 / SAMPLE_RATE, len(trimmed) / 2 / SAMPLE_RATE
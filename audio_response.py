@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+پاسخ‌های صوتی: ارسال صدا از حافظه یا کش محتوامحور با ETag قوی، درخواست‌های شرطی، Range و کش بلندمدت
+Audio responses with strong ETags, conditional and Range requests and immutable caching
+"""
+
+import io
+from typing import Optional
+
+from flask import Response, request, send_file
+
+from tts_cache import AUDIO_MIMETYPES, sniff_extension
+
+# صدای کش محتوامحور است: یک کلید همیشه همان بایت‌ها را دارد، پس می‌توان آن را برای همیشه کش کرد
+AUDIO_MAX_AGE = 365 * 24 * 3600
+
+
+def send_audio(audio_data: bytes, key: Optional[str]) -> Response:
+    """ارسال صدا از حافظه با کلید کش به عنوان ETag، پشتیبانی Range و کش بلندمدت"""
+    extension = sniff_extension(audio_data)
+    response = send_file(io.BytesIO(audio_data), mimetype=AUDIO_MIMETYPES[extension], conditional=True,
+                         etag=key or False, max_age=AUDIO_MAX_AGE, download_name=f'tts.{extension}')
+    response.cache_control.immutable = True
+    return response
+
+
+def not_modified(key: str) -> Response:
+    """پاسخ 304 بدون مراجعه به دیسک؛ ETag برابر یعنی کلاینت همین بایت‌ها را دارد"""
+    response = Response(status=304)
+    response.set_etag(key)
+    response.cache_control.max_age = AUDIO_MAX_AGE
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def send_cached_audio(cache, key: str) -> Optional[Response]:
+    """ارسال فایل کلید key از کش صدا (شرطی و با Range)؛ None اگر در کش نیست"""
+    if key in request.if_none_match:
+        return not_modified(key)
+    path = cache.path(key) if cache is not None else None
+    if path is None or not path.exists():
+        return None
+    response = send_file(path, mimetype=AUDIO_MIMETYPES.get(path.suffix[1:], 'application/octet-stream'),
+                         conditional=True, etag=key, max_age=AUDIO_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+پشتیبان‌گیری افزایشی در پس‌زمینه: snapshot سازگار فایل‌های SQLite با API پشتیبان‌گیری آنلاین،
+manifest فایل‌ها و سگمنت‌ها، ذخیره فشرده محتوامحور (فقط فایل‌های تغییرکرده نوشته می‌شوند)
+و بازیابی با بررسی checksum و integrity_check
+Incremental, content-addressed backups with consistent SQLite snapshots, progress and verified restore
+"""
+
+import os
+import gzip
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK = 1024 * 1024
+SQLITE_HEADER = b'SQLite format 3\x00'
+# فایل‌های جانبی SQLite که محتوای آن‌ها در snapshot آمده است
+SQLITE_SIDECARS = ('-wal', '-shm', '-journal')
+
+
+class BackupError(Exception):
+    """خطای پشتیبان‌گیری یا بازیابی"""
+
+
+def is_sqlite(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+
+def sqlite_snapshot(source: str, target: str):
+    """کپی سازگار پایگاه داده در حال استفاده با API پشتیبان‌گیری آنلاین SQLite"""
+    src = sqlite3.connect(source, timeout=30)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst, pages=1024)
+    finally:
+        dst.close()
+        src.close()
+
+
+def file_digest(path: str) -> Tuple[str, int]:
+    """sha256 و اندازه فایل با خواندن جریانی"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(COPY_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def sqlite_integrity(path: str) -> str:
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+
+
+class BackupJob:
+    """وضعیت و پیشرفت یک کار پشتیبان‌گیری"""
+
+    def __init__(self):
+        self.id = datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        self.status = 'pending'
+        self.phase = ''
+        self.files_total = 0
+        self.files_done = 0
+        self.files_written = 0
+        self.bytes_total = 0
+        self.bytes_written = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.duration_s: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'phase': self.phase,
+            'progress': round(self.files_done / self.files_total, 3) if self.files_total else 0.0,
+            'files_total': self.files_total,
+            'files_done': self.files_done,
+            'files_written': self.files_written,
+            'bytes_total': self.bytes_total,
+            'bytes_written': self.bytes_written,
+            'error': self.error,
+            'duration_s': self.duration_s,
+        }
+
+
+class BackupManager:
+    """
+    هر پشتیبان یک manifest (manifests/<id>.json) است که برای هر فایل اندازه، mtime و sha256 را
+    ثبت می‌کند و محتوا در blobs/<sha256>.gz نگه داشته می‌شود. فایلی که اندازه و mtime آن با
+    پشتیبان قبلی یکی است بدون خواندن دوباره از manifest قبلی برداشته می‌شود و blob موجود هرگز
+    دوباره نوشته نمی‌شود؛ پس هر پشتیبان فقط به اندازه تغییرات هزینه دارد. فایل‌های SQLite
+    (از جمله chroma.sqlite3) با API پشتیبان‌گیری آنلاین snapshot می‌شوند و سگمنت‌های دیگر
+    (مثل فایل‌های HNSW کروما) پس از کپی دوباره بررسی می‌شوند تا در حین نوشتن کپی نشده باشند.
+    """
+
+    def __init__(self, backup_dir: str, sources: Dict[str, str], keep: int = None,
+                 maintenance: List[Callable[[], Any]] = None):
+        self.backup_dir = backup_dir
+        self.sources = sources
+        # کارهای نگهداری (مثل حذف گفتگوهای منقضی) که پیش از هر پشتیبان اجرا می‌شوند
+        self.maintenance = list(maintenance or [])
+        self.keep = keep or int(os.getenv('BACKUP_KEEP', 10))
+        self.blob_dir = os.path.join(backup_dir, 'blobs')
+        self.manifest_dir = os.path.join(backup_dir, 'manifests')
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='backup')
+        self._jobs: Dict[str, BackupJob] = {}
+        self._lock = threading.Lock()
+
+    # --- manifests ---
+
+    def manifests(self) -> List[Dict[str, Any]]:
+        """خلاصه پشتیبان‌ها، جدید به قدیم"""
+        if not os.path.isdir(self.manifest_dir):
+            return []
+        result = []
+        for name in os.listdir(self.manifest_dir):
+            if name.endswith('.json'):
+                manifest = self.manifest(name[:-5])
+                result.append({'id': manifest['id'], 'created_at': manifest['created_at'], 'files': len(manifest['files']),
+                               'bytes': manifest['bytes'], 'written_bytes': manifest['written_bytes']})
+        # شناسه فقط تا ثانیه دقیق است؛ ترتیب با زمان ساخت (میکروثانیه)
+        return sorted(result, key=lambda item: item['created_at'], reverse=True)
+
+    def manifest(self, backup_id: str) -> Dict[str, Any]:
+        path = os.path.join(self.manifest_dir, f'{os.path.basename(backup_id)}.json')
+        if not os.path.exists(path):
+            raise BackupError(f'Backup {backup_id} not found')
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _latest_files(self) -> Dict[str, Dict[str, Any]]:
+        manifests = self.manifests()
+        return self.manifest(manifests[0]['id'])['files'] if manifests else {}
+
+    # --- backup ---
+
+    def start(self) -> BackupJob:
+        """شروع پشتیبان‌گیری در پس‌زمینه (کارها به ترتیب و یکی‌یکی اجرا می‌شوند)"""
+        job = BackupJob()
+        with self._lock:
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def job(self, job_id: str) -> Optional[BackupJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _iter_files(self):
+        for name, root in self.sources.items():
+            if os.path.isfile(root):
+                yield f'{name}/{os.path.basename(root)}', root
+            elif os.path.isdir(root):
+                for directory, _, files in os.walk(root):
+                    for filename in sorted(files):
+                        if filename.endswith(SQLITE_SIDECARS):
+                            continue
+                        path = os.path.join(directory, filename)
+                        yield f"{name}/{os.path.relpath(path, root).replace(os.sep, '/')}", path
+
+    def _run(self, job: BackupJob):
+        job.status = 'running'
+        start = time.perf_counter()
+        try:
+            os.makedirs(self.blob_dir, exist_ok=True)
+            os.makedirs(self.manifest_dir, exist_ok=True)
+            previous = self._latest_files()
+            job.phase = 'maintenance'
+            for task in self.maintenance:
+                try:
+                    task()
+                except Exception as e:
+                    logger.error(f"Backup maintenance task {getattr(task, '__name__', task)} failed: {e}")
+            job.phase = 'scan'
+            files = list(self._iter_files())
+            job.files_total = len(files)
+            entries = {}
+            job.phase = 'copy'
+            for name, path in files:
+                entry = self._backup_file(job, path, previous.get(name))
+                if entry:
+                    entries[name] = entry
+                    job.bytes_total += entry['size']
+                job.files_done += 1
+            manifest = {
+                'id': job.id,
+                'created_at': datetime.now().isoformat(),
+                'sources': {name: 'file' if os.path.isfile(root) else 'dir' for name, root in self.sources.items()
+                            if os.path.exists(root)},
+                'files': entries,
+                'bytes': job.bytes_total,
+                'written_bytes': job.bytes_written,
+            }
+            tmp_path = os.path.join(self.manifest_dir, f'{job.id}.json.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, os.path.join(self.manifest_dir, f'{job.id}.json'))
+            job.phase = 'prune'
+            self._prune()
+            job.status = 'done'
+        except Exception as e:
+            logger.error(f"Backup {job.id} failed: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        job.phase = ''
+        job.duration_s = round(time.perf_counter() - start, 2)
+
+    def _backup_file(self, job: BackupJob, path: str, previous: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        sqlite = is_sqlite(path)
+        # SQLite ممکن است بدون تغییر mtime فایل اصلی در WAL نوشته باشد، پس همیشه snapshot می‌شود
+        if previous and not sqlite and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns \
+                and os.path.exists(self._blob_path(previous['sha256'])):
+            return previous
+        if sqlite:
+            fd, snapshot = tempfile.mkstemp(suffix='.sqlite3', dir=self.backup_dir)
+            os.close(fd)
+            try:
+                sqlite_snapshot(path, snapshot)
+                entry = self._store(job, snapshot)
+            finally:
+                os.remove(snapshot)
+            entry['sqlite'] = True
+        else:
+            for _ in range(3):
+                entry = self._store(job, path)
+                after = os.stat(path)
+                if entry and (after.st_size, after.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                    break
+                stat = after  # سگمنت در حین کپی تغییر کرد؛ دوباره
+            else:
+                raise BackupError(f'{path} kept changing during backup')
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return entry
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, f'{digest}.gz')
+
+    def _store(self, job: BackupJob, path: str) -> Optional[Dict[str, Any]]:
+        """
+        محاسبه sha256 و نوشتن جریانی نسخه فشرده فقط اگر blob آن وجود ندارد؛ None اگر محتوا
+        در حین فشرده‌سازی تغییر کرد
+        """
+        sha256, size = file_digest(path)
+        blob_path = self._blob_path(sha256)
+        if os.path.exists(blob_path):
+            return {'size': size, 'sha256': sha256}
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(suffix='.gz.tmp', dir=self.blob_dir)
+        try:
+            with open(path, 'rb') as src, os.fdopen(fd, 'wb') as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0) as dst:
+                while True:
+                    chunk = src.read(COPY_CHUNK)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dst.write(chunk)
+            if digest.hexdigest() != sha256:
+                os.remove(tmp_path)
+                return None
+            os.replace(tmp_path, blob_path)
+            job.files_written += 1
+            job.bytes_written += os.path.getsize(blob_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return {'size': size, 'sha256': sha256}
+
+    def _prune(self):
+        """نگه داشتن keep پشتیبان آخر و حذف blobهای بدون ارجاع"""
+        manifests = self.manifests()
+        for old in manifests[self.keep:]:
+            os.remove(os.path.join(self.manifest_dir, f"{old['id']}.json"))
+        referenced = {entry['sha256'] for summary in manifests[:self.keep]
+                      for entry in self.manifest(summary['id'])['files'].values()}
+        for name in os.listdir(self.blob_dir):
+            if name.endswith('.gz') and name[:-3] not in referenced:
+                os.remove(os.path.join(self.blob_dir, name))
+
+    # --- restore ---
+
+    def restore(self, backup_id: str, source: str, target: str) -> Dict[str, Any]:
+        """
+        بازسازی منبع source (نام آن در sources) از پشتیبان backup_id در target؛ هر فایل هنگام
+        باز کردن با sha256 و فایل‌های SQLite با integrity_check بررسی می‌شوند. برای دایرکتوری‌ها
+        target باید وجود نداشته باشد؛ بازیابی در دایرکتوری موقت انجام و در پایان جابه‌جا می‌شود.
+        """
+        manifest = self.manifest(backup_id)
+        files = {name: entry for name, entry in manifest['files'].items() if name.split('/', 1)[0] == source}
+        if not files:
+            raise BackupError(f'Backup {backup_id} has no files for {source}')
+        single_file = manifest['sources'].get(source) == 'file'
+        if not single_file and os.path.exists(target):
+            raise BackupError(f'Restore target {target} already exists')
+        staging = tempfile.mkdtemp(prefix='.restore-', dir=os.path.dirname(os.path.abspath(target)))
+        try:
+            for name, entry in files.items():
+                path = os.path.join(staging, *name.split('/')[1:])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._extract(entry, path)
+                if entry.get('sqlite'):
+                    result = sqlite_integrity(path)
+                    if result != 'ok':
+                        raise BackupError(f'{name} failed integrity check: {result}')
+            if single_file:
+                os.replace(os.path.join(staging, *next(iter(files)).split('/')[1:]), target)
+                shutil.rmtree(staging)
+            else:
+                os.replace(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return {'backup': backup_id, 'source': source, 'target': target, 'files': len(files),
+                'bytes': sum(entry['size'] for entry in files.values())}
+
+    def restore_sqlite(self, backup_id: str, source: str, target: str) -> Dict[str, Any]:
+        """
+        بازیابی یک پایگاه داده SQLite در حال استفاده: نسخه بررسی‌شده در فایل موقت باز و سپس با
+        API پشتیبان‌گیری آنلاین درون target نوشته می‌شود، پس اتصال‌های باز برنامه معتبر می‌مانند.
+        """
+        entries = [entry for name, entry in self.manifest(backup_id)['files'].items()
+                   if name.split('/', 1)[0] == source]
+        if not entries or not all(entry.get('sqlite') for entry in entries):
+            raise BackupError(f'Backup {backup_id} has no SQLite database for {source}')
+        staging = tempfile.mkdtemp(prefix='.restore-', dir=os.path.dirname(os.path.abspath(target)))
+        try:
+            restored = os.path.join(staging, os.path.basename(target))
+            result = self.restore(backup_id, source, restored)
+            sqlite_snapshot(restored, target)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return {**result, 'target': target}
+
+    def _extract(self, entry: Dict[str, Any], path: str):
+        blob_path = self._blob_path(entry['sha256'])
+        if not os.path.exists(blob_path):
+            raise BackupError(f"Missing blob {entry['sha256']}")
+        digest = hashlib.sha256()
+        with gzip.open(blob_path, 'rb') as src, open(path, 'wb') as dst:
+            while True:
+                chunk = src.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+        if digest.hexdigest() != entry['sha256']:
+            raise BackupError(f'Checksum mismatch for {path}')
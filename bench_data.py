@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تولید داده مصنوعی برای بنچمارک: فهرست پزشکان در مقیاس میلیونی (Parquet/CSV، تکه‌تکه و برداری)
+و پیکره اسناد پزشکی فارسی برای هر پزشک؛ همه خروجی‌ها با seed تکرارپذیرند
+Seeded, chunked synthetic doctor tables and Persian medical document corpora for offline benchmarks
+
+نمونه اجرا:
+    python bench_data.py doctors --rows 2000000 --out bench/doctors.parquet
+    python bench_data.py corpus --doctors 1000 --docs-per-doctor 5 --out bench/corpus
+    python bench_data.py corpus --doctors 3 --layout folders --out Med_doc_bench
+
+بنچمارک ایندکس پزشکان روی خروجی:
+    DoctorDirectory('bench/doctors.parquet')  و  DoctorIndex(directory, 'bench/doctor_index')
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from generate_excel import random_doctors, SPECIALTIES, INTERESTS
+from doctor_directory import SPECIALTY_KEYWORDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+DEFAULT_SEED = 1403
+
+# قالب جمله‌ها؛ {term} واژه رشته، {symptom} علامت، {treatment} درمان، {duration} مدت و {interest} علاقمندی پزشک
+SENTENCE_TEMPLATES = [
+    'بیمارانی که با شکایت {symptom} مراجعه می‌کنند باید از نظر {term} بررسی شوند.',
+    'در صورت تداوم {symptom} بیش از {duration}، مراجعه به متخصص ضروری است.',
+    'درمان اولیه {term} معمولاً شامل {treatment} است.',
+    'پیگیری منظم پس از {treatment} احتمال عود {term} را کاهش می‌دهد.',
+    'مطالعات اخیر در زمینه {interest} نقش {term} را در بروز {symptom} نشان داده‌اند.',
+    'برای تشخیص دقیق {term}، شرح حال کامل و معاینه بالینی لازم است.',
+    '{symptom} در کودکان و سالمندان ممکن است نشانه {term} باشد.',
+    'رعایت رژیم غذایی مناسب و {treatment} در کنترل {term} مؤثر است.',
+    'در موارد اورژانسی، {symptom} شدید نیازمند مراجعه فوری به بیمارستان است.',
+    'استفاده خودسرانه از دارو در درمان {term} توصیه نمی‌شود.',
+]
+SYMPTOMS = ['درد', 'تب', 'سرگیجه', 'تنگی نفس', 'خستگی مزمن', 'تهوع', 'بی‌خوابی', 'تورم', 'خارش', 'ضعف عمومی',
+            'کاهش وزن', 'سرفه', 'تپش قلب', 'سردرد', 'درد مفاصل']
+TREATMENTS = ['دارودرمانی', 'فیزیوتراپی', 'تغییر سبک زندگی', 'جراحی کم‌تهاجمی', 'پایش دوره‌ای',
+              'مشاوره تغذیه', 'ورزش منظم', 'استراحت کافی', 'آزمایش‌های تکمیلی']
+DURATIONS = ['دو روز', 'یک هفته', 'دو هفته', 'یک ماه', 'سه ماه']
+TITLE_TEMPLATES = ['راهنمای بیماران {term}', 'نکات مهم درباره {term}', 'پرسش‌های رایج در {term}',
+                   'مراقبت‌های پس از درمان {term}', 'آشنایی با {term}']
+
+
+def doctor_chunk(seed: int, chunk_index: int, rows: int, first_id: int) -> pd.DataFrame:
+    """تکه chunk_index جدول پزشکان با جریان تصادفی مستقل [seed، chunk_index]"""
+    frame = random_doctors(rows, np.random.default_rng([seed, chunk_index]))
+    frame.insert(0, 'شناسه', np.arange(first_id, first_id + rows, dtype=np.int64))
+    return frame
+
+
+def write_doctors(out: str, rows: int, chunk_rows: int = 250_000, fmt: str = None, seed: int = DEFAULT_SEED):
+    """نوشتن rows پزشک به صورت تکه‌های chunk_rows ردیفی؛ حافظه مصرفی مستقل از rows است"""
+    fmt = fmt or ('csv' if out.endswith('.csv') else 'parquet')
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        raise RuntimeError('pyarrow is required for Parquet output (use --format csv)')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    tmp_path = f'{out}.tmp'
+    writer = None
+    start = time.perf_counter()
+    try:
+        for chunk_index, first in enumerate(range(0, rows, chunk_rows)):
+            frame = doctor_chunk(seed, chunk_index, min(chunk_rows, rows - first), first + 1)
+            if fmt == 'parquet':
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression='zstd')
+                writer.write_table(table)
+            else:
+                frame.to_csv(tmp_path, mode='w' if first == 0 else 'a', header=first == 0, index=False)
+            print(f'  {first + len(frame):,}/{rows:,} rows', file=sys.stderr)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, out)
+    return {'path': out, 'rows': rows, 'format': fmt, 'seed': seed, 'chunk_rows': chunk_rows,
+            'seconds': round(time.perf_counter() - start, 2)}
+
+
+def synthesize_documents(rng: np.random.Generator, specialty: str, docs: int, sentences: int) -> list:
+    """docs سند فارسی برای یک رشته؛ انتخاب قالب‌ها و واژه‌ها برای همه جمله‌ها یک‌جا و برداری انجام می‌شود"""
+    terms = [specialty] + SPECIALTY_KEYWORDS.get(specialty, [])
+    total = docs * sentences
+    picks = {
+        'template': rng.integers(0, len(SENTENCE_TEMPLATES), total),
+        'term': rng.integers(0, len(terms), total),
+        'symptom': rng.integers(0, len(SYMPTOMS), total),
+        'treatment': rng.integers(0, len(TREATMENTS), total),
+        'duration': rng.integers(0, len(DURATIONS), total),
+        'interest': rng.integers(0, len(INTERESTS), total),
+    }
+    lines = [SENTENCE_TEMPLATES[t].format(term=terms[a], symptom=SYMPTOMS[b], treatment=TREATMENTS[c],
+                                          duration=DURATIONS[d], interest=INTERESTS[e])
+             for t, a, b, c, d, e in zip(*picks.values())]
+    titles = rng.integers(0, len(TITLE_TEMPLATES), docs)
+    documents = []
+    for index in range(docs):
+        body = lines[index * sentences:(index + 1) * sentences]
+        # پاراگراف‌های چهار جمله‌ای تا splitter متن واقعی‌تری ببیند
+        paragraphs = [' '.join(body[i:i + 4]) for i in range(0, len(body), 4)]
+        documents.append({'title': TITLE_TEMPLATES[titles[index]].format(term=specialty), 'text': '\n\n'.join(paragraphs)})
+    return documents
+
+
+def table_specialties(table: str, doctors: int) -> list:
+    """رشته تخصصی doctors پزشک اول یک جدول تولیدشده با write_doctors"""
+    columns = ['رشته تخصصی']
+    if table.endswith('.csv'):
+        frame = pd.read_csv(table, usecols=columns, nrows=doctors)
+    else:
+        frame = pd.read_parquet(table, columns=columns).head(doctors)
+    return frame['رشته تخصصی'].astype(str).tolist()
+
+
+def write_corpus(out: str, doctors: int, docs_per_doctor: int = 5, sentences: int = 40,
+                 layout: str = 'jsonl', shard_doctors: int = 1000, seed: int = DEFAULT_SEED, table: str = None):
+    """
+    پیکره اسناد: برای پزشک i (هم‌شناسه با ردیف i جدول پزشکان) docs_per_doctor سند در رشته او.
+    رشته‌ها از table (خروجی write_doctors) خوانده می‌شوند و در نبود آن تصادفی و با همان seed هستند.
+    layout=jsonl: فایل‌های shard-NNNNN.jsonl؛ layout=folders: ساختار Med_doc (پوشه هر پزشک و فایل‌های .txt).
+    """
+    os.makedirs(out, exist_ok=True)
+    start = time.perf_counter()
+    if table:
+        specialties = table_specialties(table, doctors)
+        doctors = len(specialties)
+    else:
+        specialties = [SPECIALTIES[code] for code in
+                       np.random.default_rng([seed, 0]).integers(0, len(SPECIALTIES), doctors)]
+    shard, shard_file = None, None
+    characters = 0
+    try:
+        for doctor in range(doctors):
+            doctor_id = f'doctor_{doctor + 1:07d}'
+            specialty = specialties[doctor]
+            documents = synthesize_documents(np.random.default_rng([seed, 1, doctor + 1]), specialty,
+                                             docs_per_doctor, sentences)
+            if layout == 'folders':
+                folder = os.path.join(out, doctor_id)
+                os.makedirs(folder, exist_ok=True)
+                for index, document in enumerate(documents):
+                    with open(os.path.join(folder, f'doc_{index + 1:03d}.txt'), 'w', encoding='utf-8') as f:
+                        f.write(f"{document['title']}\n\n{document['text']}\n")
+            else:
+                if doctor // shard_doctors != shard:
+                    if shard_file:
+                        shard_file.close()
+                    shard = doctor // shard_doctors
+                    shard_file = open(os.path.join(out, f'shard-{shard:05d}.jsonl'), 'w', encoding='utf-8')
+                for index, document in enumerate(documents):
+                    shard_file.write(json.dumps({'doctor': doctor_id, 'doc_id': f'{doctor_id}/{index + 1:03d}',
+                                                 'specialty': specialty, **document}, ensure_ascii=False) + '\n')
+            characters += sum(len(document['text']) for document in documents)
+    finally:
+        if shard_file:
+            shard_file.close()
+    return {'path': out, 'doctors': doctors, 'documents': doctors * docs_per_doctor, 'characters': characters,
+            'layout': layout, 'seed': seed, 'seconds': round(time.perf_counter() - start, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate seeded synthetic doctor tables and Persian document corpora.')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    doctors = commands.add_parser('doctors', help='doctor table in Parquet or CSV')
+    doctors.add_argument('--rows', type=int, default=1_000_000)
+    doctors.add_argument('--chunk-rows', type=int, default=250_000)
+    doctors.add_argument('--format', choices=['parquet', 'csv'], help='default: from the --out extension')
+    doctors.add_argument('--out', default='bench/doctors.parquet')
+
+    corpus = commands.add_parser('corpus', help='Persian medical documents for each doctor')
+    corpus.add_argument('--doctors', type=int, default=1000)
+    corpus.add_argument('--docs-per-doctor', type=int, default=5)
+    corpus.add_argument('--sentences', type=int, default=40, help='sentences per document')
+    corpus.add_argument('--layout', choices=['jsonl', 'folders'], default='jsonl')
+    corpus.add_argument('--shard-doctors', type=int, default=1000, help='doctors per JSONL shard')
+    corpus.add_argument('--table', help='doctor table from the doctors command to take specialties from')
+    corpus.add_argument('--out', default='bench/corpus')
+    args = parser.parse_args(argv)
+
+    if args.command == 'doctors':
+        report = write_doctors(args.out, args.rows, args.chunk_rows, args.format, args.seed)
+        manifest_path = f'{args.out}.manifest.json'
+    else:
+        report = write_corpus(args.out, args.doctors, args.docs_per_doctor, args.sentences,
+                              args.layout, args.shard_doctors, args.seed, args.table)
+        manifest_path = os.path.join(args.out, 'manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ذخیره‌ساز سمت سرور تاریخچه گفتگو: فقط شناسه جلسه در کوکی، پیام‌ها در SQLite (یا حافظه)
+با افزودن بدون بازخوانی، صفحه‌بندی تاریخچه و خواندن فقط نوبت‌های خلاصه‌نشده برای حافظه گفتگو
+Server-side chat history store (SQLite by default, pluggable) with append-only writes and paginated reads
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from typing import Dict, Any, List, Tuple, Callable
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CHAT_STORE = f"sqlite:///{os.path.join(BASE_DIR, 'chat_history.sqlite3')}"
+# گفتگوهایی که این مدت (روز) بدون پیام جدید مانده‌اند حذف می‌شوند؛ 0 یعنی نگهداری نامحدود
+CHAT_RETENTION_DAYS = float(os.getenv('CHAT_RETENTION_DAYS', 30))
+
+# فیلدهایی که ستون جداگانه دارند؛ بقیه فیلدهای پیام در ستون extra به صورت JSON
+MESSAGE_FIELDS = ('type', 'speaker', 'text', 'audio_url', 'timestamp')
+
+
+def has_text(message: Dict[str, Any]) -> bool:
+    """پیام‌های دارای متن نوبت‌های گفتگو برای حافظه هستند (پیام صوتی بدون متن نه)"""
+    return bool(message.get('text'))
+
+
+class ChatStore:
+    """رابط ذخیره‌ساز گفتگو"""
+
+    def __init__(self):
+        self._removed_subscribers: List[Callable[[List[str]], None]] = []
+
+    def subscribe_removed(self, callback: Callable[[List[str]], None]):
+        """ثبت مشترکی که پس از clear/purge با audio_url پیام‌های حذف‌شده فراخوانی می‌شود"""
+        self._removed_subscribers.append(callback)
+
+    def _notify_removed(self, audio_urls: List[str]):
+        if not audio_urls:
+            return
+        for callback in list(self._removed_subscribers):
+            try:
+                callback(audio_urls)
+            except Exception as e:
+                logger.error(f"Chat store removal subscriber failed: {e}")
+
+    def append(self, sid: str, message: Dict[str, Any]) -> int:
+        """افزودن پیام و برگرداندن شناسه آن"""
+        raise NotImplementedError
+
+    def page(self, sid: str, before: int = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], bool]:
+        """limit پیام قبل از شناسه before (یا آخرین پیام‌ها)، قدیمی به جدید، و وجود پیام‌های قدیمی‌تر"""
+        raise NotImplementedError
+
+    def text_turns(self, sid: str, since: int = 0) -> List[Dict[str, Any]]:
+        """پیام‌های متنی از نوبت شماره since به بعد"""
+        raise NotImplementedError
+
+    def memory(self, sid: str) -> Dict[str, Any]:
+        """وضعیت حافظه گفتگو: {'summary': ..., 'upto': ...}"""
+        raise NotImplementedError
+
+    def set_memory(self, sid: str, state: Dict[str, Any], expected_upto: int) -> bool:
+        """ذخیره وضعیت حافظه اگر از زمان خواندن تغییر نکرده باشد (جلوگیری از ادغام دوباره)"""
+        raise NotImplementedError
+
+    def clear(self, sid: str):
+        raise NotImplementedError
+
+    def purge(self, older_than: float) -> int:
+        """حذف گفتگوهایی که آخرین پیامشان پیش از زمان older_than (epoch) است؛ تعداد گفتگوهای حذف‌شده"""
+        raise NotImplementedError
+
+    def purge_expired(self, days: float = None) -> int:
+        """اعمال سیاست نگهداری CHAT_RETENTION_DAYS"""
+        days = CHAT_RETENTION_DAYS if days is None else days
+        if days <= 0:
+            return 0
+        removed = self.purge(time.time() - days * 86400)
+        if removed:
+            logger.info(f"Purged {removed} chat sessions older than {days:g} days")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryChatStore(ChatStore):
+    """ذخیره‌ساز درون حافظه برای توسعه و اجرای تک‌فرآیندی"""
+
+    def __init__(self):
+        super().__init__()
+        self._messages: Dict[str, List[Dict[str, Any]]] = {}
+        self._turns: Dict[str, List[int]] = {}
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._updated: Dict[str, float] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def append(self, sid, message):
+        with self._lock:
+            message_id = self._next_id
+            self._next_id += 1
+            messages = self._messages.setdefault(sid, [])
+            if has_text(message):
+                self._turns.setdefault(sid, []).append(len(messages))
+            messages.append({**message, 'id': message_id})
+            self._updated[sid] = time.time()
+            return message_id
+
+    def page(self, sid, before=None, limit=50):
+        with self._lock:
+            messages = self._messages.get(sid, [])
+            end = len(messages) if before is None else \
+                next((i for i in range(len(messages) - 1, -1, -1) if messages[i]['id'] < before), -1) + 1
+            start = max(0, end - limit)
+            return [dict(m) for m in messages[start:end]], start > 0
+
+    def text_turns(self, sid, since=0):
+        with self._lock:
+            messages = self._messages.get(sid, [])
+            return [dict(messages[i]) for i in self._turns.get(sid, [])[since:]]
+
+    def memory(self, sid):
+        with self._lock:
+            return dict(self._memory.get(sid) or {'summary': '', 'upto': 0})
+
+    def set_memory(self, sid, state, expected_upto):
+        with self._lock:
+            if (self._memory.get(sid) or {}).get('upto', 0) != expected_upto:
+                return False
+            self._memory[sid] = dict(state)
+            return True
+
+    def clear(self, sid):
+        with self._lock:
+            messages = self._messages.pop(sid, None) or []
+            self._turns.pop(sid, None)
+            self._memory.pop(sid, None)
+            self._updated.pop(sid, None)
+        self._notify_removed([m['audio_url'] for m in messages if m.get('audio_url')])
+
+    def purge(self, older_than):
+        with self._lock:
+            expired = [sid for sid, updated in self._updated.items() if updated < older_than]
+        for sid in expired:
+            self.clear(sid)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'sessions': len(self._messages),
+                    'messages': sum(len(m) for m in self._messages.values())}
+
+
+class SQLiteChatStore(ChatStore):
+    """
+    جدول messages با ستون‌های فشرده و شماره نوبت متنی (turn) برای هر پیام دارای متن؛ جدول
+    sessions شمارنده نوبت‌ها و وضعیت حافظه گفتگو را نگه می‌دارد. افزودن یک INSERT در تراکنش
+    کوتاه است و خواندن‌ها از ایندکس (sid, id) و (sid, turn) استفاده می‌کنند، پس هزینه هر درخواست
+    به طول گفتگو وابسته نیست. هر نخ اتصال خودش را دارد (حالت WAL).
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            turns INTEGER NOT NULL DEFAULT 0,
+            summary TEXT NOT NULL DEFAULT '',
+            upto INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sid TEXT NOT NULL,
+            turn INTEGER,
+            type TEXT,
+            speaker TEXT,
+            text TEXT,
+            audio_url TEXT,
+            timestamp TEXT,
+            extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_sid_id ON messages (sid, id);
+        CREATE INDEX IF NOT EXISTS idx_messages_sid_turn ON messages (sid, turn) WHERE turn IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at);
+    '''
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_message(row: sqlite3.Row) -> Dict[str, Any]:
+        message = {'id': row['id']}
+        for field in MESSAGE_FIELDS:
+            if row[field] is not None:
+                message[field] = row[field]
+        if row['extra']:
+            message.update(json.loads(row['extra']))
+        return message
+
+    def append(self, sid, message):
+        extra = {key: value for key, value in message.items() if key not in MESSAGE_FIELDS and key != 'id'}
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT INTO sessions (sid, updated_at) VALUES (?, ?) '
+                         'ON CONFLICT(sid) DO UPDATE SET updated_at = excluded.updated_at', (sid, time.time()))
+            turn = None
+            if has_text(message):
+                conn.execute('UPDATE sessions SET turns = turns + 1 WHERE sid = ?', (sid,))
+                turn = conn.execute('SELECT turns FROM sessions WHERE sid = ?', (sid,)).fetchone()[0] - 1
+            cursor = conn.execute(
+                'INSERT INTO messages (sid, turn, type, speaker, text, audio_url, timestamp, extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (sid, turn, *(message.get(field) for field in MESSAGE_FIELDS),
+                 json.dumps(extra, ensure_ascii=False) if extra else None))
+            conn.execute('COMMIT')
+            return cursor.lastrowid
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def page(self, sid, before=None, limit=50):
+        rows = self._connection().execute(
+            'SELECT * FROM messages WHERE sid = ? AND id < ? ORDER BY id DESC LIMIT ?',
+            (sid, before if before is not None else 2 ** 62, limit + 1)).fetchall()
+        return [self._to_message(row) for row in reversed(rows[:limit])], len(rows) > limit
+
+    def text_turns(self, sid, since=0):
+        rows = self._connection().execute(
+            'SELECT * FROM messages WHERE sid = ? AND turn >= ? ORDER BY turn', (sid, since)).fetchall()
+        return [self._to_message(row) for row in rows]
+
+    def memory(self, sid):
+        row = self._connection().execute('SELECT summary, upto FROM sessions WHERE sid = ?', (sid,)).fetchone()
+        return {'summary': row['summary'], 'upto': row['upto']} if row else {'summary': '', 'upto': 0}
+
+    def set_memory(self, sid, state, expected_upto):
+        cursor = self._connection().execute(
+            'UPDATE sessions SET summary = ?, upto = ? WHERE sid = ? AND upto = ?',
+            (state.get('summary', ''), state.get('upto', 0), sid, expected_upto))
+        return cursor.rowcount > 0
+
+    def clear(self, sid):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            audio_urls = [row[0] for row in conn.execute(
+                'SELECT audio_url FROM messages WHERE sid = ? AND audio_url IS NOT NULL', (sid,))]
+            conn.execute('DELETE FROM messages WHERE sid = ?', (sid,))
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._notify_removed(audio_urls)
+
+    def purge(self, older_than):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            expired = 'SELECT sid FROM sessions WHERE updated_at < ?'
+            audio_urls = [row[0] for row in conn.execute(
+                f'SELECT audio_url FROM messages WHERE sid IN ({expired}) AND audio_url IS NOT NULL', (older_than,))]
+            conn.execute(f'DELETE FROM messages WHERE sid IN ({expired})', (older_than,))
+            removed = conn.execute('DELETE FROM sessions WHERE updated_at < ?', (older_than,)).rowcount
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._notify_removed(audio_urls)
+        return removed
+
+    def stats(self):
+        conn = self._connection()
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'sessions': conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0],
+            'last_message_id': conn.execute('SELECT MAX(id) FROM messages').fetchone()[0] or 0,
+        }
+
+
+def create_chat_store(spec: str = None) -> ChatStore:
+    """
+    ساخت ذخیره‌ساز از روی CHAT_STORE:
+        sqlite:///path/to/file.sqlite3 (پیش‌فرض) | memory
+    """
+    spec = spec or os.getenv('CHAT_STORE', DEFAULT_CHAT_STORE)
+    if spec == 'memory':
+        return MemoryChatStore()
+    if spec.startswith('sqlite:///'):
+        return SQLiteChatStore(spec[len('sqlite:///'):])
+    raise ValueError(f'Unsupported CHAT_STORE: {spec}')
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+حافظه محدود گفتگو با خلاصه‌سازی تدریجی
+Bounded conversation memory: last N turns verbatim + rolling summary of older turns
+"""
+
+import logging
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SPEAKER_LABELS = {'user': 'بیمار', 'bot': 'دستیار'}
+
+SUMMARY_PROMPT = (
+    "خلاصه فعلی گفتگوی بیمار و دستیار پزشکی:\n{summary}\n\n"
+    "پیام‌های جدید:\n{turns}\n\n"
+    "خلاصه را با اطلاعات پیام‌های جدید به‌روزرسانی کن. علائم، داروها، دوزها و سوالات باز را حفظ کن. "
+    "حداکثر {max_words} کلمه. فقط متن خلاصه را بنویس."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """تخمین تقریبی تعداد توکن (حدود ۴ کاراکتر برای هر توکن)"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def truncate_tokens(text: str, budget: int, keep: str = 'head') -> str:
+    """کوتاه کردن متن به بودجه توکن؛ keep='tail' انتهای متن را نگه می‌دارد"""
+    max_chars = budget * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] if keep == 'head' else text[-max_chars:]
+
+
+class ConversationMemory:
+    """
+    نگهداری N نوبت آخر به صورت کامل و ادغام نوبت‌های قدیمی‌تر در یک خلاصه تدریجی.
+    وضعیت (متن خلاصه و تعداد نوبت‌های خلاصه‌شده) بیرون از کلاس و در ذخیره‌ساز گفتگو نگه داشته می‌شود،
+    بنابراین اندازه prompt در هر نوبت مستقل از طول گفتگو ثابت می‌ماند. offset شماره نوبت متنی
+    اولین پیام chat_history است تا فقط نوبت‌های خلاصه‌نشده از ذخیره‌ساز خوانده شوند.
+    """
+
+    def __init__(self, max_turns: int = 6, fold_batch: int = 4, summary_token_budget: int = 300,
+                 history_token_budget: int = 600, query_token_budget: int = 96):
+        self.max_turns = max_turns
+        self.fold_batch = fold_batch
+        self.summary_token_budget = summary_token_budget
+        self.history_token_budget = history_token_budget
+        self.query_token_budget = query_token_budget
+
+    @staticmethod
+    def _text_turns(chat_history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [m for m in chat_history if m.get('text')]
+
+    @staticmethod
+    def _format_turn(message: Dict[str, Any], budget: int) -> str:
+        label = SPEAKER_LABELS.get(message.get('speaker'), message.get('speaker', ''))
+        return f"{label}: {truncate_tokens(message['text'], budget)}"
+
+    def update(self, chat_history: List[Dict[str, Any]], state: Optional[Dict[str, Any]], llm=None,
+               offset: int = 0) -> Dict[str, Any]:
+        """
+        ادغام نوبت‌هایی که از پنجره N نوبت آخر خارج شده‌اند در خلاصه.
+        ادغام به صورت دسته‌ای (fold_batch) انجام می‌شود تا فراخوانی LLM در هر نوبت لازم نباشد.
+        """
+        state = dict(state or {'summary': '', 'upto': 0})
+        turns = self._text_turns(chat_history)
+        fold_until = offset + len(turns) - self.max_turns
+        if fold_until - state['upto'] < self.fold_batch:
+            return state
+        folded = turns[state['upto'] - offset:fold_until - offset]
+        per_turn_budget = max(32, self.summary_token_budget // 2)
+        lines = '\n'.join(self._format_turn(m, per_turn_budget) for m in folded)
+        summary = state['summary']
+        new_summary = None
+        if llm is not None:
+            try:
+                new_summary = llm.invoke(SUMMARY_PROMPT.format(
+                    summary=summary or '-', turns=lines,
+                    max_words=self.summary_token_budget // 2)).strip()
+            except Exception as e:
+                logger.error(f"Conversation summary error: {e}")
+        if not new_summary:
+            # بدون LLM: افزودن نوبت‌ها به خلاصه و نگه داشتن بخش جدیدتر
+            new_summary = truncate_tokens(f"{summary}\n{lines}".strip(), self.summary_token_budget, keep='tail')
+        state['summary'] = truncate_tokens(new_summary, self.summary_token_budget)
+        state['upto'] = fold_until
+        return state
+
+    def recent_history(self, chat_history: List[Dict[str, Any]], state: Optional[Dict[str, Any]] = None,
+                       offset: int = 0) -> str:
+        """نوبت‌های خلاصه‌نشده (حداکثر max_turns + fold_batch) به صورت متن، محدود به بودجه توکن تاریخچه"""
+        upto = (state or {}).get('upto', 0)
+        turns = self._text_turns(chat_history)[max(upto - offset, 0):][-(self.max_turns + self.fold_batch):]
+        per_turn_budget = max(32, self.history_token_budget // max(len(turns), 1))
+        return '\n'.join(self._format_turn(m, per_turn_budget) for m in turns)
+
+    def rewrite_query(self, question: str, chat_history: List[Dict[str, Any]]) -> str:
+        """
+        ساخت پرسش مستقل برای بازیابی: سوالات پیگیری کوتاه ("دوزش چقدر است؟") با
+        آخرین پیام‌های بیمار ترکیب می‌شوند تا اسناد مرتبط بازیابی شوند.
+        """
+        previous = [m['text'] for m in self._text_turns(chat_history) if m.get('speaker') == 'user']
+        if not previous:
+            return question
+        budget = self.query_token_budget - estimate_tokens(question)
+        context = []
+        for text in reversed(previous):
+            if budget <= 0:
+                break
+            context.insert(0, truncate_tokens(text, budget, keep='tail'))
+            budget -= estimate_tokens(context[0])
+        return ' '.join(context + [question])
+
+    def prompt_inputs(self, chat_history: List[Dict[str, Any]], state: Optional[Dict[str, Any]],
+                      offset: int = 0) -> Tuple[str, str]:
+        """خلاصه و تاریخچه اخیر برای قرار گرفتن در prompt"""
+        summary = (state or {}).get('summary') or '-'
+        return summary, self.recent_history(chat_history, state, offset) or '-'
+
+
+conversation_memory = ConversationMemory()
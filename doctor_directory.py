@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+فهرست پزشکان: بارگذاری یک‌باره doctors_data.xlsx در حافظه ستونی و بارگذاری مجدد فقط با تغییر فایل
+Load-once, mtime-invalidated columnar doctor directory shared by the app and the doctorbot blueprint
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from doctors_data import doctors_info
+
+try:
+    import pyarrow  # noqa: F401  (موتور Parquet برای pandas)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DOCTORS_XLSX = os.path.join(BASE_DIR, 'doctors_data.xlsx')
+
+
+class DoctorDirectory:
+    """
+    جدول پزشکان به صورت DataFrame با ستون‌های category (حافظه کم، فیلتر سریع).
+    در اولین بارگذاری یک نسخه Parquet کنار فایل اکسل ساخته می‌شود تا راه‌اندازی‌های بعدی
+    بدون پردازش اکسل انجام شوند؛ امضای (mtime_ns، حجم) منبعی که Parquet از آن ساخته شده در فایل
+    کناری .source ذخیره می‌شود و Parquet فقط با امضای دقیقاً برابر استفاده می‌شود. تغییر زمان یا حجم
+    فایل منبع باعث بارگذاری مجدد می‌شود.
+    """
+
+    def __init__(self, source: str = DOCTORS_XLSX, check_interval: float = 2.0):
+        self.source = source
+        self.parquet_path = os.path.splitext(source)[0] + '.parquet'
+        self.signature_path = self.parquet_path + '.source'
+        self.check_interval = check_interval
+        self._frame: Optional[pd.DataFrame] = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.version = 0
+        self.load_ms = 0.0
+
+    def _source_signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.source)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _parquet_signature(self) -> Optional[Tuple[int, int]]:
+        """امضای منبعی که نسخه Parquet از آن ساخته شده (None اگر ثبت نشده باشد)"""
+        try:
+            with open(self.signature_path, encoding='utf-8') as f:
+                mtime_ns, size = f.read().split()
+            return int(mtime_ns), int(size)
+        except (OSError, ValueError):
+            return None
+
+    def _write_parquet(self, frame: pd.DataFrame, signature: Tuple[int, int]):
+        # امضا پس از Parquet نوشته می‌شود؛ اگر نوشتن نیمه‌کاره بماند امضای قدیمی با منبع جور نیست
+        tmp_path = f'{self.parquet_path}.tmp'
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.parquet_path)
+        tmp_path = f'{self.signature_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f'{signature[0]} {signature[1]}')
+        os.replace(tmp_path, self.signature_path)
+
+    def _read(self, signature: Tuple[int, int]) -> pd.DataFrame:
+        if PARQUET_AVAILABLE and os.path.exists(self.parquet_path) and self._parquet_signature() == signature:
+            return pd.read_parquet(self.parquet_path)
+        if self.source.endswith('.parquet'):
+            return pd.read_parquet(self.source)
+        if self.source.endswith('.csv'):
+            frame = pd.read_csv(self.source)
+        else:
+            frame = pd.read_excel(self.source)
+        for column in frame.columns:
+            if not pd.api.types.is_numeric_dtype(frame[column]):
+                frame[column] = frame[column].astype('category')
+        if PARQUET_AVAILABLE and self.parquet_path != self.source:
+            try:
+                self._write_parquet(frame, signature)
+            except Exception as e:
+                logger.warning(f"Could not write doctor directory Parquet cache: {e}")
+        return frame
+
+    def frame(self) -> pd.DataFrame:
+        """جدول پزشکان (FileNotFoundError اگر فایل منبع وجود نداشته باشد)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._frame is not None and now - self._checked_at < self.check_interval:
+                return self._frame
+            signature = self._source_signature()
+            self._checked_at = now
+            if self._frame is None or signature != self._signature:
+                start = time.perf_counter()
+                self._frame = self._read(signature)
+                self._signature = signature
+                self.version += 1
+                self.load_ms = (time.perf_counter() - start) * 1000
+                logger.info(f"Doctor directory loaded: {len(self._frame)} rows in {self.load_ms:.1f} ms")
+            return self._frame
+
+    @property
+    def signature(self) -> Optional[Tuple[int, int]]:
+        """(mtime_ns، حجم) فایل منبع در آخرین بارگذاری"""
+        return self._signature
+
+    def candidates_text(self, profile: Dict[str, Any], top_n: int = 15) -> str:
+        """متن top_n پزشک مناسب بیمار برای پرامپت LLM"""
+        return select_candidates(self.frame(), profile, top_n).to_string(index=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'source': self.source,
+            'rows': len(self._frame) if self._frame is not None else None,
+            'version': self.version,
+            'load_ms': round(self.load_ms, 1),
+            'parquet': PARQUET_AVAILABLE,
+        }
+
+
+_CHAR_MAP = str.maketrans({'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', '\u200c': ' ', 'ـ': None})
+
+
+def normalize_key(value: Any) -> str:
+    """کلید نرمال: حروف عربی به فارسی، حذف نیم‌فاصله و کشیده، فاصله‌های یکسان و حروف کوچک"""
+    return ' '.join(str(value).translate(_CHAR_MAP).split()).lower()
+
+
+def tokenize(text: Any) -> List[str]:
+    """واژه‌های متن نرمال‌شده (نیم‌فاصله جداکننده است، پس پسوندهایی مثل «ها» واژه جدا می‌شوند)"""
+    return re.findall(r'[\w-]+', normalize_key(text or '').replace('_', '-'))
+
+
+# پسوندهای ضمیری و جمع که به واژه نشانه می‌چسبند (قلبم، سردردهای، کودکش)
+WORD_SUFFIXES = ('', 'م', 'ت', 'ش', 'ی', 'ام', 'ات', 'اش', 'ای', 'مان', 'تان', 'شان', 'ها', 'های', 'هایم', 'هایش')
+
+
+def word_matches(token: str, keyword: str) -> bool:
+    return token.startswith(keyword) and token[len(keyword):] in WORD_SUFFIXES
+
+
+def contains_phrase(tokens: List[str], phrase: Tuple[str, ...]) -> bool:
+    """آیا دنباله واژه‌های phrase به صورت واژه کامل در tokens آمده است"""
+    size = len(phrase)
+    return any(all(word_matches(tokens[start + offset], word) for offset, word in enumerate(phrase))
+               for start in range(len(tokens) - size + 1))
+
+
+# واژه‌های نشانه هر رشته تخصصی در شرح مشکل بیمار
+SPECIALTY_KEYWORDS = {
+    'قلب و عروق': ['قلب', 'فشار خون', 'تپش', 'درد قفسه سینه', 'سینه', 'عروق', 'کلسترول'],
+    'اطفال': ['کودک', 'بچه', 'نوزاد', 'فرزند', 'شیرخوار', 'اطفال'],
+    'پوست و مو': ['پوست', 'مو', 'جوش', 'آکنه', 'اگزما', 'ریزش مو', 'خارش', 'لک'],
+    'اعصاب و روان': ['اعصاب', 'افسردگی', 'اضطراب', 'استرس', 'بی‌خوابی', 'بی خوابی', 'سردرد', 'میگرن', 'روان'],
+    'داخلی': ['معده', 'گوارش', 'کبد', 'تب', 'ضعف', 'خستگی', 'داخلی', 'سرماخوردگی'],
+    'ارتوپدی': ['استخوان', 'زانو', 'کمر', 'شکستگی', 'مفصل', 'ستون فقرات', 'دیسک', 'گردن'],
+    'زنان و زایمان': ['بارداری', 'حاملگی', 'زایمان', 'قاعدگی', 'پریود', 'زنان', 'نازایی'],
+    'گوش و حلق و بینی': ['گوش', 'حلق', 'بینی', 'سینوس', 'لوزه', 'گلودرد', 'گلو', 'شنوایی'],
+    'چشم پزشکی': ['چشم', 'بینایی', 'عینک', 'تاری دید', 'آب مروارید'],
+    'جراحی عمومی': ['جراحی', 'فتق', 'آپاندیس', 'کیسه صفرا', 'توده'],
+    'اورولوژی': ['کلیه', 'ادرار', 'مثانه', 'پروستات', 'سنگ کلیه'],
+    'غدد': ['دیابت', 'قند', 'تیروئید', 'هورمون', 'غدد'],
+    'تغذیه': ['رژیم', 'چاقی', 'لاغری', 'وزن', 'تغذیه'],
+    'فیزیوتراپی': ['فیزیوتراپی', 'توانبخشی', 'کشیدگی', 'آسیب ورزشی', 'گرفتگی عضلات'],
+}
+
+SPECIALTY_PHRASES = {specialty: [tuple(tokenize(keyword)) for keyword in keywords]
+                     for specialty, keywords in SPECIALTY_KEYWORDS.items()}
+
+# نشانه‌های زبان فارسی (مقایسه دقیق واژه‌ها، نه زیررشته)
+PERSIAN_LANGUAGE_TOKENS = {'fa', 'fa-ir', 'fas', 'per', 'farsi', 'persian', 'فارسی'}
+
+# سطح فوریت: 2 بسیار اورژانسی، 1 اورژانسی، 0 عادی
+URGENCY_LEVELS = {'بسیار اورژانسی': 2, 'اورژانسی': 1, 'مهم نیست': -1}
+
+CANDIDATE_COLUMNS = {
+    'specialty': 'رشته تخصصی',
+    'city': 'شهر',
+    'language': 'تسلط به زبان محاوره',
+    'urgency': 'وضعیت بیماران پذیرشی',
+    'rating': 'امتیاز نظرسنجی مشتری (از عدد 10)',
+    'experience': 'سابقه (سال)',
+    'interests': 'ترجیحات و علاقمندیها',
+}
+
+
+def patient_urgency(illness_status: Optional[str]) -> int:
+    status = (illness_status or '').strip()
+    if 'بسیار' in status or 'شدید' in status:
+        return 2
+    if 'اورژانس' in status or 'حاد' in status or 'فوری' in status:
+        return 1
+    return 0
+
+
+def needs_non_persian(language: Optional[str]) -> bool:
+    """آیا بیمار به پزشکی با زبانی غیر از فارسی نیاز دارد"""
+    tokens = tokenize(language)
+    return bool(tokens) and not PERSIAN_LANGUAGE_TOKENS.intersection(tokens)
+
+
+def matched_specialties(problem: str) -> List[str]:
+    """رشته‌هایی که یکی از واژه‌های نشانه آن‌ها به صورت واژه کامل در شرح مشکل آمده است"""
+    tokens = tokenize(problem)
+    return [specialty for specialty, phrases in SPECIALTY_PHRASES.items()
+            if any(contains_phrase(tokens, phrase) for phrase in phrases)]
+
+
+def select_candidates(frame: pd.DataFrame, profile: Dict[str, Any], top_n: int = 15) -> pd.DataFrame:
+    """
+    امتیازدهی برداری ردیف‌ها بر اساس مشخصات بیمار (زبان، شهر، مشکل، فوریت) و انتخاب top_n ردیف برتر.
+    رشته مرتبط با مشکل بیشترین وزن را دارد؛ شهر، زبان و پذیرش فوریت بعد از آن و امتیاز
+    نظرسنجی و سابقه برای شکستن تساوی استفاده می‌شوند.
+    """
+    if len(frame) <= top_n:
+        return frame
+    columns = {key: name for key, name in CANDIDATE_COLUMNS.items() if name in frame.columns}
+    score = np.zeros(len(frame))
+    problem = profile.get('problem') or ''
+
+    if 'specialty' in columns:
+        specialties = matched_specialties(problem)
+        if specialties:
+            score += 10 * frame[columns['specialty']].isin(specialties).to_numpy()
+    if 'interests' in columns and problem:
+        interests = frame[columns['interests']].astype(str).to_numpy()
+        unique = pd.unique(interests)
+        hits = {interest for interest in unique if interest and interest in problem}
+        if hits:
+            score += 2 * np.isin(interests, list(hits))
+    if 'city' in columns and profile.get('city'):
+        score += 4 * (frame[columns['city']].astype(str).str.strip() == profile['city'].strip()).to_numpy()
+    if 'language' in columns and needs_non_persian(profile.get('language')):
+        score += 5 * (frame[columns['language']].astype(str) != 'فقط فارسی').to_numpy()
+    if 'urgency' in columns:
+        urgency = patient_urgency(profile.get('urgency'))
+        accepted = frame[columns['urgency']].astype(str).map(URGENCY_LEVELS).fillna(-1).to_numpy()
+        # 'مهم نیست' (-1) یعنی پذیرش همه سطوح
+        score += 2 * ((accepted == urgency) | (accepted == -1)) + (urgency > 0) * (accepted >= urgency)
+    if 'rating' in columns:
+        score += pd.to_numeric(frame[columns['rating']], errors='coerce').fillna(0).to_numpy() / 10
+    if 'experience' in columns:
+        years = pd.to_numeric(frame[columns['experience']], errors='coerce').fillna(0).to_numpy()
+        score += np.minimum(years, 30) / 30
+
+    top = np.argpartition(-score, top_n - 1)[:top_n]
+    top = top[np.argsort(-score[top], kind='stable')]
+    return frame.iloc[top]
+
+
+# گزینه‌های فرم جستجوی پزشک: (کلید فرم، برچسب فارسی)
+CITIES = [('all', 'همه'), ('tehran', 'تهران'), ('shiraz', 'شیراز'), ('hamedan', 'همدان'), ('mashhad', 'مشهد'), ('isfahan', 'اصفهان'), ('tabriz', 'تبریز'), ('kermanshah', 'کرمانشاه')]
+SPECIALTIES = [('all', 'همه'), ('general', 'پزشک عمومی'), ('cardiologist', 'قلب و عروق'), ('neurologist', 'مغز و اعصاب'), ('pediatrician', 'اطفال'), ('oncologist', 'آنکولوژی')]
+EXPERIENCE_RANGES = [('all', 'همه'), ('1-5', '1 تا 5 سال'), ('5-10', '5 تا 10 سال'), ('10+', 'بیشتر از 10 سال')]
+
+ATTRIBUTE_CHOICES = {'city': CITIES, 'specialty': SPECIALTIES, 'experience': EXPERIENCE_RANGES}
+
+
+def experience_bucket(value: Any) -> Optional[str]:
+    """بازه سابقه ('1-5'، '5-10'، '10+') برای مقدار متنی یا تعداد سال"""
+    key = normalize_key(value)
+    if key in ('1-5', '5-10', '10+'):
+        return key
+    try:
+        years = float(key)
+    except ValueError:
+        return None
+    return '1-5' if years < 5 else '5-10' if years < 10 else '10+'
+
+
+class DoctorAttributeIndex:
+    """
+    ایندکس معکوس پزشکان گفتگو به ازای هر ویژگی (شهر، رشته، سابقه): کلید نرمال ← لیست پزشکان.
+    کلیدهای انگلیسی فرم و برچسب‌های فارسی به یک کلید نرمال می‌رسند. جستجو از کوچک‌ترین
+    لیست شروع و با مجموعه‌های بقیه ویژگی‌ها اشتراک می‌گیرد، پس هزینه آن متناسب با تعداد
+    نتایج است نه حجم فهرست؛ تعداد هر مقدار (facet) هنگام افزودن پزشک به‌روز می‌شود و نتیجه
+    هر ترکیب فیلتر تا تغییر بعدی فهرست نگه داشته می‌شود تا صفحه‌های بعدی دوباره محاسبه نشوند.
+    """
+
+    MAX_CACHED_RESULTS = 256
+
+    def __init__(self, doctors: Dict[str, Dict[str, Any]] = None, choices: Dict[str, List[Tuple[str, str]]] = None):
+        self.choices = choices or ATTRIBUTE_CHOICES
+        self.doctors: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[str, List[str]]] = {attribute: {} for attribute in self.choices}
+        self._sets: Dict[str, Dict[str, set]] = {attribute: {} for attribute in self.choices}
+        self._aliases: Dict[str, Dict[str, str]] = {}
+        self._results: Dict[Tuple, List[str]] = {}
+        for attribute, options in self.choices.items():
+            aliases = {}
+            for key, label in options:
+                if key != 'all':
+                    aliases[normalize_key(key)] = aliases[normalize_key(label)] = normalize_key(label)
+            self._aliases[attribute] = aliases
+        self._lock = threading.Lock()
+        for key, info in (doctors or {}).items():
+            self.add(key, info)
+
+    def canonical(self, attribute: str, value: Any) -> Optional[str]:
+        """کلید نرمال مقدار فرم یا داده؛ None برای 'all' یا مقدار خالی"""
+        if value is None or normalize_key(value) in ('', 'all', 'همه'):
+            return None
+        if attribute == 'experience':
+            return experience_bucket(value) or normalize_key(value)
+        key = normalize_key(value)
+        return self._aliases.get(attribute, {}).get(key, key)
+
+    def keys_for(self, attribute: str, value: Any) -> List[str]:
+        """کلیدهای ایندکس یک مقدار داده؛ رشته‌های ترکیبی زیر هر برچسب شناخته‌شده‌ای که در آن آمده هم ثبت می‌شوند"""
+        key = self.canonical(attribute, value)
+        if key is None:
+            return []
+        keys = [key]
+        if attribute == 'specialty':
+            keys += [label for label in set(self._aliases[attribute].values()) if label != key and label in key]
+        return keys
+
+    def add(self, doctor_key: str, info: Dict[str, Any]):
+        with self._lock:
+            if doctor_key in self.doctors:
+                self._remove(doctor_key)
+            self.doctors[doctor_key] = info
+            self._results.clear()
+            for attribute in self.choices:
+                for key in self.keys_for(attribute, info.get(attribute)):
+                    self._postings[attribute].setdefault(key, []).append(doctor_key)
+                    self._sets[attribute].setdefault(key, set()).add(doctor_key)
+
+    def _remove(self, doctor_key: str):
+        info = self.doctors.pop(doctor_key)
+        for attribute in self.choices:
+            for key in self.keys_for(attribute, info.get(attribute)):
+                self._postings[attribute][key].remove(doctor_key)
+                self._sets[attribute][key].discard(doctor_key)
+
+    def search(self, page: int = 1, per_page: int = 20, **filters) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """
+        ({کلید: اطلاعات} صفحه page، تعداد کل نتایج). filters: city/specialty/experience با کلید
+        انگلیسی فرم یا برچسب فارسی؛ 'all' یا خالی یعنی بدون فیلتر.
+        """
+        page, per_page = max(1, int(page)), max(1, int(per_page))
+        with self._lock:
+            wanted = [(attribute, self.canonical(attribute, value)) for attribute, value in filters.items()
+                      if attribute in self.choices]
+            wanted = tuple(sorted((attribute, key) for attribute, key in wanted if key is not None))
+            matches = self._results.get(wanted)
+            if matches is None:
+                matches = self._intersect(wanted)
+                if len(self._results) >= self.MAX_CACHED_RESULTS:
+                    self._results.pop(next(iter(self._results)))
+                self._results[wanted] = matches
+            start = (page - 1) * per_page
+            return {key: self.doctors[key] for key in matches[start:start + per_page]}, len(matches)
+
+    def _intersect(self, wanted: Tuple) -> List[str]:
+        if not wanted:
+            return list(self.doctors)
+        ordered = sorted(wanted, key=lambda item: len(self._postings[item[0]].get(item[1], ())))
+        first = self._postings[ordered[0][0]].get(ordered[0][1], [])
+        others = [self._sets[attribute].get(key, set()) for attribute, key in ordered[1:]]
+        return [doctor for doctor in first if all(doctor in other for other in others)]
+
+    def facets(self) -> Dict[str, List[Dict[str, Any]]]:
+        """تعداد پزشکان هر گزینه فرم به ازای هر ویژگی"""
+        with self._lock:
+            return {attribute: [{'key': key, 'label': label,
+                                 'count': len(self.doctors) if key == 'all' else
+                                 len(self._postings[attribute].get(self.canonical(attribute, key), []))}
+                                for key, label in options]
+                    for attribute, options in self.choices.items()}
+
+    def __len__(self):
+        return len(self.doctors)
+
+
+# پزشکان دارای اسناد و صفحه گفتگو (doctors_data.py)
+chat_doctor_index = DoctorAttributeIndex(doctors_info)
+
+
+def filter_chat_doctors(city: str = 'all', specialty: str = 'all', experience: str = 'all',
+                        page: int = 1, per_page: int = 20) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """فیلتر پزشکان گفتگو؛ مقدار 'all' یا خالی یعنی بدون فیلتر"""
+    return chat_doctor_index.search(page, per_page, city=city, specialty=specialty, experience=experience)
+
+
+def chat_doctor_choices() -> List[Tuple[str, str]]:
+    """(کلید، نام) پزشکان گفتگو برای فرم‌های انتخاب پزشک"""
+    return [(key, info['name']) for key, info in chat_doctor_index.doctors.items()]
+
+
+doctor_directory = DoctorDirectory()
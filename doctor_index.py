@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ایندکس برداری پروفایل پزشکان برای تطبیق معنایی شرح مشکل بیمار با رشته و علاقمندی‌ها
+Persistent vector index over doctor profiles with top-k search and structured filters
+"""
+
+import os
+import json
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from doctor_directory import (DoctorDirectory, doctor_directory, CANDIDATE_COLUMNS, URGENCY_LEVELS,
+                              needs_non_persian, patient_urgency)
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_DIR = os.path.join(BASE_DIR, 'doctor_index')
+# امتیاز هم‌شهری بودن روی شباهت کسینوسی؛ کوچک تا فقط شباهت‌های نزدیک را جابه‌جا کند
+CITY_BOOST = float(os.getenv('DOCTOR_CITY_BOOST', 0.1))
+
+# ستون‌هایی که متن پروفایل هر پزشک از آن‌ها ساخته می‌شود
+PROFILE_COLUMNS = ['رشته تخصصی', 'ترجیحات و علاقمندیها', 'تحصیلات']
+
+
+def _save_array(path: str, array: np.ndarray):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class DoctorIndex:
+    """
+    بردارهای نرمال‌شده پروفایل‌ها روی دیسک (.npy) و بارگذاری با mmap.
+    پروفایل‌های تکراری (ترکیب یکسان رشته/علاقمندی/تحصیلات) فقط یک بار embed می‌شوند و هر ردیف
+    با یک اندیس به بردار پروفایلش اشاره می‌کند؛ جستجو یک ضرب ماتریس-بردار روی پروفایل‌های یکتا،
+    یک gather روی ردیف‌ها و argpartition است.
+    """
+
+    def __init__(self, directory: DoctorDirectory = doctor_directory, index_dir: str = INDEX_DIR):
+        self.directory = directory
+        self.index_dir = index_dir
+        self.vectors: Optional[np.ndarray] = None   # (پروفایل‌های یکتا، بعد)
+        self.row_profiles: Optional[np.ndarray] = None  # (ردیف‌ها,) اندیس پروفایل
+        self.meta: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._building = False
+        self._features: Tuple[int, Dict[str, Any]] = (0, {})
+
+    @staticmethod
+    def model_name(embedding_model) -> str:
+        return getattr(embedding_model, 'model_name', type(embedding_model).__name__)
+
+    @staticmethod
+    def profile_texts(frame: pd.DataFrame) -> Tuple[List[str], np.ndarray]:
+        """متن‌های یکتای پروفایل و اندیس پروفایل هر ردیف"""
+        columns = [column for column in PROFILE_COLUMNS if column in frame.columns]
+        texts = frame[columns].astype(str).apply(
+            lambda row: '. '.join(f'{column}: {value}' for column, value in zip(columns, row)), axis=1)
+        codes, uniques = pd.factorize(texts)
+        return list(uniques), codes.astype(np.int32)
+
+    def _expected_meta(self, embedding_model) -> Dict[str, Any]:
+        self.directory.frame()
+        return {'source': list(self.directory.signature), 'model': self.model_name(embedding_model)}
+
+    def load(self, embedding_model) -> bool:
+        """بارگذاری ایندکس ذخیره‌شده در صورت سازگاری با فایل منبع و مدل embedding"""
+        meta_path = os.path.join(self.index_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        expected = self._expected_meta(embedding_model)
+        if any(meta.get(key) != value for key, value in expected.items()):
+            return False
+        vectors = np.load(os.path.join(self.index_dir, 'vectors.npy'), mmap_mode='r')
+        row_profiles = np.load(os.path.join(self.index_dir, 'row_profiles.npy'), mmap_mode='r')
+        with self._lock:
+            self.vectors, self.row_profiles, self.meta = vectors, row_profiles, meta
+        return True
+
+    def build(self, embedding_model):
+        """embed کردن پروفایل‌های یکتا و ذخیره اتمیک ایندکس"""
+        frame = self.directory.frame()
+        meta = self._expected_meta(embedding_model)
+        texts, row_profiles = self.profile_texts(frame)
+        vectors = np.asarray(embedding_model.embed_documents(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        os.makedirs(self.index_dir, exist_ok=True)
+        _save_array(os.path.join(self.index_dir, 'vectors.npy'), vectors)
+        _save_array(os.path.join(self.index_dir, 'row_profiles.npy'), row_profiles)
+        meta.update({'rows': len(row_profiles), 'profiles': len(texts), 'dim': int(vectors.shape[1])})
+        tmp_path = os.path.join(self.index_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.index_dir, 'meta.json'))
+        with self._lock:
+            self.vectors, self.row_profiles, self.meta = vectors, row_profiles, meta
+        logger.info(f"Doctor index built: {len(row_profiles)} rows, {len(texts)} unique profiles")
+
+    def ensure(self, embedding_model) -> bool:
+        """آماده بودن ایندکس؛ ایندکس قدیمی یا ناموجود در پس‌زمینه ساخته می‌شود"""
+        self.directory.frame()
+        with self._lock:
+            if self._building:
+                return False
+            current = self.vectors is not None and \
+                self.meta.get('source') == list(self.directory.signature or ()) and \
+                self.meta.get('model') == self.model_name(embedding_model)
+        if current:
+            return True
+        try:
+            if self.load(embedding_model):
+                return True
+        except Exception as e:
+            logger.warning(f"Doctor index load failed, rebuilding: {e}")
+        with self._lock:
+            if self._building:
+                return False
+            self._building = True
+        threading.Thread(target=self._build_in_background, args=(embedding_model,),
+                         name='doctor-index', daemon=True).start()
+        return False
+
+    def _build_in_background(self, embedding_model):
+        try:
+            self.build(embedding_model)
+        except Exception as e:
+            logger.error(f"Doctor index build error: {e}")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def features(self, frame: pd.DataFrame) -> Dict[str, Any]:
+        """آرایه‌های عددی ستون‌های فیلتر؛ برای هر نسخه فهرست یک بار ساخته می‌شوند"""
+        version = self.directory.version
+        if self._features[0] == version:
+            return self._features[1]
+        features = {}
+        city = CANDIDATE_COLUMNS['city']
+        if city in frame.columns:
+            codes, uniques = pd.factorize(frame[city].astype(str).str.strip())
+            features['city_codes'] = codes
+            features['city_lookup'] = {value: code for code, value in enumerate(uniques)}
+        language = CANDIDATE_COLUMNS['language']
+        if language in frame.columns:
+            features['bilingual'] = (frame[language].astype(str) != 'فقط فارسی').to_numpy()
+        urgency = CANDIDATE_COLUMNS['urgency']
+        if urgency in frame.columns:
+            features['accepted_urgency'] = frame[urgency].astype(str).map(URGENCY_LEVELS).fillna(-1).to_numpy()
+        self._features = (version, features)
+        return features
+
+    def filter_mask(self, features: Dict[str, Any], rows: int, profile: Dict[str, Any]) -> np.ndarray:
+        """فیلترهای ساختاری: زبان مورد نیاز بیمار و پذیرش سطح فوریت او"""
+        mask = np.ones(rows, dtype=bool)
+        if 'bilingual' in features and needs_non_persian(profile.get('language')):
+            mask &= features['bilingual']
+        urgency = patient_urgency(profile.get('urgency'))
+        if 'accepted_urgency' in features and urgency > 0:
+            accepted = features['accepted_urgency']
+            mask &= (accepted >= urgency) | (accepted == -1)
+        return mask
+
+    def search(self, query: str, embedding_model, profile: Dict[str, Any] = None, k: int = 5) -> Optional[pd.DataFrame]:
+        """
+        k پزشک با بیشترین شباهت معنایی به query؛ هم‌شهری بودن با بیمار امتیاز کوچک CITY_BOOST می‌گیرد
+        که فقط شباهت‌های نزدیک به هم را جابه‌جا می‌کند و شهر را به فیلتر سخت تبدیل نمی‌کند.
+        اگر فیلترها هیچ ردیفی باقی نگذارند بدون فیلتر جستجو می‌شود. None یعنی ایندکس آماده نیست.
+        """
+        if not self.ensure(embedding_model):
+            return None
+        profile = profile or {}
+        frame = self.directory.frame()
+        with self._lock:
+            vectors, row_profiles = self.vectors, self.row_profiles
+        if len(row_profiles) != len(frame):
+            return None
+        q = np.asarray(embedding_model.embed_query(query), dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+        scores = (vectors @ q)[row_profiles]
+        features = self.features(frame)
+        city_code = features.get('city_lookup', {}).get((profile.get('city') or '').strip())
+        if city_code is not None:
+            scores = scores + CITY_BOOST * (features['city_codes'] == city_code)
+        mask = self.filter_mask(features, len(frame), profile)
+        if mask.any():
+            scores = np.where(mask, scores, -np.inf)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return frame.iloc[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return frame.iloc[top]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.meta, 'ready': self.vectors is not None, 'building': self._building}
+
+
+doctor_index = DoctorIndex()
@@ -1,7 +1,42 @@
+import os
+import sqlite3
+import logging
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
 
+# اندازه قطعه‌های متن اسناد (کاراکتر) و سقف متن اسناد در هر پیام چت
+CHUNK_CHARS = int(os.getenv('DOCTORBOT_CHUNK_CHARS', 1000))
+CONTEXT_CHARS = int(os.getenv('DOCTORBOT_CONTEXT_CHARS', 20000))
+BULK_BATCH = 500
+
+# تنظیمات اتصال SQLite: WAL تا خواندن‌ها منتظر نوشتن نمانند، synchronous=NORMAL که در WAL امن است
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('foreign_keys', 'ON'),
+    ('busy_timeout', 5000),
+    ('cache_size', -20000),
+    ('temp_store', 'MEMORY'),
+    ('mmap_size', 128 * 1024 * 1024),
+)
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
 class DoctorBotSettings(db.Model):
     __tablename__ = 'doctorbot_settings'
     id = db.Column(db.Integer, primary_key=True)
@@ -14,9 +49,157 @@ class DoctorBotSettings(db.Model):
 
 class MedicalDocument(db.Model):
     __tablename__ = 'medical_documents'
+    __table_args__ = (
+        db.Index('ix_medical_documents_doctor_filename', 'doctor_name', 'filename'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    doctor_name = db.Column(db.String(200), nullable=False)
+    doctor_name = db.Column(db.String(200), nullable=False, index=True)
     filename = db.Column(db.String(200))
     content = db.Column(db.Text)
     embedding = db.Column(db.PickleType)
-    # سایر فیلدهای مورد نیاز 
\ No newline at end of file
+    # سایر فیلدهای مورد نیاز
+
+class DocumentChunk(db.Model):
+    """قطعه‌های متن هر سند به ترتیب؛ چت به جای ستون content کامل اسناد این‌ها را می‌خواند"""
+    __tablename__ = 'document_chunks'
+    __table_args__ = (
+        db.Index('ix_document_chunks_doctor_document', 'doctor_name', 'document_id', 'position'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('medical_documents.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    doctor_name = db.Column(db.String(200), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+
+
+def split_text(content: str, size: int = None) -> List[str]:
+    """تقسیم متن به قطعه‌هایی حداکثر size کاراکتری، در صورت امکان در مرز خط یا فاصله"""
+    size = size or CHUNK_CHARS
+    chunks = []
+    start = 0
+    content = content or ''
+    while start < len(content):
+        end = min(start + size, len(content))
+        if end < len(content):
+            cut = max(content.rfind('\n', start, end), content.rfind(' ', start, end))
+            if cut > start:
+                end = cut + 1
+        chunk = content[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end
+    return chunks
+
+
+def _batches(items: List[Any], size: int = BULK_BATCH) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def replace_chunks(documents: Dict[int, Tuple[str, str]]):
+    """بازنویسی قطعه‌های اسناد {شناسه: (پزشک، متن)} با یک DELETE و درج دسته‌ای؛ commit با فراخواننده"""
+    ids = list(documents)
+    for batch in _batches(ids):
+        DocumentChunk.query.filter(DocumentChunk.document_id.in_(batch)).delete(synchronize_session=False)
+    rows = [{'document_id': doc_id, 'doctor_name': doctor_name, 'position': position, 'text': chunk}
+            for doc_id, (doctor_name, content) in documents.items()
+            for position, chunk in enumerate(split_text(content))]
+    for batch in _batches(rows):
+        db.session.bulk_insert_mappings(DocumentChunk, batch)
+
+
+def bulk_upsert_documents(rows: Iterable[Dict[str, Any]]) -> Dict[Tuple[str, str], int]:
+    """
+    درج یا به‌روزرسانی دسته‌ای اسناد (کلید: doctor_name و filename) همراه با قطعه‌های متن آن‌ها
+    در یک تراکنش؛ شناسه هر سند را برمی‌گرداند.
+    """
+    rows = {(row['doctor_name'], row.get('filename')): dict(row) for row in rows}
+    ids: Dict[Tuple[str, str], int] = {}
+    try:
+        for batch in _batches(list(rows)):
+            existing = db.session.query(MedicalDocument.id, MedicalDocument.doctor_name, MedicalDocument.filename).filter(
+                MedicalDocument.doctor_name.in_({doctor for doctor, _ in batch}),
+                MedicalDocument.filename.in_({filename for _, filename in batch})).all()
+            ids.update({(doctor, filename): doc_id for doc_id, doctor, filename in existing if (doctor, filename) in rows})
+            updates = [{**rows[key], 'id': ids[key]} for key in batch if key in ids]
+            inserts = [rows[key] for key in batch if key not in ids]
+            if updates:
+                db.session.bulk_update_mappings(MedicalDocument, updates)
+            if inserts:
+                db.session.bulk_insert_mappings(MedicalDocument, inserts, return_defaults=True)
+                ids.update({(row['doctor_name'], row.get('filename')): row['id'] for row in inserts})
+        replace_chunks({ids[key]: (key[0], row.get('content')) for key, row in rows.items() if 'content' in row})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ids
+
+
+def iter_doctor_context(doctor_name: str, max_chars: int = None) -> Iterator[str]:
+    """
+    قطعه‌های متن اسناد یک پزشک به ترتیب سند، به صورت جریانی از ایندکس و تا سقف max_chars؛
+    ستون‌های content و embedding اسناد خوانده نمی‌شوند.
+    """
+    max_chars = CONTEXT_CHARS if max_chars is None else max_chars
+    used = 0
+    query = db.session.query(DocumentChunk.text).filter(DocumentChunk.doctor_name == doctor_name) \
+        .order_by(DocumentChunk.document_id, DocumentChunk.position).yield_per(64)
+    for (chunk,) in query:
+        if max_chars and used + len(chunk) > max_chars:
+            break
+        used += len(chunk)
+        yield chunk
+
+
+def _backfill_chunks(connection):
+    # اسناد موجود پیش از جدول قطعه‌ها، دسته‌به‌دسته و بدون بارگذاری همه محتوا
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            'SELECT id, doctor_name, content FROM medical_documents WHERE id > :last ORDER BY id LIMIT :limit'),
+            {'last': last_id, 'limit': 100}).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        chunks = [{'document_id': doc_id, 'doctor_name': doctor_name, 'position': position, 'text': chunk}
+                  for doc_id, doctor_name, content in rows for position, chunk in enumerate(split_text(content))]
+        if chunks:
+            connection.execute(text(
+                'INSERT INTO document_chunks (document_id, doctor_name, position, text) '
+                'VALUES (:document_id, :doctor_name, :position, :text)'), chunks)
+
+
+# مهاجرت‌ها به ترتیب نسخه؛ نسخه اعمال‌شده در PRAGMA user_version نگه داشته می‌شود
+MIGRATIONS = [
+    (1, [
+        'CREATE INDEX IF NOT EXISTS ix_medical_documents_doctor_name ON medical_documents (doctor_name)',
+        'CREATE INDEX IF NOT EXISTS ix_medical_documents_doctor_filename ON medical_documents (doctor_name, filename)',
+    ]),
+    (2, [_backfill_chunks]),
+]
+
+
+def migrate():
+    """ساخت جداول جدید و اعمال مهاجرت‌های SQLite که هنوز اجرا نشده‌اند (در app context)"""
+    db.create_all()
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as connection:
+        current = connection.execute(text('PRAGMA user_version')).scalar()
+        for version, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(connection)
+                else:
+                    connection.execute(text(step))
+            connection.execute(text(f'PRAGMA user_version={version}'))
+            logger.info(f"doctorbot database migrated to version {version}")
+
+
+def init_storage(app):
+    with app.app_context():
+        migrate()
@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, jsonify, send_file, flash, session
-from doctorbot_models import db, DoctorBotSettings, MedicalDocument
+from doctorbot_models import db, DoctorBotSettings, MedicalDocument, bulk_upsert_documents, iter_doctor_context
+from sqlalchemy.orm import defer
 import os
 import docx
 import requests
@@ -9,11 +10,15 @@ from flask import send_from_directory
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from doctors_data import doctors_info
+from doctor_directory import chat_doctor_choices
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import SentenceTransformerEmbeddings
 from langchain.vectorstores import Chroma
-from llm_utils import get_llm
+from llm_utils import get_llm, AVALAI_BASE_URL
+from llm_router import llm_router, provider_for_model
+from rate_limit import rate_limited
+from stt_backends import stt_service, STTQueueFull
 
 
 
@@ -31,7 +36,7 @@ doctorbot_bp = Blueprint('doctorbot', __name__, url_prefix='/doctorbot')
 
 @doctorbot_bp.route('/settings', methods=['GET', 'POST'])
 def doctorbot_settings():
-    doctor_list = [(k, v['name']) for k, v in doctors_info.items()]
+    doctor_list = chat_doctor_choices()
     if request.method == 'POST':
         llm_model = request.form.get('llm_model')
         tts_model = request.form.get('tts_model')
@@ -49,6 +54,9 @@ def doctorbot_settings():
         # settings.api_key = حذف شود
         db.session.add(settings)
         db.session.commit()
+        # موتور STT در حافظه سرویس نگه داشته می‌شود تا هر پیام صوتی پایگاه داده را نخواند
+        stt_service.select(stt_model)
+        stt_service.preload()
         # آپلود و embedding فایل Word
         file = request.files.get('doc_file')
         if file and allowed_file(file.filename) and selected_doctor:
@@ -65,18 +73,13 @@ def doctorbot_settings():
                 flash('خطا در دریافت embedding از سرویس. سند ذخیره نشد.', 'danger')
                 return redirect(url_for('doctorbot.doctorbot_settings'))
             # جلوگیری از درج رکورد تکراری
-            existing_doc = MedicalDocument.query.filter_by(filename=filename, doctor_name=selected_doctor).first()
+            existing_doc = db.session.query(MedicalDocument.id).filter_by(filename=filename, doctor_name=selected_doctor).first()
             if existing_doc:
                 flash('این سند قبلاً برای این پزشک ثبت شده است.', 'warning')
                 return redirect(url_for('doctorbot.doctorbot_settings'))
-            # ذخیره در دیتابیس اصلی
-            med_doc = MedicalDocument()
-            med_doc.filename = filename
-            med_doc.content = full_text
-            med_doc.embedding = embedding
-            med_doc.doctor_name = selected_doctor
-            db.session.add(med_doc)
-            db.session.commit()
+            # ذخیره در دیتابیس اصلی (سند و قطعه‌های متن آن در یک تراکنش)
+            bulk_upsert_documents([{'doctor_name': selected_doctor, 'filename': filename,
+                                    'content': full_text, 'embedding': embedding}])
             # --- درج در دیتابیس Chroma ---
             try:
                 from langchain_core.documents import Document
@@ -105,7 +108,7 @@ def doctorbot_settings():
 
 def get_avalai_embedding(text, embedding_model, api_key):
     # فرض بر این است که AvalAI یک endpoint embedding دارد
-    url = 'https://api.avalai.ir/v1/embeddings'
+    url = f'{AVALAI_BASE_URL}/embeddings'
     headers = {'Authorization': f'Bearer {api_key}'}
     payload = {
         'model': embedding_model,
@@ -121,7 +124,7 @@ def get_avalai_embedding(text, embedding_model, api_key):
 
 @doctorbot_bp.route('/select_doctor', methods=['GET', 'POST'])
 def doctorbot_select_doctor():
-    doctor_list = [(k, v['name']) for k, v in doctors_info.items()]
+    doctor_list = chat_doctor_choices()
     if request.method == 'POST':
         selected_doctor = request.form.get('doctor_name')
         if selected_doctor:
@@ -136,11 +139,13 @@ def doctorbot_chat():
     doctor_id = session['selected_doctor']
     doctor = doctors_info.get(doctor_id, {})
     settings = DoctorBotSettings.query.first()
-    # دریافت اسناد مربوط به پزشک منتخب
-    med_docs = MedicalDocument.query.filter_by(doctor_name=doctor_id).all()
+    # دریافت اسناد مربوط به پزشک منتخب (content و embedding فقط در صورت نیاز بارگذاری می‌شوند)
+    med_docs = MedicalDocument.query.filter_by(doctor_name=doctor_id) \
+        .options(defer(MedicalDocument.content), defer(MedicalDocument.embedding)).all()
     return render_template('doctorbot_chat.html', doctor=doctor, settings=settings, med_docs=med_docs)
 
 @doctorbot_bp.route('/api/chat', methods=['POST'])
+@rate_limited('chat')
 def doctorbot_api_chat():
     data = request.get_json()
     user_message = data.get('message', '')
@@ -152,9 +157,8 @@ def doctorbot_api_chat():
     selected_doctor = session.get('selected_doctor')
     if not selected_doctor:
         return jsonify({'response': 'پزشک انتخاب نشده است.'})
-    # دریافت embedding اسناد پزشکی فقط برای پزشک منتخب
-    med_docs = MedicalDocument.query.filter_by(doctor_name=selected_doctor).all()
-    context = '\n'.join([doc.content for doc in med_docs]) if med_docs else ''
+    # متن اسناد پزشکی فقط برای پزشک منتخب، به صورت جریانی از قطعه‌ها و تا سقف DOCTORBOT_CONTEXT_CHARS
+    context = '\n'.join(iter_doctor_context(selected_doctor))
     # ساخت prompt ترکیبی
     prompt = f"""
 شما یک دستیار پزشکی حرفه‌ای هستید. با توجه به اطلاعات زیر از اسناد پزشکی و سوال کاربر، به صورت خلاصه و دقیق و با زبان فارسی و قالب Markdown پاسخ دهید.
@@ -177,58 +181,22 @@ def doctorbot_api_chat():
 
 
 def call_avalai_llm(prompt, llm_model, api_key):
-    # تعیین endpoint و پارامترها بر اساس مدل انتخابی
-    if llm_model.startswith('avalai-'):
-        url = 'https://api.avalai.ir/v1/chat/completions'
-        headers = {'Authorization': f'Bearer {api_key}'}
-        payload = {
-            'model': llm_model,
-            'messages': [
-                {'role': 'system', 'content': 'شما یک دستیار پزشکی حرفه‌ای هستید.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            'max_tokens': 512,
-            'temperature': 0.2
-        }
-    elif llm_model.startswith('gpt-'):
-        url = 'https://api.openai.com/v1/chat/completions'
-        headers = {'Authorization': f'Bearer ' + api_key, 'Content-Type': 'application/json'}
-        payload = {
-            'model': llm_model,
-            'messages': [
-                {'role': 'system', 'content': 'You are a professional medical assistant.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            'max_tokens': 512,
-            'temperature': 0.2
-        }
-    elif llm_model.startswith('meta-llama') or llm_model.startswith('nousresearch/'):
-        # فرض بر این که API سازگار با OpenRouter یا HuggingFace است (نیاز به پیاده‌سازی واقعی دارد)
-        url = 'https://openrouter.ai/api/v1/chat/completions'
-        headers = {'Authorization': f'Bearer {api_key}', 'HTTP-Referer': 'https://your-app.com', 'X-Title': 'DoctorBot'}
-        payload = {
-            'model': llm_model,
-            'messages': [
-                {'role': 'system', 'content': 'You are a professional medical assistant.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            'max_tokens': 512,
-            'temperature': 0.2
-        }
-    else:
+    # تعیین endpoint بر اساس مدل انتخابی و ارسال از طریق مسیریاب hedged (llm_router)
+    if provider_for_model(llm_model) is None:
         return None
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
-        print('LLM raw response:', response.status_code, response.text)
-        if response.status_code == 200:
-            result = response.json()
-            if 'choices' in result and result['choices']:
-                return result['choices'][0]['message']['content']
+        return llm_router.complete(prompt, llm_model, api_key)
     except Exception as e:
         print('خطا در فراخوانی LLM:', e)
     return None
 
+@doctorbot_bp.route('/api/llm_stats', methods=['GET'])
+def doctorbot_api_llm_stats():
+    # آمار تأخیر و نرخ خطای ارائه‌دهندگان LLM
+    return jsonify(llm_router.snapshot())
+
 @doctorbot_bp.route('/api/tts', methods=['POST'])
+@rate_limited('tts')
 def doctorbot_api_tts():
     data = request.get_json()
     text = data.get('text', '')
@@ -246,7 +214,7 @@ def doctorbot_tts_file(filename):
     return send_from_directory(UPLOAD_FOLDER, filename)
 
 def avalai_tts(text, tts_model, api_key):
-    url = 'https://api.avalai.ir/v1/audio/tts'
+    url = f'{AVALAI_BASE_URL}/audio/tts'
     headers = {'Authorization': f'Bearer {api_key}'}
     payload = {
         'model': tts_model,
@@ -267,6 +235,7 @@ def avalai_tts(text, tts_model, api_key):
     return None
 
 @doctorbot_bp.route('/api/stt', methods=['POST'])
+@rate_limited('stt')
 def doctorbot_api_stt():
     if 'audio' not in request.files:
         return jsonify({'error': 'فایل صوتی ارسال نشده است.'}), 400
@@ -274,25 +243,14 @@ def doctorbot_api_stt():
     settings = DoctorBotSettings.query.first()
     if not settings:
         return jsonify({'error': 'تنظیمات یافت نشد.'}), 400
-    text = avalai_stt(audio_file, settings.stt_model, settings.api_key)
+    try:
+        text = stt_service.transcribe(audio_file.read(), settings.stt_model, api_key=settings.api_key)
+    except STTQueueFull:
+        return jsonify({'error': 'سرویس تبدیل گفتار مشغول است.'}), 503, {'Retry-After': '1'}
     if text:
         return jsonify({'text': text})
     return jsonify({'error': 'خطا در تبدیل صوت به متن.'}), 500
 
-def avalai_stt(audio_file, stt_model, api_key):
-    url = 'https://api.avalai.ir/v1/audio/stt'
-    headers = {'Authorization': f'Bearer {api_key}'}
-    files = {'file': (audio_file.filename, audio_file.stream, audio_file.mimetype)}
-    data = {'model': stt_model, 'language': 'fa'}
-    try:
-        response = requests.post(url, data=data, files=files, headers=headers, timeout=60)
-        if response.status_code == 200:
-            result = response.json()
-            return result.get('text')
-    except Exception as e:
-        print('خطا در STT AvalAI:', e)
-    return None
-
 @doctorbot_bp.route('/api/upload_doc', methods=['POST'])
 def doctorbot_api_upload_doc():
     # آپلود و embedding فایل Word
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+گزارش رویدادهای ساخت‌یافته (JSON-lines) با نویسنده پس‌زمینه، چرخش بر اساس حجم/زمان،
+خواندن انتهای فایل با seek از انتها و جستجوی ایندکس‌شده رویدادهای اخیر برای پنل مدیریت
+Buffered JSON-lines event log with size/time rotation, seek-from-end tail and an indexed query API
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TAIL_BLOCK_SIZE = 8192
+
+
+def parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """یک خط گزارش؛ خطوط قدیمی متنی ('زمان | پیام') هم پشتیبانی می‌شوند"""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        try:
+            return json.loads(line)
+        except ValueError:
+            pass
+    ts, separator, message = line.partition(' | ')
+    return {'ts': ts, 'event': 'legacy', 'message': message} if separator else {'ts': '', 'event': 'legacy', 'message': line}
+
+
+def format_line(record: Dict[str, Any]) -> str:
+    """نمایش متنی یک رویداد به همان قالب قدیمی 'زمان | پیام'"""
+    return f"{record.get('ts', '')} | {record.get('message', '')}\n"
+
+
+def tail_lines(path: str, count: int) -> List[str]:
+    """count خط آخر فایل با خواندن بلوک‌ها از انتها؛ هزینه مستقل از حجم فایل است"""
+    if count <= 0 or not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(TAIL_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode('utf-8', 'replace').splitlines()
+    if position > 0:
+        lines = lines[1:]  # خط اول بلوک ممکن است ناقص باشد
+    return lines[-count:]
+
+
+class EventLog:
+    """
+    رویدادها در صف قرار می‌گیرند و یک نخ پس‌زمینه آن‌ها را دسته‌ای می‌نویسد، پس درخواست‌ها
+    منتظر دیسک نمی‌مانند. فایل با رسیدن به max_bytes یا گذشت rotate_seconds به path.1 ... path.N
+    منتقل می‌شود. آخرین رویدادها در حافظه و به تفکیک نوع رویداد نگه داشته می‌شوند تا پنل
+    مدیریت بدون خواندن فایل جستجو کند.
+    """
+
+    def __init__(self, path: str, max_bytes: int = None, backups: int = None,
+                 rotate_seconds: float = None, recent: int = 2000):
+        self.path = path
+        self.max_bytes = max_bytes or int(os.getenv('EVENT_LOG_MAX_BYTES', 5 * 1024 * 1024))
+        self.backups = backups if backups is not None else int(os.getenv('EVENT_LOG_BACKUPS', 5))
+        self.rotate_seconds = rotate_seconds or float(os.getenv('EVENT_LOG_ROTATE_SECONDS', 24 * 3600))
+        self._queue: queue.Queue = queue.Queue()
+        self._recent: deque = deque(maxlen=recent)
+        self._by_event: Dict[str, deque] = {}
+        self._recent_size = recent
+        self._lock = threading.Lock()
+        self._opened_at = time.time()
+        self.written = 0
+        self.rotations = 0
+        self._load_recent()
+        self._thread = threading.Thread(target=self._writer, name='event-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _load_recent(self):
+        for line in tail_lines(self.path, self._recent_size):
+            record = parse_line(line)
+            if record:
+                self._remember(record)
+
+    def reload(self):
+        """بارگذاری دوباره رویدادهای اخیر از فایل (پس از بازیابی پشتیبان)"""
+        self.flush()
+        with self._lock:
+            self._recent.clear()
+            self._by_event.clear()
+            self._load_recent()
+
+    def _remember(self, record: Dict[str, Any]):
+        self._recent.append(record)
+        event = record.get('event', '')
+        if event not in self._by_event:
+            self._by_event[event] = deque(maxlen=self._recent_size)
+        self._by_event[event].append(record)
+
+    def log(self, message: str, event: str = 'admin', **fields) -> Dict[str, Any]:
+        """ثبت رویداد؛ نوشتن روی دیسک در پس‌زمینه انجام می‌شود"""
+        record = {'ts': datetime.now().isoformat(), 'event': event, 'message': message, **fields}
+        with self._lock:
+            self._remember(record)
+        self._queue.put(record)
+        return record
+
+    def _writer(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    self._write(records)
+            except Exception as e:
+                logger.error(f"Event log write error: {e}")
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, records: List[Dict[str, Any]]):
+        # هر رویداد جداگانه سریال می‌شود تا یک فیلد نامعتبر بقیه دسته را از بین نبرد
+        lines = []
+        for record in records:
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            except (TypeError, ValueError) as e:
+                logger.error(f"Event log record dropped ({e}): {record.get('message', '')!r}")
+        if self._should_rotate():
+            self._rotate()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+        self.written += len(lines)
+
+    def _should_rotate(self) -> bool:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        return size >= self.max_bytes or (size and time.time() - self._opened_at >= self.rotate_seconds)
+
+    def _rotate(self):
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                source = f'{self.path}.{index}'
+                if os.path.exists(source):
+                    os.replace(source, f'{self.path}.{index + 1}')
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self._opened_at = time.time()
+        self.rotations += 1
+
+    def flush(self, timeout: float = 5.0):
+        """انتظار تا نوشته شدن رویدادهای صف (در خروج برنامه و پیش از دانلود/پشتیبان‌گیری)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def tail(self, count: int = 30) -> List[Dict[str, Any]]:
+        """count رویداد آخر، قدیمی به جدید"""
+        with self._lock:
+            if count <= len(self._recent):
+                return list(self._recent)[-count:]
+        self.flush()
+        return [record for record in map(parse_line, tail_lines(self.path, count)) if record]
+
+    def query(self, event: str = None, text: str = None, since: str = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        جستجوی رویدادهای اخیر (جدید به قدیم) با فیلتر نوع رویداد، متن پیام و زمان شروع (ISO)؛
+        فیلتر نوع از ایندکس هر رویداد استفاده می‌کند.
+        """
+        with self._lock:
+            source = list(self._by_event.get(event, ())) if event else list(self._recent)
+        results = []
+        for record in reversed(source):
+            if since and not record.get('ts'):
+                continue  # خطوط قدیمی بدون زمان
+            if since and record['ts'] < since:
+                break
+            if text and text not in record.get('message', ''):
+                continue
+            results.append(record)
+            if len(results) >= limit:
+                break
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            events = {event: len(records) for event, records in self._by_event.items()}
+        return {
+            'path': self.path,
+            'size': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'rotations': self.rotations,
+            'recent': events,
+        }
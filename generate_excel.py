@@ -1,37 +1,56 @@
 import pandas as pd
 import numpy as np
 
-def generate_doctors_excel(num_doctors=200):
-    data = {
-        'نام': np.random.choice([
-            'علی', 'محمد', 'حسین', 'رضا', 'فاطمه', 'زهرا', 'مریم', 'زینب', 'مهدی', 'امیر', 'آزاده', 'ندا', 'سارا', 'کسری', 'کوروش'
-        ], num_doctors),
-        'نام خانوادگی': np.random.choice([
-            'محمدی', 'حسینی', 'فاطمی', 'رضایی', 'کریمی', 'جعفری', 'عزیزی', 'احمدی', 'صادقی', 'نوروزی', 'ابراهیمی', 'اکبری', 'باقری', 'مرادی'
-        ], num_doctors),
-        'تحصیلات': np.random.choice(['دکترای عمومی', 'پزشک متخصص', 'فوق تخصص'], num_doctors),
-        'رشته تخصصی': np.random.choice([
-            'قلب و عروق', 'اطفال', 'پوست و مو', 'اعصاب و روان', 'داخلی',
-            'ارتوپدی', 'زنان و زایمان', 'گوش و حلق و بینی', 'چشم پزشکی',
-            'جراحی عمومی', 'اورولوژی', 'غدد', 'تغذیه', 'فیزیوتراپی'
-        ], num_doctors),
-        'سابقه (سال)': np.random.randint(2, 30, num_doctors),
-        'شهر': np.random.choice([
-            'تهران', 'مشهد', 'اصفهان', 'شیراز', 'تبریز', 'اهواز', 'کرج', 'یزد',
-            'کرمان', 'رشت', 'ساری', 'بندرعباس', 'ارومیه', 'زاهدان', 'همدان'
-        ], num_doctors),
-        'امتیاز نظرسنجی مشتری (از عدد 10)': np.random.randint(6, 11, num_doctors),
-        'وضعیت بیماران پذیرشی': np.random.choice(['بسیار اورژانسی', 'اورژانسی', 'مهم نیست'], num_doctors),
-        'تسلط به زبان محاوره': np.random.choice(['فقط فارسی', 'انگلیسی و فارسی'], num_doctors),
-        'ترجیحات و علاقمندیها': np.random.choice([
-            'جراحی لاپاراسکوپی', 'پزشکی ورزشی', 'انکولوژی', 'ژنتیک', 'طب سنتی',
-            'پزشکی هسته ای', 'پزشکی مولکولی', 'روانپزشکی کودک و نوجوان', 'طب اورژانس'
-        ], num_doctors)
-    }
+# مقادیر ممکن هر ستون فهرست پزشکان (مشترک با bench_data.py)
+FIRST_NAMES = ['علی', 'محمد', 'حسین', 'رضا', 'فاطمه', 'زهرا', 'مریم', 'زینب', 'مهدی', 'امیر', 'آزاده', 'ندا', 'سارا', 'کسری', 'کوروش']
+LAST_NAMES = ['محمدی', 'حسینی', 'فاطمی', 'رضایی', 'کریمی', 'جعفری', 'عزیزی', 'احمدی', 'صادقی', 'نوروزی', 'ابراهیمی', 'اکبری', 'باقری', 'مرادی']
+EDUCATION = ['دکترای عمومی', 'پزشک متخصص', 'فوق تخصص']
+SPECIALTIES = [
+    'قلب و عروق', 'اطفال', 'پوست و مو', 'اعصاب و روان', 'داخلی',
+    'ارتوپدی', 'زنان و زایمان', 'گوش و حلق و بینی', 'چشم پزشکی',
+    'جراحی عمومی', 'اورولوژی', 'غدد', 'تغذیه', 'فیزیوتراپی'
+]
+CITIES = [
+    'تهران', 'مشهد', 'اصفهان', 'شیراز', 'تبریز', 'اهواز', 'کرج', 'یزد',
+    'کرمان', 'رشت', 'ساری', 'بندرعباس', 'ارومیه', 'زاهدان', 'همدان'
+]
+URGENCY = ['بسیار اورژانسی', 'اورژانسی', 'مهم نیست']
+LANGUAGES = ['فقط فارسی', 'انگلیسی و فارسی']
+INTERESTS = [
+    'جراحی لاپاراسکوپی', 'پزشکی ورزشی', 'انکولوژی', 'ژنتیک', 'طب سنتی',
+    'پزشکی هسته ای', 'پزشکی مولکولی', 'روانپزشکی کودک و نوجوان', 'طب اورژانس'
+]
 
-    df = pd.DataFrame(data)
+# ستون‌های متنی: (نام ستون، مقادیر ممکن)
+CATEGORY_COLUMNS = [
+    ('نام', FIRST_NAMES),
+    ('نام خانوادگی', LAST_NAMES),
+    ('تحصیلات', EDUCATION),
+    ('رشته تخصصی', SPECIALTIES),
+    ('شهر', CITIES),
+    ('وضعیت بیماران پذیرشی', URGENCY),
+    ('تسلط به زبان محاوره', LANGUAGES),
+    ('ترجیحات و علاقمندیها', INTERESTS),
+]
+COLUMN_ORDER = ['نام', 'نام خانوادگی', 'تحصیلات', 'رشته تخصصی', 'سابقه (سال)', 'شهر',
+                'امتیاز نظرسنجی مشتری (از عدد 10)', 'وضعیت بیماران پذیرشی', 'تسلط به زبان محاوره',
+                'ترجیحات و علاقمندیها']
+
+
+def random_doctors(num_doctors, rng=None):
+    """جدول تصادفی پزشکان؛ ستون‌های متنی به صورت category و بدون ساخت رشته برای هر ردیف"""
+    rng = rng if rng is not None else np.random.default_rng()
+    data = {name: pd.Categorical.from_codes(rng.integers(0, len(values), num_doctors), categories=values)
+            for name, values in CATEGORY_COLUMNS}
+    data['سابقه (سال)'] = rng.integers(2, 30, num_doctors, dtype=np.int16)
+    data['امتیاز نظرسنجی مشتری (از عدد 10)'] = rng.integers(6, 11, num_doctors, dtype=np.int8)
+    return pd.DataFrame(data)[COLUMN_ORDER]
+
+
+def generate_doctors_excel(num_doctors=200, seed=None):
+    df = random_doctors(num_doctors, np.random.default_rng(seed))
     df.to_excel('doctors_data.xlsx', index=False)
     print("فایل doctors_data.xlsx با موفقیت ایجاد شد.")
 
 if __name__ == "__main__":
-    generate_doctors_excel() 
\ No newline at end of file
+    generate_doctors_excel()
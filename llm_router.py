@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+مسیریاب چندارائه‌دهنده LLM با درخواست‌های hedged و آگاه از تأخیر
+Latency-aware multi-provider LLM router with hedged requests
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Dict, Any, List, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+AVALAI_BASE_URL = os.getenv("AVALAI_BASE_URL", "https://api.avalai.ir/v1")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# تنظیمات هر ارائه‌دهنده؛ hedge_model مدلی است که هنگام ارسال درخواست ثانویه استفاده می‌شود
+# (پاسخ hedge ممکن است از مدلی غیر از مدل درخواستی باشد؛ route مدل پاسخ‌دهنده را برمی‌گرداند)
+PROVIDERS = {
+    'avalai': {
+        'url': f"{AVALAI_BASE_URL}/chat/completions",
+        'api_key_env': 'AVALAI_API_KEY',
+        'system': 'شما یک دستیار پزشکی حرفه‌ای هستید.',
+        'headers': {},
+        'hedge_model': os.getenv('AVALAI_HEDGE_MODEL', 'gpt-4o-mini'),
+    },
+    'openai': {
+        'url': f"{OPENAI_BASE_URL}/chat/completions",
+        'api_key_env': 'OPENAI_API_KEY',
+        'system': 'You are a professional medical assistant.',
+        'headers': {'Content-Type': 'application/json'},
+        'hedge_model': os.getenv('OPENAI_HEDGE_MODEL', 'gpt-4o-mini'),
+    },
+    'openrouter': {
+        'url': f"{OPENROUTER_BASE_URL}/chat/completions",
+        'api_key_env': 'OPENROUTER_API_KEY',
+        'system': 'You are a professional medical assistant.',
+        'headers': {'HTTP-Referer': 'https://your-app.com', 'X-Title': 'DoctorBot'},
+        'hedge_model': os.getenv('OPENROUTER_HEDGE_MODEL', 'meta-llama/llama-3.1-8b-instruct'),
+    },
+}
+
+
+def provider_for_model(llm_model: str) -> Optional[str]:
+    """تعیین ارائه‌دهنده بر اساس پیشوند نام مدل"""
+    if llm_model.startswith('avalai-'):
+        return 'avalai'
+    if llm_model.startswith('gpt-'):
+        return 'openai'
+    if llm_model.startswith('meta-llama') or llm_model.startswith('nousresearch/'):
+        return 'openrouter'
+    return None
+
+
+class LatencyStats:
+    """
+    آمار پنجره‌ای تأخیر و نرخ خطا برای یک endpoint. درخواست‌هایی که چون درخواست دیگری زودتر
+    پاسخ داد لغو شدند censored هستند: نه موفق‌اند و نه خطا، پس در صدک‌ها و نرخ خطا حساب نمی‌شوند.
+    """
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)  # (latency_seconds, ok)
+        self._lock = threading.Lock()
+        self.censored = 0
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def record_censored(self):
+        with self._lock:
+            self.censored += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(s[0] for s in self._samples if s[1])
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for s in self._samples if not s[1]) / len(self._samples)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'samples': self.count(),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'error_rate': round(self.error_rate(), 3),
+            'censored': self.censored,
+        }
+
+
+class _Attempt:
+    """یک درخواست در حال اجرا؛ cancel پاسخ باز آن را می‌بندد تا اتصال و سهمیه ارائه‌دهنده آزاد شود"""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.cancelled = threading.Event()
+        self.started = time.monotonic()
+        self.future = None
+        self._response = None
+        self._lock = threading.Lock()
+
+    def attach(self, response) -> bool:
+        """ثبت پاسخ دریافت‌شده؛ False اگر درخواست پیش از رسیدن هدرها لغو شده باشد"""
+        with self._lock:
+            if self.cancelled.is_set():
+                return False
+            self._response = response
+            return True
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled.set()
+            response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+
+class ProviderRouter:
+    """
+    ارسال درخواست به ارائه‌دهنده اصلی و در صورت کندی، ارسال درخواست hedged به ارائه‌دهنده ثانویه.
+    تأخیر hedge برابر p95 ارائه‌دهنده اصلی است و سهم درخواست‌های hedged با hedge_budget محدود می‌شود
+    تا هزینه دو برابر نشود. پاسخ‌ها به صورت جریانی (stream) خوانده می‌شوند تا درخواست بازنده
+    بلافاصله بسته شود و ارائه‌دهنده تولید پاسخ آن را متوقف کند.
+    """
+
+    def __init__(self, providers: Dict[str, Dict[str, Any]] = None, window: int = 100,
+                 default_hedge_delay: float = 8.0, min_hedge_delay: float = 0.5,
+                 hedge_budget: float = 0.1, timeout: float = 60):
+        self.providers = providers or PROVIDERS
+        self.stats = {name: LatencyStats(window) for name in self.providers}
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.hedge_budget = hedge_budget
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='llm-router')
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hedges = 0
+        self._substituted = 0
+        self._answered_by: Counter = Counter()
+
+    def hedge_delay(self, provider: str) -> float:
+        """تأخیر قبل از ارسال درخواست ثانویه بر اساس p95 ارائه‌دهنده اصلی"""
+        stats = self.stats[provider]
+        p95 = stats.percentile(95)
+        if p95 is None or stats.count() < 10:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, p95)
+
+    def _score(self, provider: str) -> float:
+        stats = self.stats[provider]
+        p50 = stats.percentile(50)
+        return (p50 if p50 is not None else self.default_hedge_delay) * (1 + 10 * stats.error_rate())
+
+    def _secondary(self, primary: str) -> Optional[Tuple[str, str, str]]:
+        """انتخاب بهترین ارائه‌دهنده ثانویه که کلید API آن تنظیم شده است"""
+        candidates = []
+        for name, cfg in self.providers.items():
+            api_key = os.getenv(cfg['api_key_env'])
+            if name != primary and api_key:
+                candidates.append((self._score(name), name, cfg['hedge_model'], api_key))
+        if not candidates:
+            return None
+        candidates.sort()
+        _, name, model, api_key = candidates[0]
+        return name, model, api_key
+
+    def _take_hedge_budget(self) -> bool:
+        with self._lock:
+            if self._hedges + 1 > self.hedge_budget * max(self._requests, 1):
+                return False
+            self._hedges += 1
+            return True
+
+    @staticmethod
+    def _read(response, cancelled: threading.Event) -> Optional[str]:
+        """متن پاسخ؛ رویدادهای SSE یکی‌یکی خوانده و با لغو درخواست خواندن متوقف می‌شود"""
+        if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+            result = response.json()
+            return result['choices'][0]['message']['content'] if result.get('choices') else None
+        parts = []
+        for line in response.iter_lines():
+            if cancelled.is_set():
+                return None
+            if not line.startswith(b'data:'):
+                continue
+            data = line[5:].strip()
+            if data == b'[DONE]':
+                break
+            choices = json.loads(data).get('choices') or []
+            if choices:
+                parts.append((choices[0].get('delta') or {}).get('content') or '')
+        return ''.join(parts) or None
+
+    def _attempt(self, attempt: _Attempt, api_key: str, prompt: str, max_tokens: int,
+                 temperature: float) -> Optional[str]:
+        provider = attempt.provider
+        cfg = self.providers[provider]
+        headers = {'Authorization': f'Bearer {api_key}', **cfg['headers']}
+        payload = {
+            'model': attempt.model,
+            'messages': [
+                {'role': 'system', 'content': cfg['system']},
+                {'role': 'user', 'content': prompt}
+            ],
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            'stream': True
+        }
+        start = time.monotonic()
+        ok = False
+        try:
+            with requests.post(cfg['url'], json=payload, headers=headers, timeout=self.timeout, stream=True) as response:
+                if not attempt.attach(response):
+                    return None
+                if response.status_code == 200:
+                    content = self._read(response, attempt.cancelled)
+                    if content:
+                        ok = True
+                        return content
+                if not attempt.cancelled.is_set():
+                    logger.warning(f"LLM provider {provider} returned {response.status_code}")
+        except Exception as e:
+            if not attempt.cancelled.is_set():
+                logger.error(f"LLM provider {provider} error: {e}")
+        finally:
+            # نتیجه درخواست لغوشده در آمار ثبت نمی‌شود (در زمان لغو ثبت شده است)
+            if not attempt.cancelled.is_set():
+                self.stats[provider].record(time.monotonic() - start, ok)
+        return None
+
+    def route(self, prompt: str, llm_model: str, api_key: str, max_tokens: int = 512,
+              temperature: float = 0.2) -> Optional[Dict[str, Any]]:
+        """
+        ارسال prompt با hedging؛ اولین پاسخ موفق برگردانده و درخواست دیگر لغو می‌شود.
+        خروجی: {'content', 'provider', 'model'}؛ model مدلی است که واقعاً پاسخ داده و در پاسخ
+        hedge برابر hedge_model ارائه‌دهنده ثانویه است، نه llm_model.
+        """
+        primary = provider_for_model(llm_model)
+        if primary is None:
+            return None
+        with self._lock:
+            self._requests += 1
+
+        attempts: List[_Attempt] = []
+
+        def launch(provider, model, key):
+            attempt = _Attempt(provider, model)
+            attempt.future = self._executor.submit(self._attempt, attempt, key, prompt, max_tokens, temperature)
+            attempts.append(attempt)
+
+        launch(primary, llm_model, api_key)
+        deadline = time.monotonic() + self.timeout
+        hedged = False
+        result = winner = None
+        while attempts and time.monotonic() < deadline:
+            remaining = deadline - time.monotonic()
+            timeout = remaining if hedged else min(self.hedge_delay(primary), remaining)
+            done, _ = wait([a.future for a in attempts], timeout=timeout, return_when=FIRST_COMPLETED)
+            for attempt in [a for a in attempts if a.future in done]:
+                attempts.remove(attempt)
+                result = attempt.future.result()
+                if result is not None:
+                    winner = attempt
+                    break
+            if result is not None:
+                break
+            if not hedged:
+                # اگر اصلی شکست خورده failover بدون مصرف بودجه؛ در غیر این صورت hedge در صورت وجود بودجه
+                failed = bool(done)
+                secondary = self._secondary(primary)
+                if secondary and (failed or self._take_hedge_budget()):
+                    logger.info(f"LLM {'failover' if failed else 'hedge'} from {primary} to {secondary[0]}")
+                    launch(*secondary)
+                hedged = True
+
+        for attempt in attempts:
+            attempt.cancel()
+            attempt.future.cancel()
+            if result is None:
+                # مهلت کل تمام شد: timeout یک خطاست و در نرخ خطا اثر دارد
+                self.stats[attempt.provider].record(time.monotonic() - attempt.started, False)
+            else:
+                # بازنده hedge: فقط شمرده می‌شود، نه به عنوان نمونه موفق
+                self.stats[attempt.provider].record_censored()
+        if winner is None:
+            return None
+        with self._lock:
+            self._answered_by[winner.model] += 1
+            if winner.model != llm_model:
+                self._substituted += 1
+        if winner.model != llm_model:
+            logger.info(f"LLM answer for {llm_model} came from {winner.provider}/{winner.model}")
+        return {'content': result, 'provider': winner.provider, 'model': winner.model}
+
+    def complete(self, prompt: str, llm_model: str, api_key: str, max_tokens: int = 512,
+                 temperature: float = 0.2) -> Optional[str]:
+        """متن پاسخ route؛ مدل پاسخ‌دهنده در snapshot شمرده می‌شود"""
+        routed = self.route(prompt, llm_model, api_key, max_tokens, temperature)
+        return routed['content'] if routed else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """وضعیت فعلی آمار برای نمایش در بخش مدیریت"""
+        with self._lock:
+            totals = {'requests': self._requests, 'hedges': self._hedges,
+                      'substituted': self._substituted, 'answered_by': dict(self._answered_by)}
+        return {'providers': {name: s.snapshot() for name, s in self.stats.items()}, **totals}
+
+
+llm_router = ProviderRouter()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+کنترل پذیرش و محدودسازی نرخ درخواست‌ها با سطل توکن
+Admission control and token-bucket rate limiting for chat/TTS/STT endpoints
+"""
+
+import os
+import math
+import time
+import uuid
+import hmac
+import threading
+import logging
+from collections import OrderedDict
+from functools import wraps
+from typing import Tuple, Optional
+
+from flask import request, session, jsonify, Response
+
+logger = logging.getLogger(__name__)
+
+# ضریب محدودیت IP نسبت به محدودیت هر نشست (چند کاربر پشت یک NAT)
+IP_LIMIT_FACTOR = 4
+# پروکسی‌های معکوس مورد اعتماد؛ X-Forwarded-For فقط از این آدرس‌ها پذیرفته می‌شود
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv('TRUSTED_PROXIES', '').split(',') if ip.strip()}
+
+
+class TokenBucket:
+    """سطل توکن با ظرفیت burst و نرخ پر شدن ثابت"""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> Tuple[bool, float]:
+        """برداشتن یک توکن؛ در صورت عدم موفقیت، زمان انتظار تا توکن بعدی برگردانده می‌شود"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class RateLimiter:
+    """سطل‌های توکن به ازای (دامنه، کلید کلاینت) با حداکثر تعداد سطل در حافظه"""
+
+    def __init__(self, rate_per_minute: int = 60, max_buckets: int = 10000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rate_per_minute = None
+        self.api_key = ''
+        self.set_rate(rate_per_minute)
+
+    def set_rate(self, rate_per_minute: int):
+        """تغییر نرخ مجاز (درخواست در دقیقه)؛ فقط در صورت تغییر نرخ سطل‌های قبلی کنار گذاشته می‌شوند"""
+        rate_per_minute = max(1, int(rate_per_minute))
+        with self._lock:
+            if rate_per_minute == self.rate_per_minute:
+                return
+            self.rate_per_minute = rate_per_minute
+            self.burst = max(1, self.rate_per_minute // 6)
+            self._buckets.clear()
+
+    def set_api_key(self, api_key: str):
+        """کلید API پیکربندی‌شده؛ فقط درخواست‌های دارای همین کلید سطل جداگانه می‌گیرند"""
+        self.api_key = api_key or ''
+
+    def check(self, scope: str, key: str, factor: int = 1) -> Tuple[bool, float]:
+        with self._lock:
+            bucket_key = (scope, key)
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate_per_minute * factor, self.burst * factor)
+                self._buckets[bucket_key] = bucket
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(bucket_key)
+            return bucket.take()
+
+
+class AdmissionController:
+    """
+    سقف همزمانی سراسری با صف انتظار محدود.
+    وقتی صف پر است، درخواست فوراً رد می‌شود تا کارگرهای Flask مسدود نشوند.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 16, queue_timeout: float = 5.0,
+                 max_per_client: int = 4):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_client = max_per_client
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._per_client = {}
+        self._service_time = 1.0  # میانگین نمایی زمان سرویس (ثانیه)
+
+    def retry_after(self) -> float:
+        """تخمین زمان خالی شدن ظرفیت بر اساس طول صف و میانگین زمان سرویس"""
+        return max(1.0, self._service_time * (self._waiting + 1) / self.max_concurrent)
+
+    def acquire(self, client: str) -> Tuple[bool, float]:
+        with self._cond:
+            if self._per_client.get(client, 0) >= self.max_per_client:
+                return False, self.retry_after()
+            if self._active >= self.max_concurrent:
+                if self._waiting >= self.max_queue:
+                    return False, self.retry_after()
+                self._waiting += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self._active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False, self.retry_after()
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            self._per_client[client] = self._per_client.get(client, 0) + 1
+            return True, 0.0
+
+    def release(self, client: str, elapsed: float):
+        with self._cond:
+            self._active -= 1
+            count = self._per_client.get(client, 1) - 1
+            if count > 0:
+                self._per_client[client] = count
+            else:
+                self._per_client.pop(client, None)
+            self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+            self._cond.notify()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {'active': self._active, 'waiting': self._waiting,
+                    'max_concurrent': self.max_concurrent, 'max_queue': self.max_queue,
+                    'avg_service_time': round(self._service_time, 3)}
+
+
+rate_limiter = RateLimiter()
+admission = AdmissionController(
+    max_concurrent=int(os.getenv('MAX_CONCURRENT_REQUESTS', 8)),
+    max_queue=int(os.getenv('MAX_QUEUED_REQUESTS', 16)),
+    queue_timeout=float(os.getenv('QUEUE_TIMEOUT', 5)),
+    max_per_client=int(os.getenv('MAX_REQUESTS_PER_CLIENT', 4)),
+)
+
+
+def client_ip() -> str:
+    """
+    IP کلاینت: X-Forwarded-For فقط وقتی درخواست از یک پروکسی مورد اعتماد آمده باشد خوانده می‌شود
+    و نزدیک‌ترین آدرس غیرپروکسی در زنجیره برگردانده می‌شود؛ در غیر این صورت remote_addr
+    """
+    remote = request.remote_addr or ''
+    forwarded = request.headers.get('X-Forwarded-For')
+    if not forwarded or remote not in TRUSTED_PROXIES:
+        return remote
+    for ip in reversed([ip.strip() for ip in forwarded.split(',') if ip.strip()]):
+        if ip not in TRUSTED_PROXIES:
+            return ip
+    return remote
+
+
+def client_keys() -> Tuple[str, Optional[str]]:
+    """
+    کلید کلاینت: کلید API فقط اگر با کلید پیکربندی‌شده برابر باشد، وگرنه شناسه نشست به همراه IP
+    برای محدودیت دوم (کلید نامعتبر یا تصادفی محدودیت‌ها را دور نمی‌زند)
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key and rate_limiter.api_key and hmac.compare_digest(api_key, rate_limiter.api_key):
+        return 'key:configured', None
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+    return f"sid:{session['sid']}", f'ip:{client_ip()}'
+
+
+def _too_many(message: str, retry_after: float):
+    response = jsonify({'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+    return response
+
+
+def rate_limited(scope: str):
+    """دکوراتور اعمال محدودیت نرخ و کنترل پذیرش روی یک endpoint"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == 'GET':
+                return view(*args, **kwargs)
+            client, ip_key = client_keys()
+            ok, retry_after = rate_limiter.check(scope, client)
+            if ok and ip_key:
+                ok, retry_after = rate_limiter.check(scope, ip_key, IP_LIMIT_FACTOR)
+            if not ok:
+                return _too_many('تعداد درخواست‌ها بیش از حد مجاز است.', retry_after)
+            admitted, retry_after = admission.acquire(client)
+            if not admitted:
+                logger.warning(f"Admission rejected for {scope} ({admission.snapshot()})")
+                return _too_many('سرور مشغول است، لطفاً کمی بعد تلاش کنید.', retry_after)
+            start = time.monotonic()
+            released = []
+
+            def release():
+                if not released:
+                    released.append(True)
+                    admission.release(client, time.monotonic() - start)
+
+            try:
+                result = view(*args, **kwargs)
+            except BaseException:
+                release()
+                raise
+            # پاسخ جریانی پس از بازگشت view تولید می‌شود؛ ظرفیت تا بسته شدن پاسخ نگه داشته می‌شود
+            response = result[0] if isinstance(result, tuple) else result
+            if isinstance(response, Response) and response.is_streamed:
+                response.call_on_close(release)
+            else:
+                release()
+            return result
+        return wrapper
+    return decorator
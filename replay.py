@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+اجرای آفلاین بار: بازپخش فایل JSONL درخواست‌های chat/TTS/STT با همزمانی و نرخ ورود قابل تنظیم
+Offline replay/load runner over a JSONL request log with per-endpoint and per-stage latency stats
+
+هر خط فایل ورودی یک درخواست است، مثلاً:
+    {"type": "chat", "text": "سردرد دارم", "session": "u1"}
+    {"type": "tts", "text": "سلام"}
+    {"type": "stt", "audio": "samples/hello.wav"}
+    {"endpoint": "/chat", "form": {"user_input": "سلام"}, "at": 1.5}
+
+نمونه اجرا (بدون شبکه، با سرورهای stub محلی و اجرای درون‌فرآیندی برنامه):
+    python replay.py load.jsonl --in-process --stubs --concurrency 8 --rate 20
+
+برنامه درخواست‌های هر نشست و هر IP را محدود می‌کند (rate_limit در تنظیمات امنیتی، پیش‌فرض ۶۰ در دقیقه
+با burst ده‌تایی)؛ پاسخ‌های 429 و خطاها جدا شمرده می‌شوند و در صدک‌های تأخیر نمی‌آیند. برای آزمون
+بار درون‌فرآیندی از --rate-limit و برای سرور در حال اجرا از افزایش rate_limit در پنل مدیریت استفاده کنید.
+"""
+
+import os
+import io
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stage_timing import parse_server_timing
+
+# نقطه پایانی پیش‌فرض برای هر نوع درخواست
+DEFAULT_ENDPOINTS = {
+    'chat': '/chat_advanced',
+    'tts': '/tts',
+    'stt': '/stt',
+}
+
+# یک فریم MP3 خالی برای پاسخ‌های TTS سرور stub
+STUB_MP3 = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """شبیه‌ساز سازگار با OpenAI برای LLM، TTS، STT و embedding"""
+
+    latency = 0.2
+    jitter = 0.1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sleep(self):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def _json(self, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        self._sleep()
+        path = self.path.rstrip('/')
+        answer = 'این یک پاسخ آزمایشی از سرور stub است. لطفاً با پزشک خود مشورت کنید.'
+        if path.endswith('/chat/completions'):
+            if b'"stream": true' in raw or b'"stream":true' in raw:
+                return self._stream_completion(answer, chat=True)
+            self._json({'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': answer}}],
+                        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}})
+        elif path.endswith('/completions'):
+            if b'"stream": true' in raw or b'"stream":true' in raw:
+                return self._stream_completion(answer, chat=False)
+            self._json({'choices': [{'index': 0, 'text': answer, 'finish_reason': 'stop'}],
+                        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}})
+        elif path.endswith('/audio/speech') or path.endswith('/audio/tts'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Content-Length', str(len(STUB_MP3)))
+            self.end_headers()
+            self.wfile.write(STUB_MP3)
+        elif path.endswith('/audio/transcriptions') or path.endswith('/audio/stt'):
+            self._json({'text': 'سلام دکتر، سردرد دارم'})
+        elif path.endswith('/embeddings'):
+            self._json({'data': [{'index': 0, 'embedding': [0.0] * 384}], 'embedding': [0.0] * 384})
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def _stream_completion(self, answer, chat):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for word in answer.split(' '):
+            delta = {'delta': {'content': word + ' '}} if chat else {'text': word + ' '}
+            chunk = {'choices': [{'index': 0, **delta, 'finish_reason': None}]}
+            self.wfile.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(self.latency / 20)
+        self.wfile.write(b'data: [DONE]\n\n')
+
+
+def start_stub_server(port: int, latency: float, jitter: float) -> str:
+    """راه‌اندازی سرور stub در یک thread و تنظیم متغیرهای محیطی ارائه‌دهندگان به آن"""
+    StubProviderHandler.latency = latency
+    StubProviderHandler.jitter = jitter
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubProviderHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/v1'
+    for name in ('AVALAI_BASE_URL', 'OPENAI_BASE_URL', 'OPENROUTER_BASE_URL'):
+        os.environ[name] = base_url
+    for name in ('AVALAI_API_KEY', 'OPENAI_API_KEY'):
+        os.environ.setdefault(name, 'stub')
+    return base_url
+
+
+def load_requests(path):
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                print(f'Skipping line {line_no}: {e}')
+    return entries
+
+
+def build_request(entry):
+    """تبدیل یک خط JSONL به (method, endpoint, payload, audio_path)"""
+    kind = entry.get('type', 'chat')
+    endpoint = entry.get('endpoint') or DEFAULT_ENDPOINTS.get(kind, '/chat_advanced')
+    method = entry.get('method', 'POST')
+    if 'json' in entry or 'form' in entry:
+        return method, endpoint, {'json': entry.get('json'), 'form': entry.get('form')}, None
+    if kind == 'stt':
+        return method, endpoint, {}, entry.get('audio')
+    return method, endpoint, {'json': {'text': entry.get('text', '')}}, None
+
+
+class HttpTarget:
+    """ارسال درخواست به یک سرور در حال اجرا"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self._requests = requests
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session(self, key):
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = self._requests.Session()
+            return self._sessions[key]
+
+    def send(self, session_key, method, endpoint, payload, audio_path):
+        kwargs = {'timeout': 120}
+        if payload.get('json') is not None:
+            kwargs['json'] = payload['json']
+        if payload.get('form') is not None:
+            kwargs['data'] = payload['form']
+        if audio_path:
+            with open(audio_path, 'rb') as f:
+                kwargs['files'] = {'audio': (os.path.basename(audio_path), f.read())}
+        response = self._session(session_key).request(method, self.base_url + endpoint, **kwargs)
+        response.content  # خواندن کامل بدنه (شامل پاسخ‌های stream)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class InProcessTarget:
+    """ارسال درخواست به برنامه Flask درون همین فرآیند (بدون سرور HTTP)"""
+
+    def __init__(self, rate_limit=None):
+        from app import app
+        self.app = app
+        if rate_limit:
+            from rate_limit import rate_limiter
+            rate_limiter.set_rate(rate_limit)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _client(self, key):
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self.app.test_client()
+            return self._clients[key]
+
+    def send(self, session_key, method, endpoint, payload, audio_path):
+        kwargs = {}
+        if payload.get('json') is not None:
+            kwargs['json'] = payload['json']
+        if payload.get('form') is not None:
+            kwargs['data'] = payload['form']
+        if audio_path:
+            with open(audio_path, 'rb') as f:
+                kwargs['data'] = {'audio': (io.BytesIO(f.read()), os.path.basename(audio_path))}
+            kwargs['content_type'] = 'multipart/form-data'
+        response = self._client(session_key).open(endpoint, method=method, **kwargs)
+        response.get_data()
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # nearest-rank: کوچک‌ترین مقداری که دست‌کم p درصد نمونه‌ها از آن کمتر یا مساوی‌اند
+    index = max(0, min(len(ordered) - 1, math.ceil(p * len(ordered) / 100.0) - 1))
+    return ordered[index]
+
+
+def is_success(status):
+    return isinstance(status, int) and 200 <= status < 400
+
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'max': max(samples) if samples else None,
+    }
+
+
+def run(entries, target, concurrency, rate, poisson, use_timestamps, sessions):
+    """
+    اجرای open-loop: درخواست‌ها در زمان ورود برنامه‌ریزی‌شده ارسال می‌شوند و تأخیر از همان زمان
+    اندازه‌گیری می‌شود، بنابراین صف شدن سمت کلاینت هم در آمار دیده می‌شود.
+    """
+    latencies = defaultdict(list)  # فقط پاسخ‌های موفق
+    failures = defaultdict(int)  # 429، سایر کدهای غیر 2xx/3xx و خطاهای اتصال
+    stages = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+
+    def worker(index, entry, scheduled):
+        if scheduled is None:
+            scheduled = time.perf_counter()
+        method, endpoint, payload, audio_path = build_request(entry)
+        session_key = entry.get('session') or f'replay-{index % sessions}'
+        try:
+            status, server_timing = target.send(session_key, method, endpoint, payload, audio_path)
+        except Exception as e:
+            status, server_timing = f'error:{type(e).__name__}', ''
+        elapsed = (time.perf_counter() - scheduled) * 1000
+        with lock:
+            statuses[endpoint][str(status)] += 1
+            if not is_success(status):
+                failures[endpoint] += 1
+                return
+            latencies[endpoint].append(elapsed)
+            for name, duration in parse_server_timing(server_timing).items():
+                stages[name].append(duration)
+
+    start = time.perf_counter()
+    next_arrival = start
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index, entry in enumerate(entries):
+            if use_timestamps and 'at' in entry:
+                next_arrival = start + float(entry['at'])
+            now = time.perf_counter()
+            if next_arrival > now:
+                time.sleep(next_arrival - now)
+            # بدون نرخ ورود، تأخیر از شروع واقعی درخواست در worker اندازه‌گیری می‌شود
+            executor.submit(worker, index, entry, next_arrival if rate or use_timestamps else None)
+            if rate:
+                next_arrival += random.expovariate(rate) if poisson else 1.0 / rate
+    duration = time.perf_counter() - start
+
+    succeeded = sum(len(v) for v in latencies.values())
+    total = succeeded + sum(failures.values())
+    return {
+        'requests': total,
+        'failed': sum(failures.values()),
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(succeeded / duration, 2) if duration else None,
+        'endpoints': {ep: {**summarize(latencies[ep]), 'failed': failures[ep], 'status': dict(statuses[ep])}
+                      for ep in statuses},
+        'stages': {name: summarize(v) for name, v in stages.items()},
+    }
+
+
+def print_report(report):
+    def fmt(value):
+        return '-' if value is None else f'{value:.1f}'
+    print(f"\nRequests: {report['requests']}  Failed: {report['failed']}  Duration: {report['duration_s']}s  "
+          f"Throughput: {report['throughput_rps']} successful req/s")
+    print(f"\n{'endpoint':<24}{'ok':>7}{'failed':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  status")
+    for endpoint, s in sorted(report['endpoints'].items()):
+        print(f"{endpoint:<24}{s['count']:>7}{s['failed']:>8}{fmt(s['p50']):>10}{fmt(s['p95']):>10}{fmt(s['p99']):>10}"
+              f"{fmt(s['max']):>10}  {s['status']}")
+    if report['stages']:
+        print(f"\n{'stage':<24}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for name, s in sorted(report['stages'].items()):
+            print(f"{name:<24}{s['count']:>7}{fmt(s['p50']):>10}{fmt(s['p95']):>10}{fmt(s['p99']):>10}{fmt(s['max']):>10}")
+    print('\n(latencies in ms, successful responses only)')
+    if report['failed'] and any('429' in s['status'] for s in report['endpoints'].values()):
+        print('Some requests were rate limited (429): use more --sessions, --rate-limit with --in-process, '
+              'or raise rate_limit in the admin security settings.')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a JSONL request log against the chatbot and report latency stats.')
+    parser.add_argument('log', help='JSONL file of chat/TTS/STT requests')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000', help='running app to target (ignored with --in-process)')
+    parser.add_argument('--in-process', action='store_true', help='import app.py and use the Flask test client')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0.0, help='arrival rate in requests/s (0 = as fast as workers allow)')
+    parser.add_argument('--poisson', action='store_true', help='exponential inter-arrival times instead of fixed')
+    parser.add_argument('--use-timestamps', action='store_true', help="honour each entry's 'at' offset in seconds")
+    parser.add_argument('--sessions', type=int, default=0,
+                        help='number of client sessions for entries without a "session" (default: --concurrency)')
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help='with --in-process, override the per-client rate limit (requests/minute)')
+    parser.add_argument('--repeat', type=int, default=1, help='replay the log this many times')
+    parser.add_argument('--stubs', action='store_true', help='start local stub provider servers and route provider calls to them')
+    parser.add_argument('--stub-port', type=int, default=0)
+    parser.add_argument('--stub-latency', type=float, default=0.2, help='mean stub latency in seconds')
+    parser.add_argument('--stub-jitter', type=float, default=0.1)
+    parser.add_argument('--serve-stubs', action='store_true', help='only run the stub servers (start the app with the printed env)')
+    parser.add_argument('--json-out', help='write the report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    if args.stubs or args.serve_stubs:
+        base_url = start_stub_server(args.stub_port, args.stub_latency, args.stub_jitter)
+        print(f'Stub providers listening at {base_url}')
+        if args.serve_stubs:
+            print(f'Start the app with: AVALAI_BASE_URL={base_url} OPENAI_BASE_URL={base_url} OPENROUTER_BASE_URL={base_url}')
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return 0
+        if not args.in_process:
+            print('Note: provider calls of an already running app are only stubbed if it was started with the env above.')
+
+    entries = load_requests(args.log) * max(1, args.repeat)
+    if not entries:
+        print('No requests to replay.')
+        return 1
+    target = InProcessTarget(args.rate_limit) if args.in_process else HttpTarget(args.base_url)
+    sessions = args.sessions or args.concurrency
+    report = run(entries, target, args.concurrency, args.rate, args.poisson, args.use_timestamps, max(1, sessions))
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
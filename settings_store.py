@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ذخیره‌ساز تنظیمات، منابع و کاربران: یک بار خواندن از دیسک، نگهداری در حافظه، نوشتن اتمیک
+و اطلاع‌رسانی تغییرات به مشترکین
+In-memory JSON store with atomic write-rename persistence, a version counter and change subscribers
+"""
+
+import os
+import copy
+import json
+import tempfile
+import threading
+import logging
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def write_json_atomic(path: str, data: Any):
+    """نوشتن در فایل موقت کنار مقصد، fsync و os.replace؛ خواننده هرگز فایل نیمه‌نوشته نمی‌بیند"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JSONStore:
+    """
+    محتوای یک فایل JSON در حافظه. خواندن‌ها بدون I/O هستند و نسخه‌ای مستقل برمی‌گردانند؛
+    تغییرات زیر قفل روی یک کپی اعمال، به صورت اتمیک ذخیره و سپس جایگزین مقدار فعلی می‌شوند،
+    پس نویسندگان همزمان تغییرات یکدیگر را از بین نمی‌برند. پس از هر تغییر version یکی
+    افزایش می‌یابد و مشترکین با کپی مقدار جدید فراخوانی می‌شوند؛ اطلاع‌رسانی‌ها به ترتیب نسخه
+    تحویل می‌شوند و نسخه‌ای قدیمی‌تر از آخرین نسخه تحویل‌شده نادیده گرفته می‌شود.
+    """
+
+    def __init__(self, path: str, default: Any = None):
+        self.path = path
+        self.default = default if default is not None else {}
+        self.version = 0
+        self._subscribers: List[Callable[[Any], None]] = []
+        self._lock = threading.RLock()
+        self._notify_lock = threading.RLock()
+        self._delivered = 0
+        self._value, self.exists = self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return copy.deepcopy(self.default), False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f), True
+
+    def get(self, default: Any = None) -> Any:
+        """کپی مقدار فعلی؛ اگر فایل هنوز وجود ندارد و default داده شده، default"""
+        with self._lock:
+            if not self.exists and default is not None:
+                return default
+            return copy.deepcopy(self._value)
+
+    def snapshot(self) -> Any:
+        """مقدار فعلی بدون کپی برای مسیرهای پرتکرار؛ نباید تغییر داده شود"""
+        return self._value
+
+    def update(self, mutator: Callable[[Any], Optional[Any]]) -> Any:
+        """
+        اعمال mutator روی کپی مقدار فعلی (تغییر درجا یا برگرداندن مقدار جدید)، ذخیره اتمیک
+        و اطلاع به مشترکین؛ در صورت خطای نوشتن مقدار حافظه تغییر نمی‌کند.
+        """
+        with self._lock:
+            value = copy.deepcopy(self._value)
+            result = mutator(value)
+            if result is not None:
+                value = result
+            write_json_atomic(self.path, value)
+            self._value, self.exists = value, True
+            self.version += 1
+            version = self.version
+        self._notify(value, version)
+        return copy.deepcopy(value)
+
+    def merge(self, **changes) -> Any:
+        """به‌روزرسانی کلیدهای یک ذخیره‌ساز دیکشنری"""
+        return self.update(lambda value: value.update(changes))
+
+    def reload(self) -> bool:
+        """خواندن دوباره از دیسک (پس از بازیابی پشتیبان)؛ True اگر محتوا تغییر کرده باشد"""
+        with self._lock:
+            value, exists = self._read()
+            if value == self._value and exists == self.exists:
+                return False
+            self._value, self.exists = value, exists
+            self.version += 1
+            version = self.version
+        self._notify(value, version)
+        return True
+
+    def subscribe(self, callback: Callable[[Any], None], initial: bool = True):
+        """ثبت مشترک؛ با initial=True یک بار بلافاصله با مقدار فعلی فراخوانی می‌شود"""
+        self._subscribers.append(callback)
+        if initial:
+            with self._notify_lock:
+                self._call(callback, self.get())
+
+    def _notify(self, value: Any, version: int):
+        with self._notify_lock:
+            if version < self._delivered:
+                return
+            self._delivered = version
+            for callback in list(self._subscribers):
+                # مشترکی که خودش ذخیره کرد نسخه جدیدتری تحویل داده است
+                if version < self._delivered:
+                    return
+                self._call(callback, copy.deepcopy(value))
+
+    @staticmethod
+    def _call(callback: Callable[[Any], None], value: Any):
+        try:
+            callback(value)
+        except Exception as e:
+            logger.error(f"Settings subscriber {getattr(callback, '__name__', callback)} error: {e}")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+اندازه‌گیری زمان مراحل پردازش هر درخواست و گزارش در هدر Server-Timing
+Per-request pipeline stage timings reported via the Server-Timing header
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from flask import g, has_request_context
+
+
+def current_timings() -> Dict[str, float]:
+    """دیکشنری زمان مراحل (میلی‌ثانیه) برای درخواست جاری"""
+    if not has_request_context():
+        return {}
+    if 'stage_timings' not in g:
+        g.stage_timings = {}
+    return g.stage_timings
+
+
+@contextmanager
+def stage(name: str, timings: Optional[Dict[str, float]] = None):
+    """
+    ثبت مدت زمان یک مرحله (retrieval، llm، tts، stt و ...).
+    خارج از context درخواست (مثلاً در کارهای پس‌زمینه) می‌توان دیکشنری timings را مستقیماً داد.
+    """
+    target = timings if timings is not None else current_timings()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        target[name] = target.get(name, 0.0) + elapsed
+
+
+def rounded_timings(timings: Dict[str, float]) -> Dict[str, float]:
+    """زمان مراحل با دقت یک دهم میلی‌ثانیه برای پاسخ‌های JSON"""
+    return {name: round(duration, 1) for name, duration in timings.items()}
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ', '.join(f'{name};dur={duration:.1f}' for name, duration in timings.items())
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """تبدیل هدر Server-Timing به دیکشنری {مرحله: میلی‌ثانیه}"""
+    timings = {}
+    for part in (header or '').split(','):
+        fields = [f.strip() for f in part.split(';')]
+        if not fields[0]:
+            continue
+        for field in fields[1:]:
+            if field.startswith('dur='):
+                try:
+                    timings[fields[0]] = float(field[4:])
+                except ValueError:
+                    pass
+    return timings
+
+
+def init_app(app):
+    """افزودن هدر Server-Timing به پاسخ‌هایی که مرحله‌ای را ثبت کرده‌اند"""
+    @app.after_request
+    def add_server_timing(response):
+        timings = g.get('stage_timings')
+        if timings:
+            response.headers['Server-Timing'] = server_timing_header(timings)
+        return response
+    return app
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+موتورهای تبدیل گفتار به متن (Google، AvalAI، Whisper محلی int8، Vosk) با مدل مقیم و صف محدود
+Pluggable speech-to-text backends with resident local models and a bounded worker pool
+"""
+
+import io
+import os
+import json
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional, Dict, Any, List
+
+import requests
+
+from audio_preprocess import SAMPLE_RATE, decode_pcm16k, prepare_for_stt
+from tts_cache import AUDIO_MIMETYPES, sniff_extension
+
+logger = logging.getLogger(__name__)
+
+
+class STTError(Exception):
+    """خطای تبدیل گفتار به متن"""
+
+
+class STTQueueFull(STTError):
+    """صف پردازش گفتار پر است؛ درخواست باید بعداً تکرار شود"""
+
+
+class STTBackend:
+    """رابط پایه موتورهای STT"""
+
+    name = 'base'
+    local = False
+
+    def load(self):
+        """بارگذاری مدل (برای موتورهای محلی یک بار در هر فرآیند)"""
+
+    def transcribe(self, audio: bytes, language: str = 'fa', api_key: str = None) -> Optional[str]:
+        raise NotImplementedError
+
+
+class GoogleSTT(STTBackend):
+    """سرویس رایگان Google از طریق SpeechRecognition"""
+
+    name = 'google'
+
+    def transcribe(self, audio, language='fa', api_key=None):
+        import speech_recognition as sr
+        audio_data = sr.AudioData(decode_pcm16k(audio), SAMPLE_RATE, 2)
+        try:
+            return sr.Recognizer().recognize_google(audio_data, language=f'{language}-IR' if language == 'fa' else language)
+        except sr.UnknownValueError:
+            return ''
+
+
+class AvalAISTT(STTBackend):
+    """API گفتار به متن AvalAI"""
+
+    name = 'avalai'
+
+    def __init__(self, model: str):
+        self.model = model
+        self.base_url = os.getenv('AVALAI_BASE_URL', 'https://api.avalai.ir/v1')
+        self.timeout = float(os.getenv('STT_REMOTE_TIMEOUT', 15))
+
+    def transcribe(self, audio, language='fa', api_key=None):
+        headers = {'Authorization': f"Bearer {api_key or os.getenv('AVALAI_API_KEY', '')}"}
+        # سرویس‌های سازگار با OpenAI قالب را از پسوند نام فایل تشخیص می‌دهند
+        extension = sniff_extension(audio)
+        if extension == 'bin' and audio[4:8] == b'ftyp':
+            extension = 'm4a'
+        files = {'file': (f'audio.{extension}', audio, AUDIO_MIMETYPES.get(extension, 'audio/mp4'))}
+        response = requests.post(f'{self.base_url}/audio/stt', data={'model': self.model, 'language': language},
+                                 files=files, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get('text')
+
+
+class WhisperSTT(STTBackend):
+    """Whisper محلی روی CPU با کوانتیزه int8 (faster-whisper)"""
+
+    name = 'faster-whisper'
+    local = True
+
+    def __init__(self, model_size: str = None, workers: int = 2):
+        self.model_size = model_size or os.getenv('STT_WHISPER_MODEL', 'small')
+        self.workers = workers
+        self.model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                from faster_whisper import WhisperModel
+                self.model = WhisperModel(self.model_size, device='cpu', compute_type='int8',
+                                          cpu_threads=int(os.getenv('STT_CPU_THREADS', 0)),
+                                          num_workers=self.workers)
+                logger.info(f"Loaded faster-whisper model '{self.model_size}' (int8)")
+        return self.model
+
+    def transcribe(self, audio, language='fa', api_key=None):
+        model = self.load()
+        segments, _ = model.transcribe(io.BytesIO(audio), language=language, beam_size=1, vad_filter=True)
+        return ' '.join(segment.text.strip() for segment in segments).strip()
+
+
+class VoskSTT(STTBackend):
+    """Vosk (Kaldi) محلی؛ مدل فارسی از VOSK_MODEL_PATH"""
+
+    name = 'vosk'
+    local = True
+
+    def __init__(self, model_path: str = None):
+        self.model_path = model_path or os.getenv('VOSK_MODEL_PATH', 'models/vosk-model-small-fa')
+        self.model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                from vosk import Model, SetLogLevel
+                SetLogLevel(-1)
+                self.model = Model(self.model_path)
+                logger.info(f"Loaded Vosk model from {self.model_path}")
+        return self.model
+
+    def transcribe(self, audio, language='fa', api_key=None):
+        from vosk import KaldiRecognizer
+        recognizer = KaldiRecognizer(self.load(), SAMPLE_RATE)
+        pcm = decode_pcm16k(audio)
+        for offset in range(0, len(pcm), 8000):
+            recognizer.AcceptWaveform(pcm[offset:offset + 8000])
+        return json.loads(recognizer.FinalResult()).get('text', '')
+
+
+def create_backend(spec: str, workers: int = 2) -> STTBackend:
+    """
+    ساخت موتور از روی مقدار stt_model:
+        google | faster-whisper[:size] | vosk[:model_path] | هر نام دیگر = مدل AvalAI
+    """
+    name, _, option = (spec or '').partition(':')
+    if name == 'google':
+        return GoogleSTT()
+    if name == 'faster-whisper':
+        return WhisperSTT(option or None, workers)
+    if name == 'vosk':
+        return VoskSTT(option or None)
+    return AvalAISTT(spec)
+
+
+class STTService:
+    """
+    اجرای تبدیل گفتار در poolهای ثابت با صف محدود. هر موتور یک بار ساخته می‌شود و مدل‌های
+    محلی در حافظه می‌مانند. موتورهای محلی و راه دور pool جداگانه دارند تا کندی API بالادستی
+    موتور محلی را معطل نکند؛ در صورت شکست یا کندی موتور اصلی، موتور fallback (STT_FALLBACK) اجرا می‌شود.
+    صدا پیش از ارسال رمزگشایی و از سکوت پاک می‌شود و ضبط‌های بلند به صورت بخش‌بندی‌شده و موازی تبدیل می‌شوند.
+    """
+
+    def __init__(self, default: str = None, fallback: str = None, workers: int = None,
+                 max_queue: int = None, timeout: float = None):
+        self.default = default or os.getenv('STT_BACKEND', 'google')
+        self.selected = ''  # موتور انتخاب‌شده در تنظیمات مدیریت (DoctorBotSettings.stt_model)
+        self.fallback = fallback if fallback is not None else os.getenv('STT_FALLBACK', '')
+        self.workers = workers or int(os.getenv('STT_WORKERS', 2))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv('STT_MAX_QUEUE', 8))
+        self.timeout = timeout or float(os.getenv('STT_TIMEOUT', 30))
+        self.preprocess = os.getenv('STT_PREPROCESS', '1') == '1'
+        self.max_segment_seconds = float(os.getenv('STT_MAX_SEGMENT_SECONDS', 15))
+        self._executors = {
+            True: ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='stt-local'),
+            False: ThreadPoolExecutor(max_workers=self.workers * 2, thread_name_prefix='stt-remote'),
+        }
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._backends: Dict[str, STTBackend] = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.fallbacks = 0
+        self.audio_seconds = 0.0
+        self.voiced_seconds = 0.0
+
+    def select(self, spec: Optional[str]):
+        """موتور تنظیمات مدیریت؛ خالی یعنی پیش‌فرض STT_BACKEND. هر درخواست بدون spec از این موتور استفاده می‌کند"""
+        self.selected = (spec or '').strip()
+
+    def backend(self, spec: str = None) -> STTBackend:
+        spec = spec or self.selected or self.default
+        with self._lock:
+            if spec not in self._backends:
+                self._backends[spec] = create_backend(spec, self.workers)
+            return self._backends[spec]
+
+    def preload(self, spec: str = None):
+        """بارگذاری پس‌زمینه مدل‌های محلی تا اولین درخواست منتظر نماند"""
+        for name in filter(None, {spec or self.selected or self.default, self.fallback}):
+            backend = self.backend(name)
+            if backend.local:
+                self._executors[True].submit(self._safe_load, backend)
+
+    @staticmethod
+    def _safe_load(backend: STTBackend):
+        try:
+            backend.load()
+        except Exception as e:
+            logger.error(f"STT model load error ({backend.name}): {e}")
+
+    def _run(self, backend: STTBackend, segments: List[bytes], language: str, api_key: str) -> Optional[str]:
+        """
+        پذیرش هر ضبط با یک جایگاه صف، صرف نظر از تعداد بخش‌ها؛ بخش‌ها درون همان جایگاه موازی اجرا
+        می‌شوند و جایگاه پس از پایان (یا لغو) آخرین بخش آزاد می‌شود. متن‌ها به ترتیب جمع‌آوری می‌شوند.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise STTQueueFull('STT queue is full')
+        # یک ارجاع برای همین نخ تا پایان ارسال و یکی برای هر بخش در حال اجرا
+        holders = [1]
+        holders_lock = threading.Lock()
+
+        def release(_=None):
+            with holders_lock:
+                holders[0] -= 1
+                last = holders[0] == 0
+            if last:
+                self._slots.release()
+
+        futures = []
+        try:
+            for segment in segments:
+                with holders_lock:
+                    holders[0] += 1
+                try:
+                    future = self._executors[backend.local].submit(backend.transcribe, segment, language, api_key)
+                except Exception:
+                    release()
+                    raise
+                future.add_done_callback(release)
+                futures.append(future)
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            release()
+        deadline = time.monotonic() + self.timeout
+        texts = []
+        try:
+            for future in futures:
+                text = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                if text is None:
+                    return None
+                texts.append(text.strip())
+        except FutureTimeout:
+            raise STTError(f'{backend.name} timed out after {self.timeout:g}s')
+        finally:
+            for future in futures:
+                future.cancel()
+        return ' '.join(text for text in texts if text)
+
+    def prepare(self, audio: bytes) -> List[bytes]:
+        """رمزگشایی، حذف سکوت و تقسیم صدا؛ در صورت خطای رمزگشایی صدای خام به موتور داده می‌شود"""
+        if not self.preprocess:
+            return [audio]
+        try:
+            segments, duration, voiced = prepare_for_stt(audio, self.max_segment_seconds)
+        except Exception as e:
+            logger.warning(f"STT preprocessing skipped: {e}")
+            return [audio]
+        with self._lock:
+            self.audio_seconds += duration
+            self.voiced_seconds += voiced
+        return segments
+
+    def _attempt(self, backend: STTBackend, segments: List[bytes], language: str, api_key: str) -> Optional[str]:
+        try:
+            return self._run(backend, segments, language, api_key)
+        except STTQueueFull:
+            raise
+        except Exception as e:
+            logger.error(f"STT error ({backend.name}): {e}")
+            return None
+
+    def transcribe(self, audio: bytes, spec: str = None, language: str = 'fa', api_key: str = None) -> Optional[str]:
+        """تبدیل گفتار به متن با موتور spec (یا پیش‌فرض)؛ STTQueueFull در صورت پر بودن صف"""
+        backend = self.backend(spec)
+        segments = self.prepare(audio)
+        if not segments:
+            return ''
+        text = self._attempt(backend, segments, language, api_key)
+        if text is None and self.fallback and self.backend(self.fallback) is not backend:
+            with self._lock:
+                self.fallbacks += 1
+            text = self._attempt(self.backend(self.fallback), segments, language, api_key)
+        if text is not None:
+            with self._lock:
+                self.completed += 1
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'default': self.default,
+                'selected': self.selected or None,
+                'fallback': self.fallback or None,
+                'backends': {spec: {'name': b.name, 'local': b.local,
+                                    'loaded': getattr(b, 'model', None) is not None}
+                             for spec, b in self._backends.items()},
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'fallbacks': self.fallbacks,
+                'audio_seconds': round(self.audio_seconds, 1),
+                'voiced_seconds': round(self.voiced_seconds, 1),
+            }
+
+
+stt_service = STTService()
@@ -0,0 +1,53 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+from advanced_tts import AdvancedTTS
+
+CHAIN = [{'provider': 'avalai', 'voice': 'nova'}]
+TEXT = 'بیماران مبتلا به فشار خون باید داروهای خود را منظم مصرف کنند و نمک کمتری بخورند. ' * 20
+
+
+@pytest.fixture
+def tts(tmp_path, monkeypatch):
+    monkeypatch.setenv('TTS_CACHE_DIR', str(tmp_path / 'tts_cache'))
+    monkeypatch.setenv('AVALAI_API_KEY', 'test')
+    monkeypatch.setenv('TTS_CHUNK_CHARS', '300')
+    monkeypatch.setenv('TTS_PROVIDER_CONCURRENCY', '2')
+    return AdvancedTTS()
+
+
+def test_long_text_is_synthesized_in_parallel_chunks(tts, monkeypatch):
+    lock = threading.Lock()
+    active, peak, calls = [0], [0], []
+
+    def dispatch(text, provider, voice, model, instructions):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            calls.append(text)
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return text.encode()
+
+    monkeypatch.setattr(tts, '_dispatch', dispatch)
+    chunks = list(tts.synthesize_stream(TEXT, CHAIN))
+    assert len(chunks) == len(calls) > 3
+    assert b' '.join(chunks).decode().split() == TEXT.split()
+    assert peak[0] == 2  # سقف همزمانی هر ارائه‌دهنده
+    audio, key = tts.synthesize_long(TEXT, CHAIN)
+    assert audio and tts.cache.get(key) == audio
+    # بار دوم از کش خوانده می‌شود
+    count = len(calls)
+    assert tts.synthesize_long(TEXT, CHAIN) == (audio, key)
+    assert len(calls) == count
+
+
+def test_failed_chunks_are_skipped(tts, monkeypatch):
+    monkeypatch.setattr(tts, '_dispatch', lambda text, *args: None)
+    assert list(tts.synthesize_stream(TEXT, CHAIN)) == []
+    assert tts.synthesize_long(TEXT, CHAIN) == (None, None)
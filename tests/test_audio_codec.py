@@ -0,0 +1,14 @@
+from audio_codec import AudioTranscoder, MAX_SKIPPED_KEYS
+
+
+def test_failed_keys_are_skipped_in_a_bounded_lru(monkeypatch):
+    transcoder = AudioTranscoder(codec='opus', ffmpeg='ffmpeg', wait=5)
+    calls = []
+    monkeypatch.setattr(transcoder, 'transcode', lambda data: calls.append(data))
+    data = b'RIFF' + b'\x00' * 100
+    assert transcoder.compact(data, 'k0') == (data, 'k0')
+    assert transcoder.compact(data, 'k0') == (data, 'k0')
+    assert len(calls) == 1
+    for index in range(MAX_SKIPPED_KEYS + 10):
+        transcoder._job(data, f'x{index}')
+    assert len(transcoder._skip) == MAX_SKIPPED_KEYS
@@ -0,0 +1,51 @@
+import numpy as np
+
+from audio_preprocess import SAMPLE_RATE, decode_pcm16k, prepare_for_stt, split_on_silence, to_wav, trim_silence
+
+
+def tone(seconds, amplitude, freq=220):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def silence(seconds, noise=0):
+    rng = np.random.default_rng(0)
+    return rng.integers(-noise, noise + 1, int(seconds * SAMPLE_RATE)).astype(np.int16)
+
+
+def seconds(pcm):
+    return len(pcm) / 2 / SAMPLE_RATE
+
+
+def test_trim_removes_leading_and_trailing_silence():
+    pcm = np.concatenate([silence(2, 5), tone(1, 8000), silence(2, 5)]).tobytes()
+    trimmed = trim_silence(pcm)
+    assert 1.0 <= seconds(trimmed) <= 1.5
+
+
+def test_quiet_speech_is_not_trimmed_away():
+    pcm = tone(2, 350).tobytes()
+    assert seconds(trim_silence(pcm)) > 1.9
+
+
+def test_digital_silence_is_empty():
+    assert trim_silence(silence(1).tobytes()) == b''
+    segments, duration, speech = prepare_for_stt(to_wav(silence(1).tobytes()))
+    assert segments == [] and duration == 1.0 and speech == 0.0
+
+
+def test_long_recording_is_split_at_silence():
+    parts = []
+    for _ in range(4):
+        parts += [tone(9, 8000), silence(0.6, 5)]
+    pcm = np.concatenate(parts).tobytes()
+    segments = split_on_silence(pcm, max_seconds=15)
+    # هر برش در سکوت بین دو بخش ۹ ثانیه‌ای است، نه در سقف ۱۵ ثانیه
+    assert len(segments) == 4
+    assert all(9 <= seconds(segment) <= 10 for segment in segments)
+    assert b''.join(segments) == pcm
+
+
+def test_wav_round_trip_without_ffmpeg():
+    pcm = tone(0.5, 1000).tobytes()
+    assert decode_pcm16k(to_wav(pcm)) == pcm
@@ -0,0 +1,77 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from audio_response import AUDIO_MAX_AGE, send_audio, send_cached_audio
+from tts_cache import TTSCache
+
+KEY = 'a' * 64
+WAV = b'RIFF' + bytes(range(60))
+
+
+@pytest.fixture
+def client(tmp_path):
+    cache = TTSCache(tmp_path)
+    cache.put(KEY, WAV)
+    app = flask.Flask(__name__)
+
+    @app.route('/tts_audio/<key>')
+    def tts_audio(key):
+        response = send_cached_audio(cache, key)
+        if response is None:
+            return flask.jsonify({'error': 'Audio not found'}), 404
+        return response
+
+    @app.route('/api/tts')
+    def api_tts():
+        return send_audio(WAV, KEY)
+
+    return app.test_client()
+
+
+def assert_cache_headers(response):
+    assert response.headers['ETag'] == f'"{KEY}"'
+    assert response.cache_control.max_age == AUDIO_MAX_AGE
+    assert response.cache_control.immutable
+
+
+@pytest.mark.parametrize('url', [f'/tts_audio/{KEY}', '/api/tts'])
+def test_full_response_has_cache_headers(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == WAV
+    assert response.mimetype == 'audio/wav'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert_cache_headers(response)
+
+
+def test_cached_audio_is_public(client):
+    response = client.get(f'/tts_audio/{KEY}')
+    assert response.cache_control.public
+
+
+@pytest.mark.parametrize('url', [f'/tts_audio/{KEY}', '/api/tts'])
+def test_matching_etag_returns_304(client, url):
+    response = client.get(url, headers={'If-None-Match': f'"{KEY}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert_cache_headers(response)
+
+
+@pytest.mark.parametrize('url', [f'/tts_audio/{KEY}', '/api/tts'])
+def test_range_returns_partial_content(client, url):
+    response = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 0-9/{len(WAV)}'
+    assert response.data == WAV[:10]
+
+
+@pytest.mark.parametrize('url', [f'/tts_audio/{KEY}', '/api/tts'])
+def test_unsatisfiable_range_returns_416(client, url):
+    response = client.get(url, headers={'Range': f'bytes={len(WAV) + 10}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(WAV)}'
+
+
+def test_missing_key_returns_404(client):
+    assert client.get(f'/tts_audio/{"b" * 64}').status_code == 404
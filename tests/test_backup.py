@@ -0,0 +1,117 @@
+import gzip
+import os
+import sqlite3
+import time
+
+import pytest
+
+from backup import BackupError, BackupManager
+
+
+def run_backup(manager):
+    job = manager.start()
+    deadline = time.time() + 10
+    while job.status not in ('done', 'failed') and time.time() < deadline:
+        time.sleep(0.01)
+    assert job.status == 'done', job.error
+    return job
+
+
+def make_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS notes (text TEXT)')
+    conn.executemany('INSERT INTO notes VALUES (?)', [(row,) for row in rows])
+    conn.commit()
+    return conn
+
+
+def notes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT text FROM notes ORDER BY rowid')]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def sources(tmp_path):
+    data = tmp_path / 'data'
+    (data / 'segments').mkdir(parents=True)
+    (data / 'segments' / 'a.bin').write_bytes(b'a' * 5000)
+    (data / 'b.txt').write_text('فایل ب', encoding='utf-8')
+    db = tmp_path / 'chat.sqlite3'
+    conn = make_db(str(db), ['اول', 'دوم'])
+    yield {'data': str(data), 'chat': str(db)}
+    conn.close()
+
+
+def test_incremental_backup_writes_only_changes(tmp_path, sources):
+    manager = BackupManager(str(tmp_path / 'backups'), sources)
+    first = run_backup(manager)
+    assert first.files_total == 3 and first.files_written == 3
+    second = run_backup(manager)
+    assert second.files_written == 0 and second.bytes_written == 0
+    with open(os.path.join(sources['data'], 'b.txt'), 'a', encoding='utf-8') as f:
+        f.write(' تغییر')
+    third = run_backup(manager)
+    assert third.files_written == 1
+    assert [m['id'] for m in manager.manifests()] == [third.id, second.id, first.id]
+
+
+def test_sqlite_snapshot_includes_uncheckpointed_wal(tmp_path, sources):
+    conn = make_db(sources['chat'], ['سوم'])  # هنوز در WAL، فایل اصلی تغییر نکرده
+    manager = BackupManager(str(tmp_path / 'backups'), sources)
+    job = run_backup(manager)
+    entry = manager.manifest(job.id)['files']['chat/chat.sqlite3']
+    assert entry['sqlite']
+    target = str(tmp_path / 'restored.sqlite3')
+    manager.restore(job.id, 'chat', target)
+    assert notes(target) == ['اول', 'دوم', 'سوم']
+    conn.close()
+
+
+def test_restore_directory_and_checksum(tmp_path, sources):
+    manager = BackupManager(str(tmp_path / 'backups'), sources)
+    job = run_backup(manager)
+    target = tmp_path / 'restored'
+    result = manager.restore(job.id, 'data', str(target))
+    assert result['files'] == 2
+    assert (target / 'segments' / 'a.bin').read_bytes() == b'a' * 5000
+    with pytest.raises(BackupError):
+        manager.restore(job.id, 'data', str(target))
+    # blob دستکاری‌شده با checksum رد می‌شود
+    entry = manager.manifest(job.id)['files']['data/b.txt']
+    with gzip.open(manager._blob_path(entry['sha256']), 'wb') as f:
+        f.write(b'corrupt')
+    with pytest.raises(BackupError):
+        manager.restore(job.id, 'data', str(tmp_path / 'again'))
+    assert not (tmp_path / 'again').exists()
+
+
+def test_restore_sqlite_into_open_database(tmp_path, sources):
+    manager = BackupManager(str(tmp_path / 'backups'), sources)
+    job = run_backup(manager)
+    live = make_db(sources['chat'], ['بعد از پشتیبان'])
+    assert notes(sources['chat']) == ['اول', 'دوم', 'بعد از پشتیبان']
+    manager.restore_sqlite(job.id, 'chat', sources['chat'])
+    assert [row[0] for row in live.execute('SELECT text FROM notes ORDER BY rowid')] == ['اول', 'دوم']
+    live.close()
+    with pytest.raises(BackupError):
+        manager.restore_sqlite(job.id, 'data', str(tmp_path / 'x.sqlite3'))
+
+
+def test_maintenance_runs_before_scan_and_prune_keeps_latest(tmp_path, sources):
+    calls = []
+
+    def failing():
+        raise RuntimeError('boom')
+
+    manager = BackupManager(str(tmp_path / 'backups'), sources, keep=2, maintenance=[failing, lambda: calls.append(1)])
+    for _ in range(3):
+        run_backup(manager)
+    assert calls == [1, 1, 1]
+    assert len(manager.manifests()) == 2
+    referenced = {entry['sha256'] for summary in manager.manifests()
+                  for entry in manager.manifest(summary['id'])['files'].values()}
+    assert {name[:-3] for name in os.listdir(manager.blob_dir)} == referenced
@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from bench_data import main, synthesize_documents, write_corpus, write_doctors
+from doctor_directory import DoctorDirectory
+from generate_excel import COLUMN_ORDER, SPECIALTIES
+
+
+def test_doctor_table_is_chunked_and_reproducible(tmp_path):
+    first, second = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    report = write_doctors(str(first), rows=1000, chunk_rows=300, seed=7)
+    write_doctors(str(second), rows=1000, chunk_rows=300, seed=7)
+    assert report['rows'] == 1000 and report['format'] == 'csv'
+    assert first.read_bytes() == second.read_bytes()
+    frame = pd.read_csv(first)
+    assert list(frame.columns) == ['شناسه'] + COLUMN_ORDER
+    assert frame['شناسه'].tolist() == list(range(1, 1001))
+    assert set(frame['رشته تخصصی']) <= set(SPECIALTIES)
+    # جدول تولیدشده مستقیماً منبع فهرست پزشکان است
+    assert len(DoctorDirectory(str(first)).frame()) == 1000
+
+
+def test_documents_use_the_specialty_terms():
+    documents = synthesize_documents(np.random.default_rng(1), 'قلب و عروق', docs=2, sentences=8)
+    assert len(documents) == 2
+    assert all('قلب و عروق' in document['title'] for document in documents)
+    assert all(len(document['text'].split('\n\n')) == 2 for document in documents)
+
+
+def test_corpus_layouts_and_table_alignment(tmp_path):
+    table = tmp_path / 'doctors.csv'
+    write_doctors(str(table), rows=5, seed=3)
+    report = write_corpus(str(tmp_path / 'jsonl'), doctors=5, docs_per_doctor=2, sentences=4,
+                          shard_doctors=2, seed=3, table=str(table))
+    assert report['documents'] == 10
+    shards = sorted((tmp_path / 'jsonl').glob('shard-*.jsonl'))
+    assert len(shards) == 3
+    records = [json.loads(line) for shard in shards for line in shard.read_text(encoding='utf-8').splitlines()]
+    assert records[0]['doc_id'] == 'doctor_0000001/001'
+    assert [r['specialty'] for r in records[::2]] == pd.read_csv(table)['رشته تخصصی'].tolist()
+
+    write_corpus(str(tmp_path / 'folders'), doctors=2, docs_per_doctor=3, sentences=4, layout='folders')
+    assert sorted(p.name for p in (tmp_path / 'folders' / 'doctor_0000002').iterdir()) == \
+        ['doc_001.txt', 'doc_002.txt', 'doc_003.txt']
+
+
+def test_cli_writes_manifest(tmp_path, capsys):
+    out = tmp_path / 'doctors.csv'
+    assert main(['--seed', '5', 'doctors', '--rows', '10', '--out', str(out)]) == 0
+    manifest = json.loads((tmp_path / 'doctors.csv.manifest.json').read_text(encoding='utf-8'))
+    assert manifest['rows'] == 10 and manifest['seed'] == 5
+    assert json.loads(capsys.readouterr().out)['path'] == str(out)
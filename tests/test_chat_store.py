@@ -0,0 +1,100 @@
+import os
+import time
+
+import pytest
+
+from chat_store import MemoryChatStore, SQLiteChatStore, create_chat_store
+from tts_cache import TTSCache
+
+WAV = b'RIFF' + b'\x00' * 60
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryChatStore()
+    return SQLiteChatStore(str(tmp_path / 'chat.sqlite3'))
+
+
+def fill(store, sid, count):
+    return [store.append(sid, {'type': 'user', 'speaker': 'کاربر', 'text': f'پیام {index}'}) for index in range(count)]
+
+
+def test_page_walks_backwards(store):
+    ids = fill(store, 'a', 7)
+    fill(store, 'b', 2)
+    messages, has_more = store.page('a', limit=3)
+    assert [m['text'] for m in messages] == ['پیام 4', 'پیام 5', 'پیام 6'] and has_more
+    messages, has_more = store.page('a', before=ids[4], limit=3)
+    assert [m['text'] for m in messages] == ['پیام 1', 'پیام 2', 'پیام 3'] and has_more
+    messages, has_more = store.page('a', before=ids[1], limit=3)
+    assert [m['id'] for m in messages] == [ids[0]] and not has_more
+    assert store.page('missing') == ([], False)
+
+
+def test_extra_fields_round_trip(store):
+    store.append('a', {'type': 'bot', 'audio_url': '/tts_audio/x', 'doctor': 'دکتر الف'})
+    (message,), _ = store.page('a')
+    assert message['audio_url'] == '/tts_audio/x' and message['doctor'] == 'دکتر الف'
+
+
+def test_text_turns_skip_audio_only_messages(store):
+    store.append('a', {'type': 'user', 'text': 'سلام'})
+    store.append('a', {'type': 'user', 'audio_url': '/voice/1'})
+    store.append('a', {'type': 'bot', 'text': 'درود'})
+    store.append('a', {'type': 'user', 'text': 'سوال'})
+    assert [m['text'] for m in store.text_turns('a')] == ['سلام', 'درود', 'سوال']
+    assert [m['text'] for m in store.text_turns('a', since=2)] == ['سوال']
+
+
+def test_set_memory_is_optimistic(store):
+    fill(store, 'a', 1)
+    assert store.memory('a') == {'summary': '', 'upto': 0}
+    assert store.set_memory('a', {'summary': 'خلاصه', 'upto': 4}, expected_upto=0)
+    assert not store.set_memory('a', {'summary': 'دیگر', 'upto': 6}, expected_upto=0)
+    assert store.memory('a') == {'summary': 'خلاصه', 'upto': 4}
+
+
+def test_clear_and_purge(store):
+    fill(store, 'old', 2)
+    fill(store, 'new', 2)
+    assert store.purge(time.time() - 60) == 0
+    cutoff = time.time()
+    time.sleep(0.01)
+    fill(store, 'new', 1)
+    assert store.purge(cutoff) == 1
+    assert store.page('old') == ([], False)
+    assert len(store.page('new')[0]) == 3
+    store.clear('new')
+    assert store.page('new') == ([], False)
+    assert store.purge_expired(days=0) == 0
+
+
+def test_clear_and_purge_release_pinned_audio(store, tmp_path):
+    cache = TTSCache(tmp_path / 'tts', max_bytes=len(WAV))
+    store.subscribe_removed(lambda urls: [cache.unpin(url.rsplit('/', 1)[-1]) for url in urls])
+    for key, sid in (('a', 'old'), ('b', 'new'), ('b', 'other')):
+        cache.put(key * 64, WAV)
+        assert cache.pin(key * 64)
+        store.append(sid, {'type': 'bot', 'audio_url': f'/tts_audio/{key * 64}'})
+    assert cache.stats()['pinned'] == 2
+    cutoff = time.time()
+    time.sleep(0.01)
+    store.append('new', {'type': 'user', 'text': 'سلام'})
+    store.append('other', {'type': 'user', 'text': 'سلام'})
+    assert store.purge(cutoff) == 1
+    assert cache.stats()['pinned'] == 1
+    store.clear('new')
+    # صدای مشترک تا حذف آخرین گفتگوی ارجاع‌دهنده سنجاق می‌ماند
+    assert cache.stats()['pinned'] == 1
+    store.clear('other')
+    assert cache.stats()['pinned'] == 0
+    assert os.listdir(cache.pinned_dir) == [TTSCache.REFS_FILE]
+    assert cache.stats()['bytes'] <= len(WAV)
+
+
+def test_create_chat_store(tmp_path):
+    assert isinstance(create_chat_store('memory'), MemoryChatStore)
+    assert isinstance(create_chat_store(f"sqlite:///{tmp_path / 'chat.sqlite3'}"), SQLiteChatStore)
+    with pytest.raises(ValueError):
+        create_chat_store('redis://localhost')
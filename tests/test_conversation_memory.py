@@ -0,0 +1,64 @@
+from conversation_memory import ConversationMemory, estimate_tokens, truncate_tokens
+
+
+def history(count):
+    return [{'speaker': 'user' if index % 2 == 0 else 'bot', 'text': f'پیام {index}'} for index in range(count)]
+
+
+class FakeLLM:
+    def __init__(self, answer='خلاصه جدید'):
+        self.answer = answer
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+
+def test_truncate_tokens():
+    assert estimate_tokens('') == 0 and estimate_tokens('abcde') == 2
+    assert truncate_tokens('abcdefghij', 1) == 'abcd'
+    assert truncate_tokens('abcdefghij', 1, keep='tail') == 'ghij'
+
+
+def test_update_folds_in_batches():
+    memory = ConversationMemory(max_turns=4, fold_batch=3)
+    llm = FakeLLM()
+    assert memory.update(history(6), None, llm) == {'summary': '', 'upto': 0}
+    assert not llm.prompts
+    state = memory.update(history(7), None, llm)
+    assert state == {'summary': 'خلاصه جدید', 'upto': 3}
+    assert 'پیام 2' in llm.prompts[0] and 'پیام 3' not in llm.prompts[0]
+
+
+def test_update_without_llm_keeps_recent_turns():
+    memory = ConversationMemory(max_turns=2, fold_batch=2, summary_token_budget=8)
+    state = memory.update(history(20), None, FakeLLM(RuntimeError('down')))
+    assert state['upto'] == 18
+    assert len(state['summary']) <= 32 and state['summary'].endswith('پیام 17')
+
+
+def test_offset_reads_only_unsummarized_turns():
+    memory = ConversationMemory(max_turns=2, fold_batch=2)
+    # ذخیره‌ساز فقط نوبت‌های ۱۰ به بعد را برمی‌گرداند
+    turns = history(16)[10:]
+    state = memory.update(turns, {'summary': 'قبلی', 'upto': 10}, FakeLLM('ادغام'), offset=10)
+    assert state == {'summary': 'ادغام', 'upto': 14}
+    recent = memory.recent_history(turns, state, offset=10)
+    assert recent.splitlines() == ['بیمار: پیام 14', 'دستیار: پیام 15']
+
+
+def test_recent_history_skips_audio_only_and_is_bounded():
+    memory = ConversationMemory(max_turns=2, fold_batch=1)
+    chat = history(10) + [{'speaker': 'user', 'audio_url': '/voice/1'}]
+    assert memory.recent_history(chat).splitlines() == ['دستیار: پیام 7', 'بیمار: پیام 8', 'دستیار: پیام 9']
+    assert memory.prompt_inputs([], None) == ('-', '-')
+
+
+def test_rewrite_query_adds_previous_user_turns():
+    memory = ConversationMemory(query_token_budget=12)
+    chat = [{'speaker': 'user', 'text': 'متفورمین'}, {'speaker': 'bot', 'text': 'دارو دیابت'}]
+    assert memory.rewrite_query('دوزش چقدر است؟', chat) == 'متفورمین دوزش چقدر است؟'
+    assert memory.rewrite_query('سلام', []) == 'سلام'
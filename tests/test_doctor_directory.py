@@ -0,0 +1,149 @@
+import os
+
+import pandas as pd
+import pytest
+
+from doctor_directory import (CANDIDATE_COLUMNS, DoctorAttributeIndex, DoctorDirectory, experience_bucket,
+                              matched_specialties, needs_non_persian, patient_urgency, select_candidates)
+
+
+def write_csv(path, names):
+    pd.DataFrame({'نام': names, CANDIDATE_COLUMNS['city']: ['تهران'] * len(names),
+                  CANDIDATE_COLUMNS['rating']: range(len(names))}).to_csv(path, index=False)
+
+
+def test_directory_loads_once_and_reloads_on_change(tmp_path):
+    path = tmp_path / 'doctors.csv'
+    write_csv(path, ['الف', 'ب'])
+    directory = DoctorDirectory(str(path), check_interval=0)
+    frame = directory.frame()
+    assert len(frame) == 2 and directory.version == 1
+    assert directory.frame() is frame
+    assert frame[CANDIDATE_COLUMNS['city']].dtype == 'category'
+    write_csv(path, ['الف', 'ب', 'ج'])
+    assert len(directory.frame()) == 3 and directory.version == 2
+    assert 'ج' in set(directory.frame()['نام'])
+    assert directory.stats()['rows'] == 3
+
+
+def test_directory_checks_the_file_at_most_every_interval(tmp_path):
+    path = tmp_path / 'doctors.csv'
+    write_csv(path, ['الف'])
+    directory = DoctorDirectory(str(path), check_interval=60)
+    frame = directory.frame()
+    write_csv(path, ['الف', 'ب'])
+    assert directory.frame() is frame
+    with pytest.raises(FileNotFoundError):
+        DoctorDirectory(str(tmp_path / 'missing.csv')).frame()
+
+
+def test_parquet_cache_requires_the_exact_source_signature(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = tmp_path / 'doctors.csv'
+    write_csv(path, ['الف', 'ب'])
+    DoctorDirectory(str(path)).frame()
+    assert (tmp_path / 'doctors.parquet').exists()
+    write_csv(path, ['الف', 'ب', 'ج'])
+    # منبع جدید با زمان تغییر قدیمی‌تر از Parquet (مثلاً بازگردانی از پشتیبان) باز هم خوانده می‌شود
+    old = os.stat(tmp_path / 'doctors.parquet').st_mtime_ns - 10 ** 9
+    os.utime(path, ns=(old, old))
+    directory = DoctorDirectory(str(path))
+    assert len(directory.frame()) == 3
+    assert directory._parquet_signature() == directory.signature
+    assert len(DoctorDirectory(str(path)).frame()) == 3
+
+
+def test_specialty_keywords_match_whole_words():
+    assert matched_specialties('قلبم تیر می‌کشد') == ['قلب و عروق']
+    assert matched_specialties('سردردهای شدید دارم') == ['اعصاب و روان']
+    # «مورد» شامل «مو» و «تبریز» شامل «تب» است ولی واژه کامل نیستند
+    assert matched_specialties('در مورد سردرد') == ['اعصاب و روان']
+    assert matched_specialties('ساکن تبریز هستم') == []
+
+
+def test_needs_non_persian():
+    for language in ('فارسی', 'Farsi', 'fa', 'fa-IR', 'fa_IR', None, ''):
+        assert not needs_non_persian(language)
+    for language in ('english', 'ترکی', 'fr'):
+        assert needs_non_persian(language)
+
+
+def test_patient_urgency():
+    assert patient_urgency('بسیار اورژانسی') == 2
+    assert patient_urgency('حاد') == 1
+    assert patient_urgency(None) == 0
+
+
+def doctors():
+    rows = [{CANDIDATE_COLUMNS['specialty']: 'داخلی', CANDIDATE_COLUMNS['city']: 'تهران',
+             CANDIDATE_COLUMNS['language']: 'فقط فارسی', CANDIDATE_COLUMNS['rating']: 9,
+             CANDIDATE_COLUMNS['experience']: 20, 'نام': f'دکتر {index}'} for index in range(40)]
+    rows[30].update({CANDIDATE_COLUMNS['specialty']: 'قلب و عروق', CANDIDATE_COLUMNS['city']: 'شیراز',
+                     CANDIDATE_COLUMNS['rating']: 5, 'نام': 'دکتر قلب'})
+    rows[35].update({CANDIDATE_COLUMNS['city']: 'شیراز', CANDIDATE_COLUMNS['language']: 'فارسی و انگلیسی',
+                     'نام': 'دکتر انگلیسی'})
+    return pd.DataFrame(rows)
+
+
+def test_select_candidates_ranks_specialty_first():
+    top = select_candidates(doctors(), {'problem': 'تپش قلب دارم', 'city': 'تهران'}, top_n=5)
+    assert len(top) == 5
+    assert top.iloc[0]['نام'] == 'دکتر قلب'
+
+
+def test_select_candidates_language_and_city():
+    top = select_candidates(doctors(), {'problem': '', 'city': 'شیراز', 'language': 'english'}, top_n=3)
+    assert top.iloc[0]['نام'] == 'دکتر انگلیسی'
+
+
+def test_small_frames_are_returned_unchanged():
+    frame = doctors().head(10)
+    assert select_candidates(frame, {'problem': 'قلب'}, top_n=15) is frame
+
+
+def attribute_index():
+    return DoctorAttributeIndex({
+        'a': {'name': 'الف', 'city': 'تهران', 'specialty': 'قلب و عروق', 'experience': 12},
+        'b': {'name': 'ب', 'city': 'شيراز', 'specialty': 'اطفال', 'experience': '5-10'},
+        'c': {'name': 'ج', 'city': 'tehran', 'specialty': 'فوق تخصص قلب و عروق', 'experience': 3},
+        'd': {'name': 'د', 'city': 'مشهد', 'specialty': 'پزشک عمومی', 'experience': 25},
+    })
+
+
+def test_experience_bucket():
+    assert [experience_bucket(value) for value in (2, '7', 10, '10+', 'نامشخص')] == ['1-5', '5-10', '10+', '10+', None]
+
+
+def test_search_accepts_form_keys_and_labels():
+    index = attribute_index()
+    assert list(index.search(city='tehran')[0]) == ['a', 'c']
+    assert list(index.search(city='تهران', specialty='cardiologist')[0]) == ['a', 'c']
+    # «ي» عربی در داده با کلید فرم یکی می‌شود
+    assert list(index.search(city='shiraz')[0]) == ['b']
+    assert list(index.search(specialty='cardiologist', experience='10+')[0]) == ['a']
+    assert index.search(city='all', specialty='', experience='all')[1] == 4
+    assert index.search(city='isfahan') == ({}, 0)
+
+
+def test_search_pagination():
+    index = attribute_index()
+    first, total = index.search(page=1, per_page=3)
+    second, _ = index.search(page=2, per_page=3)
+    assert total == 4 and list(first) == ['a', 'b', 'c'] and list(second) == ['d']
+
+
+def test_add_replaces_doctor_and_clears_cached_results():
+    index = attribute_index()
+    assert index.search(city='mashhad')[1] == 1
+    index.add('d', {'name': 'د', 'city': 'تهران', 'specialty': 'پزشک عمومی', 'experience': 25})
+    assert index.search(city='mashhad')[1] == 0
+    assert list(index.search(city='tehran')[0]) == ['a', 'c', 'd']
+    assert len(index) == 4
+
+
+def test_facets_count_each_option():
+    facets = attribute_index().facets()
+    cities = {item['key']: item['count'] for item in facets['city']}
+    specialties = {item['key']: item['count'] for item in facets['specialty']}
+    assert cities['all'] == 4 and cities['tehran'] == 2 and cities['isfahan'] == 0
+    assert specialties['cardiologist'] == 2 and specialties['general'] == 1
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from doctor_directory import CANDIDATE_COLUMNS, DoctorDirectory
+from doctor_index import DoctorIndex
+
+WORDS = ['قلب', 'کودک', 'پوست', 'سردرد']
+
+
+class FakeEmbeddings:
+    """بردار کیسه واژه روی چند واژه ثابت"""
+
+    model_name = 'fake'
+
+    def __init__(self):
+        self.documents = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(word in text) for word in WORDS] + [0.01]
+
+
+def make_index(tmp_path, rows=None):
+    rows = rows or [
+        ('دکتر قلب تهران', 'قلب و عروق', 'تهران', 'فقط فارسی', 'مهم نیست'),
+        ('دکتر قلب شیراز', 'قلب و عروق', 'شیراز', 'فارسی و انگلیسی', 'اورژانسی'),
+        ('دکتر کودک', 'اطفال کودک', 'تهران', 'فقط فارسی', 'مهم نیست'),
+        ('دکتر پوست', 'پوست و مو', 'شیراز', 'فقط فارسی', 'مهم نیست'),
+    ] * 3
+    path = tmp_path / 'doctors.csv'
+    pd.DataFrame(rows, columns=['نام', CANDIDATE_COLUMNS['specialty'], CANDIDATE_COLUMNS['city'],
+                                CANDIDATE_COLUMNS['language'], CANDIDATE_COLUMNS['urgency']]).to_csv(path, index=False)
+    directory = DoctorDirectory(str(path), check_interval=0)
+    return DoctorIndex(directory, str(tmp_path / 'doctor_index'))
+
+
+def test_duplicate_profiles_are_embedded_once(tmp_path):
+    index = make_index(tmp_path)
+    model = FakeEmbeddings()
+    index.build(model)
+    assert model.documents == 3 and index.stats()['rows'] == 12
+    assert np.allclose(np.linalg.norm(index.vectors, axis=1), 1)
+
+
+def test_search_ranks_by_similarity_with_city_boost(tmp_path):
+    index = make_index(tmp_path)
+    model = FakeEmbeddings()
+    index.build(model)
+    top = index.search('درد قلب دارم', model, {'city': 'شیراز'}, k=2)
+    assert list(top['نام']) == ['دکتر قلب شیراز', 'دکتر قلب شیراز']
+    top = index.search('درد قلب دارم', model, {'city': 'تهران'}, k=1)
+    assert list(top['نام']) == ['دکتر قلب تهران']
+    # هم‌شهری بودن شباهت کم را جبران نمی‌کند
+    assert index.search('کودکم تب دارد', model, {'city': 'شیراز'}, k=1)['نام'].iloc[0] == 'دکتر کودک'
+
+
+def test_structured_filters(tmp_path):
+    index = make_index(tmp_path)
+    model = FakeEmbeddings()
+    index.build(model)
+    assert set(index.search('پوست', model, {'language': 'english'}, k=10)['نام']) == {'دکتر قلب شیراز'}
+    # پزشکی که فقط تا سطح «اورژانسی» می‌پذیرد برای بیمار «بسیار اورژانسی» کنار گذاشته می‌شود
+    urgent = index.search('قلب', model, {'urgency': 'بسیار اورژانسی'}, k=3)
+    assert list(urgent['نام']) == ['دکتر قلب تهران'] * 3
+
+
+def test_saved_index_is_reused_until_source_changes(tmp_path):
+    index = make_index(tmp_path)
+    index.build(FakeEmbeddings())
+    reopened = DoctorIndex(index.directory, index.index_dir)
+    assert reopened.load(FakeEmbeddings())
+    assert reopened.ensure(FakeEmbeddings())
+
+    class OtherModel(FakeEmbeddings):
+        model_name = 'other'
+
+    assert not reopened.load(OtherModel())
+    make_index(tmp_path, rows=[('دکتر تازه', 'قلب', 'تهران', 'فقط فارسی', 'مهم نیست')])
+    assert not reopened.load(FakeEmbeddings())
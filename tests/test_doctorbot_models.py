@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from flask import Flask
+
+import doctorbot_models
+from doctorbot_models import DocumentChunk, MedicalDocument, bulk_upsert_documents, db, init_storage, \
+    iter_doctor_context, split_text
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    return app
+
+
+def test_split_text_prefers_word_boundaries():
+    chunks = split_text('سلام دنیا ' * 30, size=25)
+    assert all(len(chunk) <= 25 for chunk in chunks)
+    assert all(chunk.endswith('دنیا') or chunk.endswith('سلام') for chunk in chunks)
+    assert ' '.join(chunks).split() == ('سلام دنیا ' * 30).split()
+    assert split_text('') == []
+
+
+def test_bulk_upsert_inserts_and_updates(tmp_path):
+    app = make_app(tmp_path / 'doctorbot.db')
+    init_storage(app)
+    with app.app_context():
+        ids = bulk_upsert_documents([
+            {'doctor_name': 'الف', 'filename': 'a.txt', 'content': 'متن اول'},
+            {'doctor_name': 'الف', 'filename': 'b.txt', 'content': 'متن دوم'},
+            {'doctor_name': 'ب', 'filename': 'a.txt', 'content': 'متن سوم'},
+        ])
+        assert len(set(ids.values())) == 3
+        again = bulk_upsert_documents([
+            {'doctor_name': 'الف', 'filename': 'a.txt', 'content': 'متن تازه'},
+            {'doctor_name': 'ب', 'filename': 'c.txt', 'content': 'متن چهارم'},
+        ])
+        assert again[('الف', 'a.txt')] == ids[('الف', 'a.txt')]
+        assert MedicalDocument.query.count() == 4
+        assert db.session.get(MedicalDocument, ids[('الف', 'a.txt')]).content == 'متن تازه'
+        assert list(iter_doctor_context('الف')) == ['متن تازه', 'متن دوم']
+        assert DocumentChunk.query.count() == 4
+
+
+def test_context_is_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(doctorbot_models, 'CHUNK_CHARS', 10)
+    app = make_app(tmp_path / 'doctorbot.db')
+    init_storage(app)
+    with app.app_context():
+        bulk_upsert_documents([{'doctor_name': 'الف', 'filename': 'a.txt', 'content': 'واژه ' * 40}])
+        chunks = list(iter_doctor_context('الف', max_chars=35))
+        assert chunks and sum(map(len, chunks)) <= 35
+        assert len(list(iter_doctor_context('الف', max_chars=0))) == DocumentChunk.query.count()
+
+
+def test_migrations_backfill_legacy_database(tmp_path):
+    path = tmp_path / 'doctorbot.db'
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE medical_documents (id INTEGER PRIMARY KEY, doctor_name VARCHAR(200) NOT NULL, '
+                 'filename VARCHAR(200), content TEXT, embedding BLOB)')
+    conn.executemany('INSERT INTO medical_documents (doctor_name, filename, content) VALUES (?, ?, ?)',
+                     [('الف', f'{index}.txt', f'سند {index}') for index in range(150)])
+    conn.commit()
+    conn.close()
+    app = make_app(path)
+    init_storage(app)
+    init_storage(app)  # مهاجرت‌های اجراشده دوباره اجرا نمی‌شوند
+    with app.app_context():
+        assert DocumentChunk.query.count() == 150
+        assert next(iter_doctor_context('الف')) == 'سند 0'
+    conn = sqlite3.connect(path)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(doctorbot_models.MIGRATIONS)
+    indexes = {row[1] for row in conn.execute("SELECT * FROM sqlite_master WHERE type = 'index'")}
+    assert 'ix_medical_documents_doctor_filename' in indexes
+    conn.close()
@@ -0,0 +1,77 @@
+import json
+
+from event_log import EventLog, format_line, parse_line, tail_lines
+
+
+def read_records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_tail_lines_reads_from_the_end(tmp_path, monkeypatch):
+    monkeypatch.setattr('event_log.TAIL_BLOCK_SIZE', 64)
+    path = tmp_path / 'log.txt'
+    path.write_text(''.join(f'خط {index}\n' for index in range(500)), encoding='utf-8')
+    assert tail_lines(str(path), 3) == ['خط 497', 'خط 498', 'خط 499']
+    assert len(tail_lines(str(path), 1000)) == 500
+    assert tail_lines(str(tmp_path / 'missing.txt'), 3) == []
+
+
+def test_parse_line_supports_legacy_lines():
+    assert parse_line('2024-01-01T10:00:00 | ورود مدیر') == {'ts': '2024-01-01T10:00:00', 'event': 'legacy',
+                                                               'message': 'ورود مدیر'}
+    record = {'ts': 't', 'event': 'admin', 'message': 'پیام'}
+    assert parse_line(json.dumps(record)) == record
+    assert format_line(record) == 't | پیام\n'
+    assert parse_line('   ') is None
+
+
+def test_log_is_written_in_background_and_tail_reads_it(tmp_path):
+    path = str(tmp_path / 'events.log')
+    log = EventLog(path)
+    for index in range(10):
+        log.log(f'پیام {index}', event='chat', index=index)
+    log.flush()
+    assert [record['index'] for record in read_records(path)] == list(range(10))
+    assert [record['message'] for record in log.tail(2)] == ['پیام 8', 'پیام 9']
+    # رویدادهای اخیر پس از راه‌اندازی دوباره از انتهای فایل خوانده می‌شوند
+    assert [record['index'] for record in EventLog(path, recent=3).tail(3)] == [7, 8, 9]
+
+
+def test_rotation_keeps_backups(tmp_path):
+    path = str(tmp_path / 'events.log')
+    log = EventLog(path, max_bytes=200, backups=2)
+    for index in range(30):
+        log.log('x' * 50, index=index)
+        log.flush()
+    assert log.rotations > 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['events.log', 'events.log.1', 'events.log.2']
+    assert read_records(path)[-1]['index'] == 29
+
+
+def test_bad_record_does_not_drop_the_batch(tmp_path):
+    path = str(tmp_path / 'events.log')
+    log = EventLog(path)
+    circular = {}
+    circular['self'] = circular
+    log.log('قبل')
+    log.log('بد', data=circular)
+    log.log('شیء', data={1, 2})
+    log.log('بعد')
+    log.flush()
+    assert [record['message'] for record in read_records(path)] == ['قبل', 'شیء', 'بعد']
+
+
+def test_query_filters_and_skips_legacy_lines_without_time(tmp_path):
+    path = tmp_path / 'events.log'
+    lines = [{'ts': '2000-01-01T00:00:00', 'event': 'admin', 'message': 'قدیم'},
+             {'ts': '2024-01-01T00:00:00', 'event': 'admin', 'message': 'پشتیبان'}]
+    path.write_text(''.join(json.dumps(line) + '\n' for line in lines) + 'پیام قدیمی بدون زمان\n', encoding='utf-8')
+    log = EventLog(str(path))
+    log.log('خطای ورود', event='auth')
+    log.log('تغییر تنظیمات', event='admin')
+    assert [record['message'] for record in log.query(event='admin')] == ['تغییر تنظیمات', 'پشتیبان', 'قدیم']
+    assert [record['message'] for record in log.query(text='ورود')] == ['خطای ورود']
+    assert [record['message'] for record in log.query(since='2020-01-01')] == ['تغییر تنظیمات', 'خطای ورود',
+                                                                                'پشتیبان']
+    assert len(log.query(limit=2)) == 2
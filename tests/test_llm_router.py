@@ -0,0 +1,134 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+
+import llm_router
+from llm_router import LatencyStats, ProviderRouter, provider_for_model
+
+
+class SlowResponse:
+    status_code = 200
+    headers = {'Content-Type': 'application/json'}
+
+    def __init__(self, content):
+        self.content = content
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def json(self):
+        return {'choices': [{'message': {'content': self.content}}]}
+
+
+class StreamingResponse(SlowResponse):
+    """پاسخ SSE که هر رویداد آن delay ثانیه طول می‌کشد"""
+
+    headers = {'Content-Type': 'text/event-stream'}
+
+    def __init__(self, words, delay):
+        super().__init__(None)
+        self.words = words
+        self.delay = delay
+        self.sent = 0
+
+    def iter_lines(self):
+        for word in self.words:
+            time.sleep(self.delay)
+            if self.closed:
+                raise ConnectionError('closed')
+            self.sent += 1
+            yield ('data: ' + json.dumps({'choices': [{'delta': {'content': word}}]})).encode()
+            yield b''
+        yield b'data: [DONE]'
+
+
+def fake_post(delays):
+    def post(url, **kwargs):
+        provider = next(name for name in delays if name in url)
+        time.sleep(delays[provider])
+        return SlowResponse(provider)
+    return post
+
+
+@pytest.fixture
+def providers():
+    return {
+        name: {'url': f'http://{name}/chat/completions', 'api_key_env': f'{name.upper()}_TEST_KEY',
+               'system': '', 'headers': {}, 'hedge_model': 'gpt-4o-mini'}
+        for name in ('avalai', 'openai')
+    }
+
+
+def test_provider_for_model():
+    assert provider_for_model('gpt-4o') == 'openai'
+    assert provider_for_model('avalai-x') == 'avalai'
+    assert provider_for_model('meta-llama/llama-3') == 'openrouter'
+    assert provider_for_model('unknown') is None
+
+
+def test_latency_stats_percentiles_and_errors():
+    stats = LatencyStats(window=10)
+    for latency in (0.1, 0.2, 0.3):
+        stats.record(latency, True)
+    stats.record(5.0, False)
+    assert stats.percentile(50) == 0.2
+    assert stats.error_rate() == 0.25
+    stats.record_censored()
+    assert stats.snapshot()['censored'] == 1
+    assert stats.count() == 4
+
+
+def test_complete_respects_deadline(monkeypatch, providers):
+    monkeypatch.setattr(llm_router.requests, 'post', fake_post({'openai': 1.0, 'avalai': 1.0}))
+    router = ProviderRouter(providers, timeout=0.3)
+    start = time.monotonic()
+    assert router.complete('hi', 'gpt-4o', 'key') is None
+    assert time.monotonic() - start < 0.8
+    # timeout یک خطاست
+    assert router.stats['openai'].error_rate() == 1.0
+
+
+def test_hedge_wins_and_loser_is_censored(monkeypatch, providers):
+    monkeypatch.setenv('AVALAI_TEST_KEY', 'secondary')
+    monkeypatch.setattr(llm_router.requests, 'post', fake_post({'openai': 0.8, 'avalai': 0.05}))
+    router = ProviderRouter(providers, timeout=5, default_hedge_delay=0.1, hedge_budget=1.0)
+    assert router.complete('hi', 'gpt-4o', 'key') == 'avalai'
+    snapshot = router.snapshot()
+    assert snapshot['hedges'] == 1
+    assert snapshot['providers']['openai']['censored'] == 1
+    assert snapshot['providers']['openai']['samples'] == 0
+
+
+def test_stream_is_read_and_loser_is_closed(monkeypatch, providers):
+    monkeypatch.setenv('AVALAI_TEST_KEY', 'secondary')
+    responses = {}
+
+    def post(url, json=None, **kwargs):
+        assert json['stream'] is True
+        if 'openai' in url:
+            responses['openai'] = StreamingResponse(['کند'] * 50, 0.02)
+        else:
+            time.sleep(0.15)
+            responses['avalai'] = StreamingResponse(['پاسخ ', 'سریع'], 0)
+        return responses['openai' if 'openai' in url else 'avalai']
+
+    monkeypatch.setattr(llm_router.requests, 'post', post)
+    router = ProviderRouter(providers, timeout=5, default_hedge_delay=0.1, hedge_budget=1.0)
+    routed = router.route('hi', 'gpt-4o', 'key')
+    # پاسخ hedge از مدل ارائه‌دهنده ثانویه است و این در نتیجه و snapshot دیده می‌شود
+    assert routed == {'content': 'پاسخ سریع', 'provider': 'avalai', 'model': 'gpt-4o-mini'}
+    time.sleep(0.1)
+    assert responses['openai'].closed and responses['openai'].sent < 20
+    snapshot = router.snapshot()
+    assert snapshot['substituted'] == 1 and snapshot['answered_by'] == {'gpt-4o-mini': 1}
+    assert snapshot['providers']['openai']['samples'] == 0
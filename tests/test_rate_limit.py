@@ -0,0 +1,89 @@
+import pytest
+
+flask = pytest.importorskip('flask')
+
+import rate_limit
+from rate_limit import TokenBucket, RateLimiter, AdmissionController, rate_limited, rate_limiter, admission
+
+
+def test_token_bucket_burst_then_rejects():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.take()[0]
+    assert bucket.take()[0]
+    ok, retry_after = bucket.take()
+    assert not ok
+    assert 0 < retry_after <= 1.0
+
+
+def test_set_rate_keeps_buckets_when_unchanged():
+    limiter = RateLimiter(rate_per_minute=6)
+    assert limiter.check('chat', 'a')[0]
+    assert not limiter.check('chat', 'a')[0]
+    limiter.set_rate(6)
+    assert not limiter.check('chat', 'a')[0]
+    limiter.set_rate(60)
+    assert limiter.check('chat', 'a')[0]
+
+
+def test_admission_rejects_when_queue_full():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=0.01, max_per_client=5)
+    assert controller.acquire('a')[0]
+    assert not controller.acquire('b')[0]
+    controller.release('a', 0.1)
+    assert controller.acquire('b')[0]
+
+
+@pytest.fixture
+def app():
+    app = flask.Flask(__name__)
+    app.secret_key = 'test'
+
+    @app.route('/plain', methods=['POST'])
+    @rate_limited('test-plain')
+    def plain():
+        return 'ok'
+
+    @app.route('/stream', methods=['POST'])
+    @rate_limited('test-stream')
+    def stream():
+        def generate():
+            yield str(admission.snapshot()['active'])
+        return flask.Response(generate())
+
+    rate_limiter.set_rate(6)  # burst 1
+    rate_limiter.set_api_key('secret')
+    yield app
+    rate_limiter.set_api_key('')
+    rate_limiter.set_rate(60)
+
+
+def test_random_api_keys_do_not_bypass_limit(app):
+    client = app.test_client()
+    codes = [client.post('/plain', headers={'X-API-Key': f'random-{i}'}).status_code for i in range(3)]
+    assert codes == [200, 429, 429]
+
+
+def test_configured_api_key_has_its_own_bucket(app):
+    client = app.test_client()
+    assert client.post('/plain', headers={'X-API-Key': 'secret'}).status_code == 200
+    assert client.post('/plain', headers={'X-API-Key': 'secret'}).status_code == 429
+    assert app.test_client().post('/plain').status_code == 200
+
+
+def test_forwarded_for_only_from_trusted_proxy(app, monkeypatch):
+    headers = {'X-Forwarded-For': '1.2.3.4'}
+    with app.test_request_context(headers=headers, environ_base={'REMOTE_ADDR': '9.9.9.9'}):
+        assert rate_limit.client_ip() == '9.9.9.9'
+    monkeypatch.setattr(rate_limit, 'TRUSTED_PROXIES', {'9.9.9.9'})
+    with app.test_request_context(headers={'X-Forwarded-For': '6.6.6.6, 1.2.3.4'},
+                                  environ_base={'REMOTE_ADDR': '9.9.9.9'}):
+        assert rate_limit.client_ip() == '1.2.3.4'
+
+
+def test_streamed_response_holds_admission_until_closed(app):
+    active = admission.snapshot()['active']
+    response = app.test_client().post('/stream')
+    assert response.get_data() == str(active + 1).encode()
+    assert admission.snapshot()['active'] == active + 1
+    response.close()
+    assert admission.snapshot()['active'] == active
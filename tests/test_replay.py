@@ -0,0 +1,77 @@
+import json
+import urllib.request
+
+import pytest
+
+pytest.importorskip('flask')
+
+from replay import build_request, is_success, load_requests, percentile, run, start_stub_server
+from stage_timing import parse_server_timing, server_timing_header, stage
+
+
+class FakeTarget:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.sessions = []
+
+    def send(self, session_key, method, endpoint, payload, audio_path):
+        self.sessions.append(session_key)
+        status = self.statuses.get(endpoint, 200)
+        if isinstance(status, Exception):
+            raise status
+        return status, 'retrieval;dur=12.5, llm;dur=300'
+
+
+def test_build_request():
+    assert build_request({'text': 'سلام'}) == ('POST', '/chat_advanced', {'json': {'text': 'سلام'}}, None)
+    assert build_request({'type': 'stt', 'audio': 'a.wav'}) == ('POST', '/stt', {}, 'a.wav')
+    assert build_request({'endpoint': '/chat', 'form': {'user_input': 'x'}}) == \
+        ('POST', '/chat', {'json': None, 'form': {'user_input': 'x'}}, None)
+
+
+def test_load_requests_skips_bad_lines(tmp_path):
+    path = tmp_path / 'load.jsonl'
+    path.write_text('{"text": "a"}\n\nnot json\n{"type": "tts"}\n', encoding='utf-8')
+    assert load_requests(str(path)) == [{'text': 'a'}, {'type': 'tts'}]
+
+
+def test_percentile_and_success():
+    assert percentile([], 50) is None
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert is_success(200) and is_success(302) and not is_success(429) and not is_success('error:Timeout')
+
+
+def test_run_excludes_failures_from_latency():
+    target = FakeTarget({'/tts': 429, '/stt': ConnectionError()})
+    entries = [{'text': 'a'}] * 6 + [{'type': 'tts', 'text': 'b'}] * 3 + [{'type': 'stt'}]
+    report = run(entries, target, concurrency=4, rate=0, poisson=False, use_timestamps=False, sessions=2)
+    assert report['requests'] == 10 and report['failed'] == 4
+    assert report['endpoints']['/chat_advanced']['count'] == 6
+    assert report['endpoints']['/tts'] == {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None,
+                                           'failed': 3, 'status': {'429': 3}}
+    assert report['endpoints']['/stt']['status'] == {'error:ConnectionError': 1}
+    assert report['stages']['llm']['p50'] == 300.0
+    assert set(target.sessions) == {'replay-0', 'replay-1'}
+
+
+def test_server_timing_round_trip():
+    timings = {}
+    with stage('llm', timings):
+        pass
+    with stage('llm', timings):
+        pass
+    assert list(timings) == ['llm']
+    header = server_timing_header({'stt': 10.25, 'llm': 300})
+    assert parse_server_timing(header) == {'stt': 10.2, 'llm': 300.0}
+    assert parse_server_timing('cache;desc=hit, bad;dur=x, ') == {}
+
+
+def test_stub_server_answers_chat_completions(monkeypatch):
+    for name in ('AVALAI_BASE_URL', 'OPENAI_BASE_URL', 'OPENROUTER_BASE_URL', 'AVALAI_API_KEY', 'OPENAI_API_KEY'):
+        monkeypatch.delenv(name, raising=False)
+    base_url = start_stub_server(0, latency=0, jitter=0)
+    request = urllib.request.Request(f'{base_url}/chat/completions', data=json.dumps({'messages': []}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        answer = json.loads(response.read())
+    assert answer['choices'][0]['message']['content']
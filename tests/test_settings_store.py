@@ -0,0 +1,85 @@
+import json
+import threading
+
+from settings_store import JSONStore
+
+
+def test_missing_file_uses_default(tmp_path):
+    store = JSONStore(str(tmp_path / 'settings.json'), default={'model': 'gpt'})
+    assert store.get() == {'model': 'gpt'} and not store.exists
+    assert store.get({'model': 'other'}) == {'model': 'other'}
+
+
+def test_update_writes_atomically(tmp_path):
+    path = tmp_path / 'settings.json'
+    store = JSONStore(str(path))
+    assert store.merge(model='gpt', voice='نوا') == {'model': 'gpt', 'voice': 'نوا'}
+    assert json.loads(path.read_text(encoding='utf-8')) == {'model': 'gpt', 'voice': 'نوا'}
+    assert [p.name for p in tmp_path.iterdir()] == ['settings.json']
+    assert store.version == 1 and store.exists
+
+
+def test_failed_mutator_keeps_value(tmp_path):
+    store = JSONStore(str(tmp_path / 'settings.json'))
+    store.merge(model='gpt')
+
+    def broken(value):
+        value['model'] = 'other'
+        raise ValueError('boom')
+
+    try:
+        store.update(broken)
+    except ValueError:
+        pass
+    assert store.get() == {'model': 'gpt'} and store.version == 1
+
+
+def test_concurrent_merges_are_all_kept(tmp_path):
+    store = JSONStore(str(tmp_path / 'settings.json'))
+    threads = [threading.Thread(target=store.merge, kwargs={f'key{index}': index}) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get() == {f'key{index}': index for index in range(20)}
+    assert JSONStore(store.path).get() == store.get()
+
+
+def test_subscribers_get_copies_in_version_order(tmp_path):
+    store = JSONStore(str(tmp_path / 'settings.json'))
+    seen = []
+
+    def subscriber(value):
+        seen.append(dict(value))
+        value['mutated'] = True
+
+    store.subscribe(subscriber)
+    threads = [threading.Thread(target=store.merge, kwargs={'count': index}) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen[0] == {}
+    assert seen[-1] == store.get()
+    assert 'mutated' not in store.get()
+
+
+def test_subscriber_errors_are_isolated(tmp_path):
+    store = JSONStore(str(tmp_path / 'settings.json'))
+    seen = []
+    store.subscribe(lambda value: 1 / 0, initial=False)
+    store.subscribe(seen.append, initial=False)
+    store.merge(model='gpt')
+    assert seen == [{'model': 'gpt'}]
+
+
+def test_reload_picks_up_external_changes(tmp_path):
+    path = tmp_path / 'settings.json'
+    store = JSONStore(str(path))
+    store.merge(model='gpt')
+    seen = []
+    store.subscribe(seen.append, initial=False)
+    assert not store.reload()
+    path.write_text(json.dumps({'model': 'restored'}), encoding='utf-8')
+    assert store.reload()
+    assert store.get() == {'model': 'restored'} and seen == [{'model': 'restored'}]
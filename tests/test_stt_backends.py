@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+pytest.importorskip('requests')
+
+import stt_backends
+from stt_backends import AvalAISTT, STTBackend, STTQueueFull, STTService, create_backend
+
+
+class FakeBackend(STTBackend):
+    def __init__(self, name, text=None, gate=None):
+        self.name = name
+        self.text = text
+        self.gate = gate
+        self.calls = 0
+
+    def transcribe(self, audio, language='fa', api_key=None):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        return self.text
+
+
+def service(**backends):
+    stt = STTService(default='primary', fallback='backup' if 'backup' in backends else '', workers=1, max_queue=0)
+    stt.preprocess = False
+    stt._backends.update(backends)
+    return stt
+
+
+def test_create_backend_specs():
+    assert create_backend('google').name == 'google'
+    assert create_backend('faster-whisper:tiny').model_size == 'tiny'
+    assert isinstance(create_backend('whisper-1'), AvalAISTT)
+
+
+def test_avalai_upload_has_filename_and_mimetype(monkeypatch):
+    sent = {}
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'text': 'سلام'}
+
+    def post(url, files=None, **kwargs):
+        sent.update(files)
+        return Response()
+
+    monkeypatch.setattr(stt_backends.requests, 'post', post)
+    assert AvalAISTT('whisper-1').transcribe(b'RIFF' + b'\x00' * 40) == 'سلام'
+    name, _, mimetype = sent['file']
+    assert (name, mimetype) == ('audio.wav', 'audio/wav')
+
+
+def test_fallback_runs_when_primary_fails():
+    primary, backup = FakeBackend('primary', None), FakeBackend('backup', 'متن')
+    stt = service(primary=primary, backup=backup)
+    assert stt.transcribe(b'audio') == 'متن'
+    assert stt.stats()['fallbacks'] == 1
+
+
+def test_selected_engine_is_used_without_spec():
+    primary, chosen = FakeBackend('primary', 'a'), FakeBackend('chosen', 'b')
+    stt = service(primary=primary, chosen=chosen)
+    stt.select(' chosen ')
+    assert stt.transcribe(b'audio') == 'b'
+    stt.select('')
+    assert stt.transcribe(b'audio') == 'a'
+    assert stt.stats()['selected'] is None
+
+
+def test_queue_full_is_rejected():
+    gate = threading.Event()
+    stt = service(primary=FakeBackend('primary', 'a', gate))
+    worker = threading.Thread(target=stt.transcribe, args=(b'audio',))
+    worker.start()
+    try:
+        with pytest.raises(STTQueueFull):
+            for _ in range(50):
+                stt.transcribe(b'audio')
+    finally:
+        gate.set()
+        worker.join()
+
+
+class EchoBackend(STTBackend):
+    name = 'echo'
+
+    def __init__(self, gate):
+        self.gate = gate
+
+    def transcribe(self, audio, language='fa', api_key=None):
+        self.gate.wait(5)
+        return audio.decode()
+
+
+def test_long_recording_takes_a_single_slot():
+    stt = STTService(default='echo', workers=2, max_queue=8)
+    gate = threading.Event()
+    stt._backends['echo'] = EchoBackend(gate)
+    # ضبط ۳ دقیقه‌ای: ۱۲ بخش ۱۵ ثانیه‌ای بیش از workers + max_queue جایگاه
+    segments = [str(index).encode() for index in range(12)]
+    stt.prepare = lambda audio: segments
+    # بخش‌ها تا ارسال همه‌شان در حال اجرا می‌مانند
+    threading.Timer(0.2, gate.set).start()
+    assert stt.transcribe(b'audio') == ' '.join(str(index) for index in range(12))
+    assert stt.stats()['rejected'] == 0
+    # همه جایگاه‌ها آزاد شده‌اند
+    for _ in range(10):
+        assert stt._slots.acquire(blocking=False)
+    assert not stt._slots.acquire(blocking=False)
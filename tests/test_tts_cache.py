@@ -0,0 +1,78 @@
+import os
+
+from tts_cache import TTSCache, sniff_extension
+
+WAV = b'RIFF' + b'\x00' * 60
+MP3 = b'ID3' + b'\x00' * 61
+
+
+def test_sniff_extension():
+    assert sniff_extension(WAV) == 'wav'
+    assert sniff_extension(MP3) == 'mp3'
+    assert sniff_extension(b'OggS....') == 'ogg'
+    assert sniff_extension(b'????') == 'bin'
+
+
+def test_make_key_depends_on_every_parameter():
+    base = TTSCache.make_key('سلام', 'openai', 'tts-1', 'nova', 1.0, '')
+    assert base == TTSCache.make_key('سلام', 'openai', 'tts-1', 'nova', 1, None)
+    assert base != TTSCache.make_key('سلام', 'openai', 'tts-1', 'alloy', 1.0, '')
+    assert base != TTSCache.make_key('سلام', 'openai', 'tts-1', 'nova', 1.25, '')
+
+
+def test_put_get_and_hit_rate(tmp_path):
+    cache = TTSCache(tmp_path)
+    assert cache.get('a' * 64) is None
+    cache.put('a' * 64, WAV)
+    assert cache.get('a' * 64) == WAV
+    assert cache.path('a' * 64).suffix == '.wav'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=3 * len(WAV))
+    for key in 'abc':
+        cache.put(key * 64, WAV)
+    cache.get('a' * 64)
+    cache.put('d' * 64, WAV)
+    assert cache.path('b' * 64) is None
+    assert cache.get('a' * 64) == WAV
+    assert cache.stats()['evictions'] == 1
+
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    TTSCache(tmp_path).put('a' * 64, MP3)
+    assert TTSCache(tmp_path).get('a' * 64) == MP3
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('.tmp-')]
+
+
+def test_pinned_entries_survive_eviction_and_restart(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=2 * len(WAV))
+    cache.put('a' * 64, WAV)
+    assert cache.pin('a' * 64)
+    for key in 'bcde':
+        cache.put(key * 64, WAV)
+    assert cache.get('a' * 64) == WAV
+    assert cache.stats()['pinned'] == 1
+    assert TTSCache(tmp_path).path('a' * 64) is not None
+    assert not cache.pin('f' * 64)
+
+
+def test_unpin_counts_references_and_returns_file_to_lru(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=2 * len(WAV))
+    cache.put('a' * 64, WAV)
+    assert cache.pin('a' * 64) and cache.pin('a' * 64)
+    assert TTSCache(tmp_path).stats()['pinned'] == 1
+    assert not cache.unpin('a' * 64)
+    # شمارش ارجاع‌ها بازراه‌اندازی را تحمل می‌کند
+    cache = TTSCache(tmp_path, max_bytes=2 * len(WAV))
+    assert cache.unpin('a' * 64)
+    assert cache.stats()['pinned'] == 0
+    assert cache.path('a' * 64).parent == cache.cache_dir
+    # فایل آزادشده اولین نامزد حذف است
+    cache.put('b' * 64, WAV)
+    cache.put('c' * 64, WAV)
+    assert cache.path('a' * 64) is None
+    assert cache.get('b' * 64) == WAV
+    assert not cache.unpin('f' * 64)
@@ -0,0 +1,57 @@
+import time
+
+from tts_health import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ProviderHealth
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    breaker.record(False, 1.0)
+    breaker.record(False, 1.0)
+    breaker.record(True, 1.0)
+    breaker.record(False, 1.0)
+    breaker.record(False, 1.0)
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record(False, 1.0)
+    assert breaker.state == OPEN and not breaker.allow()
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.1, max_cooldown=0.3)
+    breaker.record(False, 1.0)
+    time.sleep(0.12)
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    # شکست درخواست آزمایشی دوره انتظار را دو برابر می‌کند
+    breaker.record(False, 1.0)
+    assert breaker.state == OPEN and breaker.cooldown == 0.2
+    time.sleep(0.12)
+    assert not breaker.allow()
+    time.sleep(0.1)
+    assert breaker.allow()
+    breaker.record(True, 0.5)
+    assert breaker.state == CLOSED and breaker.cooldown == 0.1
+
+
+def test_score_penalizes_errors_and_forgets_stale_samples():
+    breaker = CircuitBreaker(failure_threshold=10, stale_after=0.05)
+    assert breaker.score(default_latency=2.0) == 2.0
+    for latency in (0.4, 0.5, 0.6):
+        breaker.record(True, latency)
+    assert breaker.score() == 0.5
+    breaker.record(False, 5.0)
+    assert breaker.score() == 0.5 * (1 + 5 * 0.25)
+    assert breaker.snapshot()['success_rate'] == 0.75
+    time.sleep(0.06)
+    assert breaker.score(default_latency=2.0) == 2.0
+
+
+def test_order_skips_open_providers_and_sorts_by_score():
+    health = ProviderHealth(failure_threshold=1, cooldown=60)
+    chain = [{'provider': 'avalai'}, {'provider': 'openai'}, {'provider': 'google'}]
+    assert health.order(chain) == chain
+    health.record('avalai', False, 1.0)
+    health.record('openai', True, 3.0)
+    health.record('google', True, 0.3)
+    assert health.order(chain) == [{'provider': 'google'}, {'provider': 'openai'}]
+    assert health.best(['avalai', 'openai', 'google']) == 'google'
+    assert health.snapshot()['avalai']['state'] == OPEN
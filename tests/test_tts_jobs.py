@@ -0,0 +1,54 @@
+import threading
+import time
+
+from tts_jobs import DONE, FAILED, PENDING, RUNNING, TTSJobQueue
+
+
+def test_successful_job_calls_on_done():
+    queue = TTSJobQueue(workers=2, ttl=60)
+    finished = []
+    job = queue.submit('سلام', lambda text: (b'audio', f'key-{text}'), on_done=finished.append)
+    assert queue.wait(job.id, 5) is job
+    assert job.to_dict()['status'] == DONE and job.audio_key == 'key-سلام'
+    assert finished == [job]
+
+
+def test_failures_are_reported_without_callback():
+    queue = TTSJobQueue(workers=2, ttl=60)
+    finished = []
+
+    def broken(text):
+        raise RuntimeError('provider down')
+
+    empty = queue.submit('a', lambda text: (None, None), on_done=finished.append)
+    error = queue.submit('b', broken, on_done=finished.append)
+    for job in (empty, error):
+        queue.wait(job.id, 5)
+    assert (empty.status, empty.error) == (FAILED, 'TTS failed')
+    assert (error.status, error.error) == (FAILED, 'provider down')
+    assert finished == []
+    assert queue.wait('missing', 0.01) is None
+
+
+def test_wait_times_out_and_stats_count_states():
+    gate = threading.Event()
+    queue = TTSJobQueue(workers=1, ttl=60)
+    running = queue.submit('a', lambda text: (gate.wait(5), 'k'))
+    pending = queue.submit('b', lambda text: (b'audio', 'k'))
+    start = time.time()
+    assert queue.wait(running.id, 0.05).status == RUNNING
+    assert time.time() - start < 1
+    assert pending.status == PENDING
+    assert queue.stats() == {PENDING: 1, RUNNING: 1, DONE: 0, FAILED: 0}
+    gate.set()
+    queue.wait(pending.id, 5)
+    assert queue.stats()[DONE] == 2
+
+
+def test_finished_jobs_expire_after_ttl():
+    queue = TTSJobQueue(workers=1, ttl=0.05)
+    old = queue.submit('a', lambda text: (b'audio', 'k'))
+    queue.wait(old.id, 5)
+    time.sleep(0.06)
+    new = queue.submit('b', lambda text: (b'audio', 'k'))
+    assert queue.get(old.id) is None and queue.get(new.id) is new
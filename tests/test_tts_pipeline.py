@@ -0,0 +1,74 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_pipeline import SentencePipeline, SentenceSplitter, split_sentences, split_text_for_tts
+
+
+def test_splitter_waits_for_complete_sentences():
+    splitter = SentenceSplitter(min_chars=5)
+    assert splitter.feed('دوز دارو ۲.') == []
+    assert splitter.feed('۵ میلی‌گرم است. روزی ') == ['دوز دارو ۲.۵ میلی‌گرم است.']
+    assert splitter.feed('دو بار مصرف کنید؟') == []
+    assert splitter.feed('\n') == ['روزی دو بار مصرف کنید؟']
+    assert splitter.flush() == []
+
+
+def test_short_sentences_are_merged():
+    assert split_sentences('بله. حتماً باید به پزشک مراجعه کنید. ممنون!') == \
+        ['بله. حتماً باید به پزشک مراجعه کنید.', 'ممنون!']
+
+
+def test_pipeline_yields_text_then_audio_in_order():
+    def synthesize(sentence):
+        # جمله اول دیرتر آماده می‌شود ولی باز هم اول تحویل داده می‌شود
+        time.sleep(0.05 if sentence.startswith('اول') else 0)
+        return sentence.encode()
+
+    chunks = ['اول این جمله نسبتاً بلند است. ', 'دوم این جمله هم بلند است. ', 'سوم پایان']
+    events = list(SentencePipeline(synthesize, ThreadPoolExecutor(4)).run(iter(chunks)))
+    assert [event[1] for event in events if event[0] == 'text'] == chunks
+    audio = [event for event in events if event[0] == 'audio']
+    assert [event[1] for event in audio] == [0, 1, 2]
+    assert [event[3] for event in audio] == [event[2].encode() for event in audio]
+    assert audio[-1][2] == 'سوم پایان'
+
+
+def test_pipeline_reports_failed_sentences_as_none():
+    def synthesize(sentence):
+        raise RuntimeError('provider down')
+
+    events = list(SentencePipeline(synthesize, ThreadPoolExecutor(1)).run(['یک جمله کامل و طولانی.']))
+    assert events[-1] == ('audio', 0, 'یک جمله کامل و طولانی.', None)
+
+
+def test_closing_the_stream_cancels_pending_sentences():
+    gate = threading.Event()
+    started = []
+
+    def synthesize(sentence):
+        started.append(sentence)
+        gate.wait(5)
+        return b''
+
+    text = ''.join(f'جمله شماره {index} برای آزمون. ' for index in range(6)) + '\n'
+    events = SentencePipeline(synthesize, ThreadPoolExecutor(1)).run([text, 'ادامه'])
+    assert next(events) == ('text', text)
+    assert next(events) == ('text', 'ادامه')
+    events.close()
+    gate.set()
+    time.sleep(0.05)
+    assert len(started) == 1
+
+
+def test_split_text_for_tts_respects_max_chars():
+    sentence = 'بیماران مبتلا به فشار خون باید داروهای خود را منظم مصرف کنند، نمک کمتری بخورند، ورزش کنند. '
+    text = sentence * 12
+    chunks = split_text_for_tts(text, max_chars=200)
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert chunks[0] == sentence.strip()
+    assert ' '.join(chunks).split() == text.split()
+    # جمله بلندتر از سقف در مرز عبارت‌ها شکسته می‌شود
+    long_sentence = '، '.join(['یک عبارت نسبتاً بلند درباره دارو'] * 20) + '.'
+    pieces = split_text_for_tts(long_sentence, max_chars=100)
+    assert all(len(piece) <= 100 for piece in pieces) and pieces[0].endswith('،')
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from tts_warmup import VOICE_ACK_PHRASE, TTSWarmup, canned_phrases, doctor_greeting
+
+DOCTORS = {'a': {'name': 'دکتر الف', 'specialty': 'قلب', 'city': 'تهران'}, 'b': {'name': 'دکتر ب'}}
+
+
+def wait_idle(warmup, timeout=5):
+    deadline = time.time() + timeout
+    while warmup.status()['running'] and time.time() < deadline:
+        time.sleep(0.005)
+    assert not warmup.status()['running']
+
+
+def doctor(name):
+    return {'x': {'name': name}}
+
+
+def test_canned_phrases_are_unique():
+    phrases = canned_phrases({'welcome_message': 'خوش آمدید'}, {**DOCTORS, 'c': DOCTORS['b']})
+    # پیام خوش‌آمد جایی پخش نمی‌شود، پس صدایش پیش‌تولید نمی‌شود
+    assert phrases == [VOICE_ACK_PHRASE, doctor_greeting(DOCTORS['a']), doctor_greeting(DOCTORS['b'])]
+    assert 'در تهران' in doctor_greeting(DOCTORS['a'])
+
+
+def test_warmup_records_keys_and_failures():
+    def synthesize(phrase):
+        return (None, None) if phrase == VOICE_ACK_PHRASE else (b'audio', f'key-{len(phrase)}')
+
+    warmup = TTSWarmup(synthesize)
+    warmup.schedule({}, doctor('سلام'))
+    greeting = doctor_greeting({'name': 'سلام'})
+    wait_idle(warmup)
+    assert warmup.audio_key(f' {greeting} ') == f'key-{len(greeting)}'
+    assert warmup.audio_key(VOICE_ACK_PHRASE) is None
+    assert warmup.status()['failed'] == [VOICE_ACK_PHRASE] and warmup.status()['runs'] == 1
+
+
+def test_schedule_during_run_is_never_lost():
+    gate = threading.Event()
+    seen = []
+
+    def synthesize(phrase):
+        gate.wait(5)
+        seen.append(phrase)
+        return b'audio', phrase
+
+    warmup = TTSWarmup(synthesize)
+    warmup.schedule({}, doctor('اول'))
+    for index in range(20):
+        warmup.schedule({}, doctor(f'پزشک {index}'))
+    gate.set()
+    wait_idle(warmup)
+    # فقط آخرین زمان‌بندی برای اجرای بعدی نگه داشته می‌شود
+    last = doctor_greeting({'name': 'پزشک 19'})
+    assert warmup.audio_key(last) == last
+    assert warmup.status()['runs'] <= 2 and seen.count(VOICE_ACK_PHRASE) <= 2
+
+
+def test_schedule_after_finish_starts_new_run():
+    warmup = TTSWarmup(lambda phrase: (b'audio', phrase))
+    for index in range(200):
+        warmup.schedule({}, doctor(f'پزشک {index}'))
+        if index % 50 == 0:
+            wait_idle(warmup)
+    wait_idle(warmup)
+    last = doctor_greeting({'name': 'پزشک 199'})
+    assert warmup.audio_key(last) == last
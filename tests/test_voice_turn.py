@@ -0,0 +1,113 @@
+import json
+import time
+
+import pytest
+
+flask = pytest.importorskip('flask')
+pytest.importorskip('requests')
+
+import stage_timing
+from stage_timing import parse_server_timing, stage
+from stt_backends import STTQueueFull
+from voice_turn import VOICE_UNRECOGNIZED_TEXT, VoiceTurn, sse_event
+
+
+class Pipeline:
+    def __init__(self, transcript='سلام دکتر', streaming=False):
+        self.transcript = transcript
+        self.streaming = streaming
+        self.history = []
+
+    def transcribe(self, audio):
+        if isinstance(self.transcript, Exception):
+            raise self.transcript
+        return self.transcript
+
+    def answer(self, transcript, sid):
+        with stage('llm'):
+            return f'پاسخ به {transcript}'
+
+    def prompt(self, transcript, sid):
+        return f'prompt: {transcript}' if self.streaming else None
+
+    def stream(self, prompt, timings, start):
+        for word in ('پاسخ ', 'جریانی'):
+            yield sse_event('text', {'delta': word})
+        timings['first_token'] = 1.0
+        return 'پاسخ جریانی'
+
+    def reply_audio_url(self, text):
+        with stage('tts'):
+            return '/tts_audio/' + 'a' * 64
+
+    def save(self, sid, message):
+        self.history.append(message)
+
+    def append_turn(self, sid, *messages):
+        self.history.extend(messages)
+
+
+def make_client(pipeline):
+    turn = VoiceTurn(pipeline.transcribe, pipeline.answer, pipeline.prompt, pipeline.stream,
+                     pipeline.reply_audio_url, pipeline.save, pipeline.append_turn,
+                     'پیام شما دریافت شد', lambda: '/tts_audio/' + 'b' * 64)
+    app = flask.Flask(__name__)
+    stage_timing.init_app(app)
+
+    @app.route('/voice_message', methods=['POST'])
+    def voice_message():
+        start = time.perf_counter()
+        if flask.request.form.get('stream') == '1':
+            return turn.stream_response(b'audio', lambda: '/voice/1', 'sid', start)
+        return turn.respond(b'audio', lambda: '/voice/1', 'sid', start)
+
+    return app.test_client()
+
+
+def parse_events(body):
+    events = []
+    for block in body.decode('utf-8').strip().split('\n\n'):
+        name, data = block.split('\n')
+        events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_json_reply_reports_stage_timings():
+    pipeline = Pipeline()
+    response = make_client(pipeline).post('/voice_message')
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload['text'] == 'پاسخ به سلام دکتر'
+    assert payload['audio_url'] == '/tts_audio/' + 'a' * 64
+    assert payload['user']['audio_url'] == '/voice/1'
+    assert set(payload['timings']) == {'stt', 'llm', 'tts', 'total'}
+    assert set(parse_server_timing(response.headers['Server-Timing'])) == {'stt', 'llm', 'tts', 'total'}
+    assert [m['speaker'] for m in pipeline.history] == ['user', 'bot']
+
+
+def test_unrecognized_speech_gets_canned_reply():
+    response = make_client(Pipeline(transcript='')).post('/voice_message')
+    assert response.get_json()['text'] == VOICE_UNRECOGNIZED_TEXT
+
+
+def test_stream_sends_events_in_order():
+    pipeline = Pipeline(streaming=True)
+    response = make_client(pipeline).post('/voice_message', data={'stream': '1'})
+    assert response.mimetype == 'text/event-stream'
+    events = parse_events(response.data)
+    assert [name for name, _ in events] == ['accepted', 'transcript', 'text', 'text', 'done']
+    assert events[0][1]['audio_url'] == '/tts_audio/' + 'b' * 64
+    assert events[1][1]['text'] == 'سلام دکتر'
+    done = events[-1][1]
+    assert done['text'] == 'پاسخ جریانی'
+    assert {'stt', 'first_token', 'total'} <= set(done['timings'])
+    assert [m['text'] for m in pipeline.history] == ['سلام دکتر', 'پاسخ جریانی']
+
+
+def test_stt_queue_full_returns_503():
+    client = make_client(Pipeline(transcript=STTQueueFull('STT queue is full')))
+    response = client.post('/voice_message')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    events = parse_events(client.post('/voice_message', data={'stream': '1'}).data)
+    assert [name for name, _ in events] == ['accepted', 'error']
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+کش صوتی آدرس‌دهی‌شده با محتوا برای TTS با حذف LRU بر اساس بودجه حجمی
+Content-addressed TTS audio cache with size-bounded LRU eviction
+"""
+
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# فایل‌های کش به شکل <sha256>.<ext> ذخیره می‌شوند؛ سایر فایل‌های پوشه نادیده گرفته می‌شوند
+CACHE_FILE_PATTERN = re.compile(r'^([0-9a-f]{64})\.(mp3|wav|ogg|opus|webm|bin)$')
+
+AUDIO_MIMETYPES = {
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'ogg': 'audio/ogg',
+    'opus': 'audio/ogg',
+    'webm': 'audio/webm',
+    'bin': 'application/octet-stream',
+}
+
+
+def sniff_extension(data: bytes) -> str:
+    """تشخیص قالب صوتی از چند بایت ابتدایی"""
+    if data[:4] == b'RIFF':
+        return 'wav'
+    if data[:4] == b'OggS':
+        return 'ogg'
+    if data[:4] == b'\x1a\x45\xdf\xa3':
+        return 'webm'
+    if data[:3] == b'ID3' or (len(data) > 1 and data[0] == 0xFF and (data[1] & 0xE0) == 0xE0):
+        return 'mp3'
+    return 'bin'
+
+
+class TTSCache:
+    """
+    کش روی دیسک با کلید hash(text, provider, model, voice, speed, instructions).
+    نوشتن‌ها اتمیک هستند (فایل موقت + rename) و با عبور از max_bytes، قدیمی‌ترین
+    ورودی‌های استفاده‌نشده حذف می‌شوند. ورودی‌های سنجاق‌شده (pin) به زیرپوشه pinned منتقل می‌شوند
+    و در بودجه حساب نمی‌شوند (صدای پیام‌های تاریخچه گفتگو). هر pin یک ارجاع می‌شمارد (در pinned/refs.json)
+    و با آزاد شدن آخرین ارجاع (unpin) فایل به عنوان قدیمی‌ترین ورودی به LRU برمی‌گردد.
+    """
+
+    REFS_FILE = 'refs.json'
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 200 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir).resolve()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.pinned_dir = self.cache_dir / 'pinned'
+        self.pinned_dir.mkdir(exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (filename, size)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pins = self._load_pins()  # key -> تعداد پیام‌هایی که به فایل سنجاق‌شده ارجاع می‌دهند
+        self._scan()
+
+    def _scan(self):
+        """بازسازی ایندکس LRU از فایل‌های موجود (به ترتیب زمان آخرین دسترسی)"""
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            match = CACHE_FILE_PATTERN.match(entry.name)
+            if match and entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_atime, match.group(1), entry.name, stat.st_size))
+        for _, key, filename, size in sorted(found):
+            self._entries[key] = (filename, size)
+            self._bytes += size
+        self._evict()
+
+    def _load_pins(self) -> Dict[str, int]:
+        """شمارش ارجاع‌ها؛ فایل‌های سنجاق‌شده بدون شمارش (نسخه‌های قبلی) یک ارجاع دارند"""
+        try:
+            with open(self.pinned_dir / self.REFS_FILE, encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            stored = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable pin counts, assuming one reference per pinned file: {e}")
+            stored = {}
+        pins = {}
+        for entry in os.scandir(self.pinned_dir):
+            match = CACHE_FILE_PATTERN.match(entry.name)
+            if match:
+                pins[match.group(1)] = max(1, int(stored.get(match.group(1), 1)))
+        return pins
+
+    def _save_pins(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.pinned_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._pins, f)
+            os.replace(tmp_path, self.pinned_dir / self.REFS_FILE)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def make_key(text: str, provider: str, model: Optional[str], voice: Optional[str],
+                 speed: float = 1.0, instructions: Optional[str] = None) -> str:
+        payload = json.dumps([text, provider, model, voice, float(speed), instructions or ''],
+                             ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> Optional[Path]:
+        """مسیر فایل کش برای یک کلید (و علامت‌گذاری به عنوان استفاده‌شده)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self._pinned_path(key)
+            self._entries.move_to_end(key)
+        return self.cache_dir / entry[0]
+
+    def _pinned_path(self, key: str) -> Optional[Path]:
+        for extension in AUDIO_MIMETYPES:
+            path = self.pinned_dir / f'{key}.{extension}'
+            if path.exists():
+                return path
+        return None
+
+    def pin(self, key: str) -> bool:
+        """افزودن یک ارجاع و خارج کردن ورودی از LRU تا حذف نشود؛ False اگر کلید در کش نباشد"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                if self._pinned_path(key) is None:
+                    return False
+            else:
+                self._bytes -= entry[1]
+                try:
+                    os.replace(self.cache_dir / entry[0], self.pinned_dir / entry[0])
+                except FileNotFoundError:
+                    return False
+            self._pins[key] = self._pins.get(key, 0) + 1
+            self._save_pins()
+        return True
+
+    def unpin(self, key: str) -> bool:
+        """آزاد کردن یک ارجاع؛ با آخرین ارجاع فایل به LRU برمی‌گردد (True) تا بودجه حجمی شامل آن شود"""
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+                self._save_pins()
+                return False
+            self._pins.pop(key, None)
+            self._save_pins()
+            path = self._pinned_path(key)
+            if path is None:
+                return False
+            try:
+                os.replace(path, self.cache_dir / path.name)
+            except FileNotFoundError:
+                return False
+            size = (self.cache_dir / path.name).stat().st_size
+            # صدای گفتگوهای حذف‌شده احتمالاً دوباره خواسته نمی‌شود: اولین نامزد حذف
+            self._entries[key] = (path.name, size)
+            self._entries.move_to_end(key, last=False)
+            self._bytes += size
+            self._evict()
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path(key)
+        if path is not None:
+            try:
+                data = path.read_bytes()
+                with self._lock:
+                    self.hits += 1
+                return data
+            except FileNotFoundError:
+                # ممکن است فرآیند دیگری آن را حذف کرده باشد
+                self._forget(key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes) -> Path:
+        """ذخیره اتمیک داده صوتی و اعمال بودجه حجمی"""
+        pinned = self._pinned_path(key)
+        if pinned is not None:
+            return pinned
+        filename = f'{key}.{sniff_extension(data)}'
+        target = self.cache_dir / filename
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._bytes -= previous[1]
+            self._entries[key] = (filename, len(data))
+            self._bytes += len(data)
+            self._evict()
+        return target
+
+    def _forget(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._bytes -= entry[1]
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, (filename, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(self.cache_dir / filename)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'pinned': len(self._pins),
+            }
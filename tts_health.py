@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+قطع‌کننده مدار و امتیاز سلامت ارائه‌دهندگان TTS
+Per-provider circuit breakers with rolling success/latency health scores
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    پس از failure_threshold خطای پیاپی باز می‌شود و تا پایان دوره cooldown درخواستی عبور نمی‌دهد.
+    سپس یک درخواست آزمایشی (half-open) مجاز است؛ موفقیت آن مدار را می‌بندد و شکست آن
+    دوره cooldown را دو برابر می‌کند (حداکثر max_cooldown).
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0, max_cooldown: float = 300.0,
+                 window: int = 50, stale_after: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.stale_after = stale_after
+        self.last_sample_at = 0.0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._samples = deque(maxlen=window)  # (ok, latency_seconds)
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            # درخواست آزمایشی‌ای که نتیجه‌اش ثبت نشد (مثلاً گزینه دیگری زودتر موفق شد) پس از cooldown تکرار می‌شود
+            if self.state == HALF_OPEN and (not self._probe_in_flight
+                                            or time.monotonic() - self._probe_started >= self.cooldown):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            self._samples.append((ok, latency))
+            self.last_sample_at = time.monotonic()
+            if ok:
+                self.state = CLOSED
+                self.consecutive_failures = 0
+                self.cooldown = self.base_cooldown
+                return
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN:
+                self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                self._open()
+            elif self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def score(self, default_latency: float = 2.0) -> float:
+        """هزینه مورد انتظار (ثانیه): میانه تأخیر موفق، جریمه‌شده با نرخ خطا؛ کمتر بهتر است"""
+        with self._lock:
+            samples = list(self._samples)
+            stale = time.monotonic() - self.last_sample_at > self.stale_after
+        # امتیاز قدیمی فراموش می‌شود تا ارائه‌دهنده‌ای که بهبود یافته دوباره امتحان شود
+        if not samples or stale:
+            return default_latency
+        latencies = sorted(latency for ok, latency in samples if ok)
+        median = latencies[len(latencies) // 2] if latencies else default_latency * 4
+        error_rate = sum(1 for ok, _ in samples if not ok) / len(samples)
+        return median * (1 + 5 * error_rate)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self._samples)
+            state = self.state
+        return {
+            'state': state,
+            'samples': len(samples),
+            'success_rate': round(sum(1 for ok, _ in samples if ok) / len(samples), 3) if samples else None,
+            'score': round(self.score(), 3),
+        }
+
+
+class ProviderHealth:
+    """نگهداری قطع‌کننده مدار برای هر ارائه‌دهنده و مرتب‌سازی پویای گزینه‌ها"""
+
+    def __init__(self, **breaker_options):
+        self._breaker_options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            if provider not in self._breakers:
+                self._breakers[provider] = CircuitBreaker(**self._breaker_options)
+            return self._breakers[provider]
+
+    def record(self, provider: str, ok: bool, latency: float):
+        self.breaker(provider).record(ok, latency)
+
+    def order(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        گزینه‌های مجاز به ترتیب امتیاز سلامت (ترتیب اولیه زنجیره در امتیاز برابر حفظ می‌شود).
+        ارائه‌دهندگانی که مدارشان باز است حذف می‌شوند تا هزینه قطعی آن‌ها تقریباً صفر باشد.
+        """
+        allowed = []
+        for index, candidate in enumerate(candidates):
+            breaker = self.breaker(candidate['provider'])
+            if breaker.allow():
+                allowed.append((round(breaker.score(), 1), index, candidate))
+        allowed.sort(key=lambda item: (item[0], item[1]))
+        return [candidate for _, _, candidate in allowed]
+
+    def best(self, providers: List[str]) -> Optional[str]:
+        """سالم‌ترین ارائه‌دهنده از یک لیست اولویت‌دار (بدون مصرف درخواست آزمایشی)"""
+        ranked = []
+        for index, provider in enumerate(providers):
+            breaker = self.breaker(provider)
+            if breaker.state != OPEN:
+                ranked.append((round(breaker.score(), 1), index, provider))
+        return min(ranked)[2] if ranked else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {provider: breaker.snapshot() for provider, breaker in breakers.items()}
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+صف کارهای پس‌زمینه TTS: پاسخ متنی بلافاصله برگردانده می‌شود و صدا بعداً از طریق poll یا SSE می‌رسد
+Background TTS jobs delivered through polling or server-sent events
+"""
+
+import os
+import time
+import uuid
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class TTSJob:
+    """وضعیت یک کار تبدیل متن به صدا"""
+
+    def __init__(self, text: str):
+        self.id = uuid.uuid4().hex
+        self.text = text
+        self.status = PENDING
+        self.audio_key: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.duration_ms: Optional[float] = None
+        self.finished = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'status': self.status,
+            'audio_key': self.audio_key,
+            'error': self.error,
+            'duration_ms': round(self.duration_ms, 1) if self.duration_ms is not None else None,
+        }
+
+
+class TTSJobQueue:
+    """
+    اجرای کارهای TTS در یک pool ثابت. نتیجه هر کار (فقط کلید کش، نه داده صوتی) تا ttl ثانیه
+    نگه داشته می‌شود؛ on_done پس از پایان موفق کار در همان نخ کارگر فراخوانی می‌شود.
+    """
+
+    def __init__(self, workers: int = None, ttl: float = None):
+        self.ttl = ttl or float(os.getenv('TTS_JOB_TTL', 600))
+        self._executor = ThreadPoolExecutor(max_workers=workers or int(os.getenv('TTS_JOB_WORKERS', 4)),
+                                            thread_name_prefix='tts-job')
+        self._jobs: Dict[str, TTSJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, text: str, synthesize: Callable[[str], Tuple[Optional[bytes], Optional[str]]],
+               on_done: Callable[[TTSJob], None] = None) -> TTSJob:
+        job = TTSJob(text)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, synthesize, on_done)
+        return job
+
+    def _run(self, job: TTSJob, synthesize, on_done):
+        job.status = RUNNING
+        start = time.perf_counter()
+        try:
+            audio_data, audio_key = synthesize(job.text)
+            if audio_data and audio_key:
+                job.audio_key = audio_key
+                job.status = DONE
+            else:
+                job.status = FAILED
+                job.error = 'TTS failed'
+        except Exception as e:
+            logger.error(f"TTS job {job.id} error: {e}")
+            job.status = FAILED
+            job.error = str(e)
+        job.duration_ms = (time.perf_counter() - start) * 1000
+        if job.status == DONE and on_done:
+            try:
+                on_done(job)
+            except Exception as e:
+                logger.error(f"TTS job {job.id} callback error: {e}")
+        job.finished.set()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished.is_set() and job.created_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[TTSJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[TTSJob]:
+        """انتظار تا پایان کار (حداکثر timeout ثانیه)؛ کار ناموجود None"""
+        job = self.get(job_id)
+        if job is not None:
+            job.finished.wait(timeout)
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in (PENDING, RUNNING, DONE, FAILED)}
+        for job in jobs:
+            counts[job.status] += 1
+        return counts
+
+
+tts_jobs = TTSJobQueue()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+خط لوله جمله‌به‌جمله TTS: تقسیم خروجی جریانی LLM در مرز جملات فارسی و تبدیل همزمان به صدا
+Sentence-pipelined TTS over a streamed LLM answer
+"""
+
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# پایان جمله: نقطه، علامت سوال فارسی/لاتین، علامت تعجب، سه‌نقطه یا خط جدید؛
+# نقطه باید با فاصله یا پایان متن دنبال شود تا اعداد اعشاری (۲.۵) شکسته نشوند
+SENTENCE_END = re.compile(r'(?:[.!?؟…]+(?=\s|$)|\n+)')
+
+# حداقل طول یک بخش؛ جملات کوتاه‌تر ("بله.") به جمله بعدی چسبانده می‌شوند
+MIN_SENTENCE_CHARS = 20
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='tts-pipeline')
+
+
+class SentenceSplitter:
+    """تقسیم تدریجی متن جریانی به جملات کامل"""
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ''
+
+    def feed(self, chunk: str) -> List[str]:
+        """افزودن بخش جدید متن و بازگرداندن جملاتی که کامل شده‌اند"""
+        self._buffer += chunk
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            # مرز در انتهای بافر ممکن است هنوز کامل نباشد ("۲." قبل از رسیدن "۵")
+            if match.end() == len(self._buffer) and not match.group().startswith('\n'):
+                break
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest = self._buffer.strip()
+        self._buffer = ''
+        return [rest] if rest else []
+
+
+def split_sentences(text: str, min_chars: int = MIN_SENTENCE_CHARS) -> List[str]:
+    """تقسیم یک متن کامل به جملات"""
+    splitter = SentenceSplitter(min_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+# مرزهای درون جمله (ویرگول فارسی/لاتین، نقطه‌ویرگول، دونقطه) برای شکستن جملات طولانی
+CLAUSE_END = re.compile(r'[،,؛;:](?=\s)')
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """شکستن جمله بلندتر از max_chars در مرز عبارت‌ها و در صورت نیاز در فاصله‌ها"""
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces, start = [], 0
+    for match in CLAUSE_END.finditer(sentence):
+        if match.end() - start >= max_chars // 2:
+            pieces.append(sentence[start:match.end()].strip())
+            start = match.end()
+    pieces.append(sentence[start:].strip())
+    result = []
+    for piece in pieces:
+        while len(piece) > max_chars:
+            cut = piece.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            result.append(piece[:cut].strip())
+            piece = piece[cut:].strip()
+        if piece:
+            result.append(piece)
+    return result
+
+
+def split_text_for_tts(text: str, max_chars: int = 400) -> List[str]:
+    """
+    تقسیم متن بلند به بخش‌های حداکثر max_chars در مرز جملات و عبارت‌ها.
+    بخش اول یک جمله تنهاست تا اولین بایت صوتی زودتر برسد؛ جملات بعدی تا سقف طول ادغام می‌شوند.
+    """
+    pieces = []
+    for sentence in split_sentences(text):
+        pieces.extend(_split_long(sentence, max_chars))
+    chunks = []
+    for piece in pieces:
+        if len(chunks) > 1 and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f'{chunks[-1]} {piece}'
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+class SentencePipeline:
+    """
+    هر جمله به محض کامل شدن برای تبدیل به صدا ارسال می‌شود و بخش‌های صوتی به ترتیب
+    و به محض آماده شدن تحویل داده می‌شوند؛ پخش پس از جمله اول شروع می‌شود.
+    """
+
+    def __init__(self, synthesize: Callable[[str], Optional[bytes]], executor: ThreadPoolExecutor = None):
+        self.synthesize = synthesize
+        self.executor = executor or _executor
+
+    def run(self, text_stream: Iterable[str]) -> Iterator[Tuple]:
+        """
+        رویدادها:
+            ('text', delta)                      بخش جدید متن پاسخ
+            ('audio', index, sentence, bytes)    بخش صوتی جمله index (bytes ممکن است None باشد)
+        """
+        splitter = SentenceSplitter()
+        pending = []  # [(sentence, future)]
+        next_index = 0
+
+        def submit(sentences):
+            for sentence in sentences:
+                pending.append((sentence, self.executor.submit(self.synthesize, sentence)))
+
+        def ready(block: bool):
+            nonlocal next_index
+            while next_index < len(pending):
+                sentence, future = pending[next_index]
+                if not block and not future.done():
+                    return
+                try:
+                    audio = future.result()
+                except Exception as e:
+                    logger.error(f"Sentence TTS error: {e}")
+                    audio = None
+                yield ('audio', next_index, sentence, audio)
+                next_index += 1
+
+        try:
+            for delta in text_stream:
+                if not delta:
+                    continue
+                yield ('text', delta)
+                submit(splitter.feed(delta))
+                yield from ready(block=False)
+            submit(splitter.flush())
+            yield from ready(block=True)
+        finally:
+            # قطع اتصال کلاینت: جملاتی که هنوز شروع نشده‌اند لغو می‌شوند
+            for _, future in pending[next_index:]:
+                future.cancel()
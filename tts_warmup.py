@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+پیش‌تولید صدای عبارات ثابت (تأیید پیام صوتی، معرفی پزشکان) در کش TTS
+Background pre-synthesis of canned phrases and per-doctor greetings into the TTS cache
+"""
+
+import threading
+import logging
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# پاسخ فوری به پیام صوتی کاربر
+VOICE_ACK_PHRASE = 'پیام صوتی شما دریافت شد. در حال پردازش...'
+
+
+def doctor_greeting(info: Dict[str, Any]) -> str:
+    """متن معرفی یک پزشک در ابتدای گفتگو"""
+    greeting = f"سلام، من {info.get('name', 'پزشک')} هستم"
+    if info.get('specialty'):
+        greeting += f"، {info['specialty']}"
+    if info.get('city'):
+        greeting += f" در {info['city']}"
+    return greeting + '. چطور می‌توانم به شما کمک کنم؟'
+
+
+def canned_phrases(settings: Dict[str, Any], doctors: Dict[str, Dict[str, Any]]) -> List[str]:
+    """عبارات ثابتی که صدایشان پخش می‌شود و باید پیش از اولین تعامل در کش باشند"""
+    phrases = [VOICE_ACK_PHRASE]
+    phrases.extend(doctor_greeting(info) for info in doctors.values())
+    return list(dict.fromkeys(phrase.strip() for phrase in phrases if phrase and phrase.strip()))
+
+
+class TTSWarmup:
+    """
+    اجرای پیش‌تولید در یک نخ پس‌زمینه. فراخوانی schedule در حین اجرا فقط آخرین تنظیمات را
+    برای اجرای بعدی نگه می‌دارد؛ عباراتی که قبلاً در کش هستند بدون فراخوانی ارائه‌دهنده رد می‌شوند.
+    """
+
+    def __init__(self, synthesize: Callable[[str], Tuple[Optional[bytes], Optional[str]]], cache=None):
+        self.synthesize = synthesize
+        self.cache = cache
+        self._keys: Dict[str, str] = {}
+        self._pending = None
+        self._running = False  # زیر _lock؛ نخ پیش از خروج آن را false می‌کند
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.failed: List[str] = []
+
+    def schedule(self, settings: Dict[str, Any], doctors: Dict[str, Dict[str, Any]]):
+        with self._lock:
+            self._pending = canned_phrases(settings, doctors)
+            if not self._running:
+                self._running = True
+                threading.Thread(target=self._run, name='tts-warmup', daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                phrases, self._pending = self._pending, None
+                if phrases is None:
+                    self._running = False
+                    return
+            failed = []
+            for phrase in phrases:
+                try:
+                    audio_data, key = self.synthesize(phrase)
+                except Exception as e:
+                    logger.error(f"TTS warm-up error: {e}")
+                    audio_data, key = None, None
+                if audio_data and key:
+                    with self._lock:
+                        self._keys[phrase] = key
+                else:
+                    failed.append(phrase)
+            with self._lock:
+                self.runs += 1
+                self.failed = failed
+            logger.info(f"TTS warm-up finished: {len(phrases) - len(failed)}/{len(phrases)} phrases cached")
+
+    def audio_key(self, text: str) -> Optional[str]:
+        """کلید کش صدای پیش‌تولیدشده یک عبارت (در صورت حذف از کش None)"""
+        with self._lock:
+            key = self._keys.get(text.strip())
+        if key is None or (self.cache is not None and self.cache.path(key) is None):
+            return None
+        return key
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'running': self._running,
+                'runs': self.runs,
+                'cached': len(self._keys),
+                'failed': list(self.failed),
+            }
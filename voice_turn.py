@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+نوبت صوتی کامل: STT ← بازیابی ← LLM ← TTS با زمان هر مرحله، به صورت JSON یا جریان SSE
+Voice turn pipeline (STT → retrieval → LLM → TTS) with per-stage timings, as JSON or SSE
+"""
+
+import json
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Generator, Optional
+
+from flask import Response, jsonify, stream_with_context
+
+from stage_timing import current_timings, rounded_timings, stage
+from stt_backends import STTQueueFull
+
+VOICE_UNRECOGNIZED_TEXT = 'متأسفانه صدای شما قابل تشخیص نبود. لطفاً دوباره تلاش کنید.'
+STT_BUSY_TEXT = 'سرویس تبدیل گفتار مشغول است، لطفاً چند لحظه بعد دوباره تلاش کنید.'
+
+
+def sse_event(event: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def stt_busy_response() -> Response:
+    response = jsonify({'error': STT_BUSY_TEXT})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+class VoiceTurn:
+    """
+    مراحل نوبت صوتی؛ هر مرحله تابعی از برنامه است:
+        transcribe(audio) -> متن یا None (STTQueueFull اگر صف پر باشد)
+        answer(transcript, sid) -> پاسخ کامل
+        prompt(transcript, sid) -> prompt برای پاسخ جریانی، یا None برای پاسخ کامل با answer
+        stream(prompt, timings, start) -> رویدادهای SSE پاسخ جریانی؛ مقدار بازگشتی متن پاسخ است
+        reply_audio_url(text) -> نشانی صدای پاسخ یا None
+        save(sid, message) / append_turn(sid, *messages) -> ذخیره در تاریخچه گفتگو
+        ack_audio_url() -> نشانی صدای پیش‌ساخته تأیید دریافت پیام
+    """
+
+    def __init__(self, transcribe: Callable, answer: Callable, prompt: Callable, stream: Callable,
+                 reply_audio_url: Callable, save: Callable, append_turn: Callable,
+                 ack_text: str, ack_audio_url: Callable):
+        self.transcribe = transcribe
+        self.answer = answer
+        self.prompt = prompt
+        self.stream = stream
+        self.reply_audio_url = reply_audio_url
+        self.save = save
+        self.append_turn = append_turn
+        self.ack_text = ack_text
+        self.ack_audio_url = ack_audio_url
+
+    @staticmethod
+    def user_message(transcript: Optional[str], audio_url: str) -> Dict[str, Any]:
+        return {
+            'type': 'voice',
+            'speaker': 'user',
+            'audio_url': audio_url,
+            'text': transcript or '',
+            'timestamp': datetime.now().strftime('%H:%M')
+        }
+
+    @staticmethod
+    def bot_message(text: str) -> Dict[str, Any]:
+        return {
+            'type': 'text',
+            'speaker': 'bot',
+            'text': text,
+            'timestamp': datetime.now().strftime('%H:%M')
+        }
+
+    def respond(self, audio: bytes, upload_url: Callable[[], str], sid: str, start: float) -> Response:
+        """پاسخ JSON کامل: پیام کاربر، پاسخ، نشانی صدای پاسخ و زمان مراحل (و هدر Server-Timing)"""
+        try:
+            with stage('stt'):
+                transcript = self.transcribe(audio)
+        except STTQueueFull:
+            return stt_busy_response()
+        user_msg = self.user_message(transcript, upload_url())
+        bot_msg = self.bot_message(self.answer(transcript, sid) if transcript else VOICE_UNRECOGNIZED_TEXT)
+        audio_url = self.reply_audio_url(bot_msg['text'])
+        if audio_url:
+            bot_msg['audio_url'] = audio_url
+        self.append_turn(sid, user_msg, bot_msg)
+        timings = current_timings()
+        timings['total'] = (time.perf_counter() - start) * 1000
+        return jsonify({**bot_msg, 'user': user_msg, 'timings': rounded_timings(timings)})
+
+    def events(self, audio: bytes, upload_url: Callable[[], str], sid: str, start: float) -> Generator[str, None, None]:
+        """
+        رویدادهای SSE: accepted ← transcript ← text/audio ← done (با زمان مراحل).
+        متن و صدای هر جمله به محض آماده شدن می‌رسند و با بسته شدن generator (قطع اتصال) پردازش باقی‌مانده لغو می‌شود.
+        """
+        timings = current_timings()
+        yield sse_event('accepted', {'text': self.ack_text, 'audio_url': self.ack_audio_url()})
+        try:
+            with stage('stt'):
+                transcript = self.transcribe(audio)
+        except STTQueueFull:
+            yield sse_event('error', {'error': STT_BUSY_TEXT})
+            return
+        user_msg = self.user_message(transcript, upload_url())
+        # prompt تاریخچه پیش از این نوبت را می‌بیند؛ متن کاربر بلافاصله پس از آن ذخیره می‌شود
+        prompt = self.prompt(transcript, sid) if transcript else None
+        self.save(sid, user_msg)
+        # قطع اتصال کلاینت generator را همین‌جا، پیش از اجرای LLM یا TTS، متوقف می‌کند
+        yield sse_event('transcript', user_msg)
+        if prompt:
+            answer = yield from self.stream(prompt, timings, start)
+        else:
+            answer = self.answer(transcript, sid) if transcript else VOICE_UNRECOGNIZED_TEXT
+            yield sse_event('text', {'delta': answer})
+        timings['total'] = (time.perf_counter() - start) * 1000
+        bot_msg = self.bot_message(answer)
+        yield sse_event('done', {**bot_msg, 'timings': rounded_timings(timings)})
+        self.append_turn(sid, bot_msg)
+
+    def stream_response(self, audio: bytes, upload_url: Callable[[], str], sid: str, start: float) -> Response:
+        return Response(stream_with_context(self.events(audio, upload_url, sid, start)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})